@@ -6,15 +6,76 @@ load_dotenv()
 class Settings:
     # Telegram Bot settings
     BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
+    # Адрес Bot API: свой сервер telegram-bot-api или локальная замена для тестов
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
     WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
     WEBHOOK_PATH: str = f"/webhook/{BOT_TOKEN}"
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "32"))
+    WEBHOOK_DRAIN_TIMEOUT: float = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+    WEBHOOK_DEDUP_WINDOW: int = int(os.getenv("WEBHOOK_DEDUP_WINDOW", "10000"))
+    WEBHOOK_DEDUP_PERSIST: bool = os.getenv("WEBHOOK_DEDUP_PERSIST", "True").lower() == "true"
+    WEBHOOK_DEDUP_PERSIST_INTERVAL: float = float(os.getenv("WEBHOOK_DEDUP_PERSIST_INTERVAL", "30"))
+    
+    # Update dispatch: порядок внутри чата, параллельно между чатами
+    MAX_CONCURRENT_CHATS: int = int(os.getenv("MAX_CONCURRENT_CHATS", "8"))
+    MAX_PENDING_UPDATES: int = int(os.getenv("MAX_PENDING_UPDATES", "256"))
+    
+    # Исходящие сообщения: лимиты Telegram (в личке ~1/с, в группе ~20/мин, всего ~30/с)
+    OUTBOUND_GLOBAL_RATE: float = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))
+    OUTBOUND_CHAT_RATE: float = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+    OUTBOUND_GROUP_RATE: float = float(os.getenv("OUTBOUND_GROUP_RATE", "20"))  # сообщений в минуту
+    OUTBOUND_CHAT_BURST: int = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+    OUTBOUND_MAX_RETRIES: int = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+    
+    # Трассировка: доля записываемых обновлений, буфер последних трасс, файл JSONL
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    TRACE_BUFFER_SIZE: int = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "")
+    # Токен для /admin/traces (заголовок X-Admin-Token); пустой - эндпоинт выключен
+    TRACE_ADMIN_TOKEN: str = os.getenv("TRACE_ADMIN_TOKEN", "")
     
     # Database settings
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./padel_bot.db")
     
+    # SQLite tuning
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))  # < 0 - размер в KiB
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_READ_POOL_SIZE: int = int(os.getenv("SQLITE_READ_POOL_SIZE", "4"))
+    
+    # Caches
+    ADMIN_CACHE_TTL: float = float(os.getenv("ADMIN_CACHE_TTL", "300"))
+    ADMIN_CACHE_SIZE: int = int(os.getenv("ADMIN_CACHE_SIZE", "10000"))
+    USER_LOOKUP_CACHE_SIZE: int = int(os.getenv("USER_LOOKUP_CACHE_SIZE", "10000"))
+    USER_LOOKUP_POSITIVE_TTL: float = float(os.getenv("USER_LOOKUP_POSITIVE_TTL", "3600"))
+    USER_LOOKUP_NEGATIVE_TTL: float = float(os.getenv("USER_LOOKUP_NEGATIVE_TTL", "60"))
+    CHAT_ADMINS_CACHE_TTL: float = float(os.getenv("CHAT_ADMINS_CACHE_TTL", "300"))
+    PROFILE_CACHE_SIZE: int = int(os.getenv("PROFILE_CACHE_SIZE", "50000"))
+    PROFILE_CACHE_TTL: float = float(os.getenv("PROFILE_CACHE_TTL", "3600"))
+    CHAT_MEMBER_CACHE_SIZE: int = int(os.getenv("CHAT_MEMBER_CACHE_SIZE", "100000"))
+    
+    # Отложенная запись изменений профилей (username/first_name) и состава чатов
+    PROFILE_FLUSH_INTERVAL: float = float(os.getenv("PROFILE_FLUSH_INTERVAL", "2"))
+    PROFILE_FLUSH_BATCH_SIZE: int = int(os.getenv("PROFILE_FLUSH_BATCH_SIZE", "200"))
+    
+    # Подбор пар /teams: ограничение времени поиска для больших составов, секунды
+    TEAMS_TIME_BUDGET: float = float(os.getenv("TEAMS_TIME_BUDGET", "0.5"))
+    
+    # Импорт рейтингов /importratings: максимальный размер файла, байты
+    IMPORT_MAX_FILE_SIZE: int = int(os.getenv("IMPORT_MAX_FILE_SIZE", str(5 * 1024 * 1024)))
+    
+    # Экспорт рейтингов /exportratings: максимальный размер файла, байты
+    # (по умолчанию - лимит Telegram на отправку файлов ботом)
+    EXPORT_MAX_FILE_SIZE: int = int(os.getenv("EXPORT_MAX_FILE_SIZE", str(50 * 1024 * 1024)))
+    
     # App settings
     APP_HOST: str = os.getenv("APP_HOST", "0.0.0.0")
     APP_PORT: int = int(os.getenv("APP_PORT", "8000"))
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+    # Отладочная строка "🔍 Отладка: ..." в ответах /getrating и /setrating
+    REPLY_DEBUG_INFO: bool = os.getenv("REPLY_DEBUG_INFO", "False").lower() == "true"
 
 settings = Settings()
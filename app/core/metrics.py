@@ -0,0 +1,251 @@
+"""
+Метрики в формате Prometheus (/metrics)
+
+Небольшой реестр без внешних зависимостей: счётчики, гистограммы и
+gauge-функции, которые вычисляются при чтении /metrics. Запись метрики -
+пара perf_counter, bisect и инкремент, поэтому инструментирование можно
+держать включённым постоянно.
+
+    bot_handler_duration_seconds{handler}      - время обработчиков команд
+    bot_handler_errors_total{handler}          - исключения в обработчиках
+    bot_db_query_duration_seconds{helper}      - время функций storage
+    bot_telegram_request_duration_seconds{method}
+    bot_telegram_requests_total{method,status} - вызовы Bot API
+    + gauge очередей и кэшей, зарегистрированные в app/main.py
+
+Вызовы storage и Bot API заодно пишутся span'ами в текущую трассу
+(app.core.tracing), если обновление выбрано для трассировки.
+"""
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Sequence, Tuple
+
+from telegram.request import HTTPXRequest
+
+from app.core import tracing
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды: от 1 мс до 10 с
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+    """Гистограмма с метками; labels() возвращает объект для observe()"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple, _HistogramChild] = {}
+
+    def labels(self, *labels) -> _HistogramChild:
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children[labels] = _HistogramChild(self.buckets)
+        return child
+
+    def observe(self, value: float, *labels):
+        self.labels(*labels).observe(value)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ("le",)
+        for labels, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {child.sum}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {child.count}"
+
+
+class GaugeFunction:
+    """Метрика, значения которой вычисляются при чтении: fn() -> {метки: значение}.
+
+    kind="counter" - для счётчиков, которые уже ведут сами объекты (кэши, очереди).
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], fn: Callable[[], dict], kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self._fn = fn
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        try:
+            values = self._fn()
+        except Exception as e:
+            logger.error(f"Metric {self.name} failed: {e}")
+            return
+        for labels, value in values.items():
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {float(value)}"
+
+
+class Registry:
+    """Набор метрик, отдаваемый /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_function(self, name, documentation, labelnames, fn) -> GaugeFunction:
+        """Зарегистрировать (или заменить) gauge с вычислением при чтении"""
+        return self.register(GaugeFunction(name, documentation, labelnames, fn))
+
+    def counter_function(self, name, documentation, labelnames, fn) -> GaugeFunction:
+        """Зарегистрировать (или заменить) счётчик с вычислением при чтении"""
+        return self.register(GaugeFunction(name, documentation, labelnames, fn, kind="counter"))
+
+    def render(self) -> str:
+        """Текст в формате Prometheus exposition 0.0.4"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_duration = registry.histogram(
+    "bot_handler_duration_seconds", "Handler latency by command", ("handler",)
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Unhandled exceptions by handler", ("handler",)
+)
+db_duration = registry.histogram(
+    "bot_db_query_duration_seconds", "Storage helper latency", ("helper",)
+)
+telegram_duration = registry.histogram(
+    "bot_telegram_request_duration_seconds", "Bot API call latency by method", ("method",)
+)
+telegram_requests = registry.counter(
+    "bot_telegram_requests_total", "Bot API calls by method and HTTP status", ("method", "status")
+)
+
+
+def instrument_handler(callback, name: str = None):
+    """Обернуть обработчик PTB: время выполнения и исключения"""
+    name = name or getattr(callback, "__name__", "handler")
+    child = handler_duration.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            child.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def timed_db(func):
+    """Декоратор асинхронных функций storage: время каждого вызова и span в трассе"""
+    child = db_duration.labels(func.__name__)
+    span_name = f"db.{func.__name__}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with tracing.span(span_name):
+                return await func(*args, **kwargs)
+        finally:
+            child.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def telegram_method(url: str) -> str:
+    """Имя метода Bot API из URL запроса (без токена)"""
+    if "/file/bot" in url:
+        return "getFileContent"
+    return url.rsplit("/", 1)[-1] or "unknown"
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который считает вызовы Bot API и их время по методам"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = telegram_method(url)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with tracing.span(f"telegram.{api_method}") as current:
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+                if current is not None:
+                    current.set(status=code)
+            status = str(code)
+            return code, payload
+        finally:
+            telegram_duration.observe(time.perf_counter() - started, api_method)
+            telegram_requests.inc(api_method, status)
@@ -0,0 +1,28 @@
+"""
+Шкала рейтинга Playtomic
+
+Границы и разбор рейтинга вынесены в отдельный модуль без зависимостей, чтобы
+тексты ответов, команды бота и импорт/экспорт (rating_io) не импортировали
+NumPy вместе с rating_engine и не зависели друг от друга.
+"""
+
+MIN_RATING = 0.5
+MAX_RATING = 6.0
+
+
+def parse_rating(rating_str: str) -> float:
+    """Парсинг рейтинга с поддержкой точки и запятой как десятичного разделителя"""
+    try:
+        # Заменяем запятую на точку для стандартного парсинга
+        normalized_str = rating_str.replace(',', '.')
+        rating = float(normalized_str)
+        
+        # Ограничиваем точность до 2 знаков после запятой
+        return round(rating, 2)
+    except ValueError:
+        return None
+
+
+def is_valid_playtomic_rating(rating: float) -> bool:
+    """Проверка, является ли рейтинг валидным по шкале Playtomic (0.5-6.0)"""
+    return MIN_RATING <= rating <= MAX_RATING
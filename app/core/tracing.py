@@ -0,0 +1,276 @@
+"""
+Трассировка горячего пути: webhook → обработчик → БД → Telegram
+
+Трасса - дерево span'ов одного обновления. Текущий span хранится в
+contextvars, поэтому вложенные вызовы (хелперы storage, запросы к Bot API,
+задачи, созданные из обработчика) находят родителя без передачи аргументов.
+Решение о записи принимается один раз в корне трассы (TRACE_SAMPLE_RATE);
+если трасса не выбрана, span() и traced() сводятся к чтению contextvar.
+
+Завершённые трассы попадают в кольцевой буфер (TRACE_BUFFER_SIZE последних)
+и, если задан TRACE_FILE, дописываются в него строкой JSON. Запись в файл
+идёт в фоновом потоке пачками: event loop только кладёт трассу в очередь,
+при переполнении очереди трасса в файл не попадает (счётчик dropped).
+Коллектор не нужен: самые медленные трассы из буфера отдаёт /admin/traces.
+"""
+import contextvars
+import functools
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+# Сигнал фоновому потоку записи: дописать очередь и завершиться
+_STOP = object()
+
+
+class Span:
+    """Участок трассы: имя, время начала и длительность, атрибуты, вложенные span'ы"""
+    __slots__ = ("trace", "name", "start", "duration", "attrs", "error", "children")
+
+    def __init__(self, trace: "Trace", name: str, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attrs = attrs
+        self.error = None
+        self.children: List["Span"] = []
+
+    def set(self, **attrs):
+        """Добавить атрибуты к span'у"""
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        data = {
+            "name": self.name,
+            "offset_ms": round((self.start - self.trace.root.start) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+
+class Trace:
+    """Трасса одного обновления"""
+    __slots__ = ("trace_id", "root", "started_at", "closed")
+
+    def __init__(self, name: str, attrs: dict):
+        self.trace_id = f"{random.getrandbits(64):016x}"
+        self.started_at = time.time()
+        self.closed = False
+        self.root = Span(self, name, attrs)
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration or 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "root": self.root.to_dict(),
+        }
+
+
+class Tracer:
+    """Сэмплирование трасс и локальный экспорт (кольцевой буфер и JSON-файл)"""
+
+    def __init__(self, sample_rate: float = 0.0, buffer_size: int = 200, path: str = "",
+                 queue_size: int = 10000):
+        self.sample_rate = sample_rate
+        self.path = path
+        self._traces = deque(maxlen=buffer_size)
+        # Трассы для записи в файл и поток, который их пишет
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        # Метрики
+        self.started = 0
+        self.sampled = 0
+        self.write_errors = 0
+        self.dropped = 0
+
+    def _sample(self) -> bool:
+        self.started += 1
+        if self.sample_rate <= 0:
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Начать трассу (или вложенный span, если трасса уже идёт)"""
+        if _current_span.get() is not None:
+            with span(name, **attrs) as current:
+                yield current
+            return
+        if not self._sample():
+            yield None
+            return
+
+        self.sampled += 1
+        trace = Trace(name, attrs)
+        token = _current_span.set(trace.root)
+        try:
+            yield trace.root
+        except BaseException as e:
+            trace.root.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            trace.root.duration = time.perf_counter() - trace.root.start
+            trace.closed = True
+            self._export(trace)
+
+    def _export(self, trace: Trace):
+        self._traces.append(trace)
+        if not self.path:
+            return
+        self._start_writer()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        """Фоновый поток: забирает из очереди всё накопленное и дописывает одной записью"""
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            traces = [trace for trace in batch if trace is not _STOP]
+            if traces:
+                self._write(traces)
+            for _ in batch:
+                self._queue.task_done()
+            if len(traces) < len(batch):
+                return
+
+    def _write(self, traces: List[Trace]):
+        try:
+            lines = "".join(
+                json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + "\n" for trace in traces
+            )
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            self.write_errors += 1
+            logger.error(f"Error writing {len(traces)} traces to {self.path}: {e}")
+
+    def flush(self):
+        """Дождаться записи в файл всех завершённых трасс (блокирует поток)"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self, timeout: Optional[float] = None):
+        """Дописать очередь в файл и остановить поток записи (блокирует поток)"""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        self._queue.put(_STOP)
+        writer.join(timeout)
+        if writer.is_alive():
+            logger.warning(f"Trace writer did not finish in {timeout}s")
+
+    def slowest(self, limit: int = 10) -> List[dict]:
+        """Самые долгие трассы из буфера, по убыванию длительности"""
+        traces = sorted(self._traces, key=lambda trace: trace.duration, reverse=True)
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def clear(self):
+        self._traces.clear()
+
+    def stats(self) -> dict:
+        """Метрики трассировки"""
+        return {
+            "sample_rate": self.sample_rate,
+            "started": self.started,
+            "sampled": self.sampled,
+            "buffered": len(self._traces),
+            "file": self.path or None,
+            "write_errors": self.write_errors,
+            "write_queue": self._queue.qsize(),
+            "dropped": self.dropped,
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Вложенный span в текущей трассе; без трассы ничего не записывает"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    trace = parent.trace
+    current = Span(trace, name, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.duration = time.perf_counter() - current.start
+        # Фоновые задачи могут закончиться позже трассы - такие span'ы не пишем
+        if not trace.closed:
+            parent.children.append(current)
+
+
+def traced(name: Optional[str] = None):
+    """Декоратор асинхронной функции: span на каждый вызов внутри трассы"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return await func(*args, **kwargs)
+            with span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_trace_id() -> Optional[str]:
+    """trace_id текущей трассы (для логов), None - трасса не записывается"""
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+tracer = Tracer(
+    sample_rate=settings.TRACE_SAMPLE_RATE,
+    buffer_size=settings.TRACE_BUFFER_SIZE,
+    path=settings.TRACE_FILE,
+)
@@ -1,11 +1,25 @@
+import asyncio
 import logging
-from fastapi import FastAPI, Request, HTTPException
+import secrets
+from typing import Optional
+
+from fastapi import FastAPI, Header, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from telegram import Update
-from telegram.ext import Application, CommandHandler
+from telegram.ext import Application
 
 from app.core.config import settings
-from app.models.database import init_db
-from app.services.rating_bot import RatingBot
+from app.core.metrics import registry, InstrumentedRequest
+from app.core.tracing import tracer
+from app.models.database import init_db, close_db
+from app.models.sqlite_pool import close_pool
+from app.services import storage
+from app.services.dedup import UpdateDeduplicator
+from app.services.leaderboard import leaderboard
+from app.services.outbound import outbound
+from app.services.rating_bot import register_handlers, admin_cache, user_lookup_cache, chat_admins_cache
+from app.services.update_processor import ChatOrderedUpdateProcessor
+from app.services.update_queue import UpdateQueue
 
 # Настройка логирования
 logging.basicConfig(
@@ -18,23 +32,85 @@ logger = logging.getLogger(__name__)
 app = FastAPI(title="Rating Telegram Bot", version="1.0.0")
 
 # Создание Telegram Application
-telegram_app = Application.builder().token(settings.BOT_TOKEN).build()
+# Обновления одного чата идут по порядку, разные чаты - параллельно
+update_processor = ChatOrderedUpdateProcessor(
+    max_concurrent_chats=settings.MAX_CONCURRENT_CHATS,
+    max_pending_updates=settings.MAX_PENDING_UPDATES,
+)
+telegram_app = (
+    Application.builder()
+    .token(settings.BOT_TOKEN)
+    .base_url(f"{settings.TELEGRAM_API_URL}/bot")
+    .base_file_url(f"{settings.TELEGRAM_API_URL}/file/bot")
+    .concurrent_updates(update_processor)
+    # Тот же пул, что у PTB по умолчанию, плюс счётчики вызовов Bot API
+    .request(InstrumentedRequest(connection_pool_size=256))
+    .build()
+)
 
 # Добавление обработчиков
-telegram_app.add_handler(CommandHandler("start", RatingBot.start_command))
-telegram_app.add_handler(CommandHandler("help", RatingBot.help_command))
-telegram_app.add_handler(CommandHandler("getrating", RatingBot.get_rating_command))
-telegram_app.add_handler(CommandHandler("getuserrating", RatingBot.get_user_rating_command))
-telegram_app.add_handler(CommandHandler("setrating", RatingBot.set_rating_command))
-telegram_app.add_handler(CommandHandler("setptid", RatingBot.set_pt_userid_command))
-telegram_app.add_handler(CommandHandler("getptid", RatingBot.get_pt_userid_command))
-telegram_app.add_handler(CommandHandler("profile", RatingBot.get_profile_command))
-telegram_app.add_handler(CommandHandler("createuser", RatingBot.create_user_command))
-telegram_app.add_handler(CommandHandler("getuserid", RatingBot.get_user_id_command))
-telegram_app.add_handler(CommandHandler("debugchat", RatingBot.debug_chat_command))
-telegram_app.add_handler(CommandHandler("test", RatingBot.test_command))
-telegram_app.add_handler(CommandHandler("finduser", RatingBot.find_user_command))
-telegram_app.add_handler(CommandHandler("checkdb", RatingBot.check_db_command))
+register_handlers(telegram_app)
+
+async def dispatch_update(update: Update):
+    """Передать обновление диспетчеру (порядок внутри чата сохраняется).
+
+    Воркер очереди не ждёт, пока подойдёт очередь чата: поток обновлений
+    из одного чата не занимает всех воркеров.
+    """
+    await update_processor.submit(update, telegram_app.process_update(update))
+
+# Очередь обновлений webhook: ответ Telegram не ждёт обработчиков
+update_queue = UpdateQueue(
+    dispatch_update,
+    maxsize=settings.WEBHOOK_QUEUE_SIZE,
+    workers=settings.WEBHOOK_WORKERS,
+)
+
+# Повторные доставки одного update_id отбрасываются до разбора и обработки
+update_dedup = UpdateDeduplicator(window=settings.WEBHOOK_DEDUP_WINDOW)
+
+# Очереди и кэши читаются при каждом запросе /metrics, без счётчиков на горячем пути
+caches = {
+    "admin": admin_cache,
+    "user_lookup": user_lookup_cache,
+    "chat_admins": chat_admins_cache,
+    "profiles": storage.known_profiles,
+    "chat_members": storage.known_chat_members,
+}
+registry.gauge_function(
+    "bot_queue_depth", "Items waiting in internal queues", ("queue",),
+    lambda: {
+        "webhook": update_queue.stats()["depth"],
+        "dispatcher": update_processor.stats()["pending_updates"],
+        "outbound": outbound.stats()["pending"],
+        "profile_writes": storage.profile_writes.stats()["pending"],
+        "chat_member_writes": storage.chat_member_writes.stats()["pending"],
+    },
+)
+registry.gauge_function(
+    "bot_webhook_busy_workers", "Webhook queue workers processing an update", (),
+    lambda: {(): update_queue.stats()["busy_workers"]},
+)
+registry.counter_function(
+    "bot_webhook_rejected_total", "Updates rejected because the queue was full", (),
+    lambda: {(): update_queue.rejected},
+)
+registry.counter_function(
+    "bot_cache_requests_total", "Cache lookups by result", ("cache", "result"),
+    lambda: {
+        key: value
+        for name, cache in caches.items()
+        for key, value in (((name, "hit"), cache.hits), ((name, "miss"), cache.misses))
+    },
+)
+registry.gauge_function(
+    "bot_cache_hit_ratio", "Cache hit ratio since start", ("cache",),
+    lambda: {name: cache.stats()["hit_ratio"] for name, cache in caches.items()},
+)
+registry.gauge_function(
+    "bot_cache_size", "Entries in cache", ("cache",),
+    lambda: {name: len(cache) for name, cache in caches.items()},
+)
 
 @app.on_event("startup")
 async def startup_event():
@@ -42,27 +118,51 @@ async def startup_event():
     logger.info("Starting Rating Bot...")
     await init_db()
     logger.info("Database initialized")
+    if settings.WEBHOOK_DEDUP_PERSIST:
+        await update_dedup.load()
+        update_dedup.start(settings.WEBHOOK_DEDUP_PERSIST_INTERVAL)
     
     # Инициализируем Telegram Application
     await telegram_app.initialize()
+    await telegram_app.start()
     logger.info("Telegram Application initialized")
     
+    outbound.start()
+    await update_queue.start()
+    
     # Устанавливаем webhook если указан URL
     if settings.WEBHOOK_URL:
         webhook_url = f"{settings.WEBHOOK_URL}{settings.WEBHOOK_PATH}"
-        await telegram_app.bot.set_webhook(webhook_url)
+        # chat_member не приходит без явного allowed_updates
+        await telegram_app.bot.set_webhook(webhook_url, allowed_updates=Update.ALL_TYPES)
         logger.info(f"Webhook set to {webhook_url}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка при остановке"""
     logger.info("Shutting down Rating Bot...")
+    # Дорабатываем уже принятые обновления до остановки приложения
+    await update_queue.stop(drain=True, timeout=settings.WEBHOOK_DRAIN_TIMEOUT)
+    await update_processor.join(timeout=settings.WEBHOOK_DRAIN_TIMEOUT)
+    # Доотправляем ответы, пока бот ещё не остановлен
+    await outbound.close(timeout=settings.WEBHOOK_DRAIN_TIMEOUT)
+    if settings.WEBHOOK_DEDUP_PERSIST:
+        await update_dedup.close()
     try:
         await telegram_app.bot.delete_webhook()
+        if telegram_app.running:
+            await telegram_app.stop()
         await telegram_app.shutdown()
         logger.info("Telegram Application shutdown completed")
     except Exception as e:
         logger.error(f"Error during shutdown: {e}")
+    
+    await storage.flush_writes()
+    await close_db()
+    close_pool()
+    logger.info("Database connections closed")
+    # Дописываем накопленные трассы в TRACE_FILE
+    await asyncio.to_thread(tracer.close, settings.WEBHOOK_DRAIN_TIMEOUT)
 
 @app.get("/")
 async def root():
@@ -91,7 +191,21 @@ async def health_check():
             "status": "healthy",
             "bot_status": bot_status,
             "webhook": webhook_info,
-            "webhook_path": settings.WEBHOOK_PATH
+            "webhook_path": settings.WEBHOOK_PATH,
+            "update_queue": update_queue.stats(),
+            "update_processor": update_processor.stats(),
+            "update_dedup": update_dedup.stats(),
+            "outbound": outbound.stats(),
+            "tracing": tracer.stats(),
+            "caches": {
+                "admin": admin_cache.stats(),
+                "user_lookup": user_lookup_cache.stats(),
+                "chat_admins": chat_admins_cache.stats(),
+                "profiles": storage.known_profiles.stats()
+            },
+            "profile_writes": storage.profile_writes.stats(),
+            "chat_member_writes": storage.chat_member_writes.stats(),
+            "leaderboard": leaderboard.stats()
         }
     except Exception as e:
         return {
@@ -99,26 +213,52 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/metrics")
+async def metrics():
+    """Метрики в формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/traces")
+async def slowest_traces(limit: int = 10, x_admin_token: Optional[str] = Header(default=None)):
+    """Самые медленные из последних записанных трасс (нужен X-Admin-Token)"""
+    if not settings.TRACE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.TRACE_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"tracing": tracer.stats(), "traces": tracer.slowest(max(1, min(limit, 100)))}
+
 @app.post(settings.WEBHOOK_PATH)
 async def webhook(request: Request):
     """Webhook для получения обновлений от Telegram"""
     try:
         body = await request.json()
-        logger.info(f"Received webhook update: {body.get('update_id', 'unknown')}")
+        update_id = body.get('update_id')
+        logger.info(f"Received webhook update: {update_id if update_id is not None else 'unknown'}")
         
         # Проверяем, что Application инициализирован
-        if not telegram_app.running:
+        if not telegram_app.running or not update_queue.running:
             logger.error("Telegram Application is not running")
             raise HTTPException(status_code=503, detail="Bot is not ready")
+        
+        # Повторная доставка уже принятого обновления - подтверждаем без обработки
+        if isinstance(update_id, int) and update_dedup.seen(update_id):
+            logger.info(f"Duplicate update {update_id} dropped")
+            return {"status": "duplicate"}
             
         update = Update.de_json(body, telegram_app.bot)
-        await telegram_app.process_update(update)
-        return {"status": "ok"}
     except Exception as e:
         logger.error(f"Error processing webhook: {e}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    
+    # Обработка идёт в фоне, Telegram получает ответ сразу.
+    # Если очередь переполнена - 503, и Telegram повторит доставку позже.
+    if not update_queue.put_nowait(update):
+        logger.warning(f"Update queue is full, rejecting update {update.update_id}")
+        raise HTTPException(status_code=503, detail="Update queue is full")
+    update_dedup.add(update.update_id)
+    return {"status": "ok"}
 
 if __name__ == "__main__":
     import uvicorn
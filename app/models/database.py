@@ -1,10 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Index, event, func, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
 from app.core.config import settings
+from app.models.sqlite_pool import SQLiteConnectionPool, apply_pragmas
 
 Base = declarative_base()
 
@@ -20,10 +21,92 @@ class UserRating(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class ChatMembership(Base):
+    """Участник чата: заполняется по сообщениям и обновлениям chat_member"""
+    __tablename__ = "chat_members"
+    # Составной первичный ключ (chat_id, telegram_id) - он же индекс для выборок по чату
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    chat_id = Column(Integer, primary_key=True)
+    telegram_id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RatingHistory(Base):
+    """История изменений рейтинга (только добавление)"""
+    __tablename__ = "rating_history"
+    # Строки лежат в порядке первичного ключа (telegram_id, ts): история одного
+    # игрока читается одним диапазоном без обращения к другим структурам
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    telegram_id = Column(Integer, primary_key=True)
+    ts = Column(Integer, primary_key=True, comment="Unix time, секунды")
+    rating_centi = Column(Integer, nullable=False, comment="Рейтинг * 100")
+
+class Match(Base):
+    """Сыгранный матч 2 на 2 с рейтингами игроков до и после"""
+    __tablename__ = "matches"
+    
+    id = Column(Integer, primary_key=True)
+    ts = Column(Integer, nullable=False, index=True, comment="Unix time, секунды")
+    chat_id = Column(Integer, nullable=True)
+    recorded_by = Column(Integer, nullable=True)
+    team_a_1 = Column(Integer, nullable=False)
+    team_a_2 = Column(Integer, nullable=False)
+    team_b_1 = Column(Integer, nullable=False)
+    team_b_2 = Column(Integer, nullable=False)
+    score = Column(String(64), nullable=False, comment="Счёт по сетам, например '6-4 6-3'")
+    team_a_won = Column(Boolean, nullable=False)
+    game_diff = Column(Integer, nullable=False, comment="Геймы A минус геймы B")
+    # Рейтинги до матча нужны для полного пересчёта истории
+    before_a_1 = Column(Float, nullable=False)
+    before_a_2 = Column(Float, nullable=False)
+    before_b_1 = Column(Float, nullable=False)
+    before_b_2 = Column(Float, nullable=False)
+    after_a_1 = Column(Float, nullable=False)
+    after_a_2 = Column(Float, nullable=False)
+    after_b_1 = Column(Float, nullable=False)
+    after_b_2 = Column(Float, nullable=False)
+
+class BotState(Base):
+    """Служебные значения бота (ключ - значение)"""
+    __tablename__ = "bot_state"
+    
+    key = Column(String(255), primary_key=True)
+    value = Column(String(255), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Поиск по @username регистронезависимый (WHERE lower(telegram_username) = ?),
+# обычный индекс по telegram_username для него не подходит - нужен индекс по выражению
+Index("ix_user_ratings_telegram_username_lower", func.lower(UserRating.telegram_username))
+
+# Миграции для уже существующих баз (create_all не добавляет новые индексы к
+# уже созданным таблицам). Применённые учитываются в PRAGMA user_version, но
+# базы, созданные до этого учёта, проходят их ещё раз - миграции идемпотентны
+MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS ix_user_ratings_telegram_username_lower ON user_ratings (lower(telegram_username))",
+    # Начальная точка истории для рейтингов, выставленных до появления rating_history
+    "INSERT OR IGNORE INTO rating_history (telegram_id, ts, rating_centi) "
+    "SELECT telegram_id, CAST(strftime('%s', COALESCE(updated_at, created_at, 'now')) AS INTEGER), "
+    "CAST(round(rating * 100) AS INTEGER) FROM user_ratings "
+    "WHERE rating > 0 AND NOT EXISTS (SELECT 1 FROM rating_history h WHERE h.telegram_id = user_ratings.telegram_id)",
+]
+
 # Database setup
+# SQLAlchemy-движок нужен только для схемы (create_all, миграции) и get_db;
+# запросы обработчиков идут через pool - долгоживущие подключения sqlite3
+# (писатель + читатели, app.models.sqlite_pool), см. app.services.storage
 engine = create_async_engine(settings.DATABASE_URL, echo=settings.DEBUG)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+if engine.dialect.name == "sqlite":
+    event.listen(engine.sync_engine, "connect", lambda dbapi_conn, _: apply_pragmas(dbapi_conn))
+
+def sqlite_path(database_url: str) -> str:
+    """Путь к файлу базы из DATABASE_URL (sqlite+aiosqlite:///path)"""
+    return database_url.split(":///", 1)[-1]
+
+pool = SQLiteConnectionPool(sqlite_path(settings.DATABASE_URL))
+
 async def get_db():
     async with async_session() as session:
         try:
@@ -31,6 +114,26 @@ async def get_db():
         finally:
             await session.close()
 
+async def run_migrations(conn):
+    """Применить к открытому подключению ещё не применённые MIGRATIONS.
+
+    Число применённых миграций хранится в PRAGMA user_version, поэтому каждая
+    (в том числе заполнение rating_history) выполняется один раз. Новые
+    миграции добавляются только в конец списка.
+    """
+    sqlite = conn.dialect.name == "sqlite"
+    applied = (await conn.execute(text("PRAGMA user_version"))).scalar() if sqlite else 0
+    for statement in MIGRATIONS[applied:]:
+        await conn.execute(text(statement))
+    if sqlite and applied < len(MIGRATIONS):
+        await conn.execute(text(f"PRAGMA user_version = {len(MIGRATIONS)}"))
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
+
+async def close_db():
+    """Закрыть подключения к базе"""
+    await engine.dispose()
+    pool.close()
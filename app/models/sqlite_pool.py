@@ -0,0 +1,150 @@
+"""
+Долгоживущие подключения к SQLite
+
+Один писатель (запись сериализуется блокировкой) и пул читателей.
+В режиме WAL чтения идут параллельно с единственным писателем, а
+подключения не открываются заново на каждый запрос.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from app.core.config import settings
+
+
+def apply_pragmas(conn):
+    """Применить настройки SQLite к DB-API подключению (sqlite3 или aiosqlite)"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size = {int(settings.SQLITE_CACHE_SIZE)}")
+    finally:
+        cursor.close()
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Открыть новое подключение с row_factory и настроенными PRAGMA"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    apply_pragmas(conn)
+    return conn
+
+
+class SQLiteConnectionPool:
+    """Писатель + пул читателей для одного файла базы данных"""
+
+    def __init__(self, db_path: str, read_pool_size: int = None):
+        self.db_path = db_path
+        self.read_pool_size = max(1, read_pool_size or settings.SQLITE_READ_POOL_SIZE)
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._readers = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+        self._closed = False
+        # Занятость подключений (сколько раз выданы и сколько секунд были заняты)
+        self.writer_checkouts = 0
+        self.writer_busy = 0.0
+        self.reader_checkouts = 0
+        self.reader_busy = 0.0
+
+    @contextmanager
+    def writer(self):
+        """Подключение для записи: commit при успехе, rollback при ошибке"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = connect(self.db_path)
+            conn = self._writer
+            started = time.perf_counter()
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self.writer_checkouts += 1
+                self.writer_busy += time.perf_counter() - started
+
+    @contextmanager
+    def reader(self):
+        """Подключение для чтения из пула"""
+        conn = self._acquire_reader()
+        started = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            with self._readers_lock:
+                self.reader_checkouts += 1
+                self.reader_busy += time.perf_counter() - started
+            if self._closed:
+                conn.close()
+                with self._readers_lock:
+                    self._readers_created -= 1
+            else:
+                self._readers.put(conn)
+
+    def _acquire_reader(self):
+        # После close() пул можно использовать снова - подключения откроются заново
+        self._closed = False
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if self._readers_created < self.read_pool_size:
+                self._readers_created += 1
+                return connect(self.db_path)
+        # Пул исчерпан - ждём, пока кто-то вернёт подключение
+        return self._readers.get()
+
+    def close(self):
+        """Закрыть все подключения пула"""
+        self._closed = True
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._readers_lock:
+                self._readers_created -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> SQLiteConnectionPool:
+    """Пул процесса для db_path; пересоздаётся, если путь к базе изменился"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.db_path == db_path:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.db_path != db_path:
+            if _pool is not None:
+                _pool.close()
+            _pool = SQLiteConnectionPool(db_path)
+        return _pool
+
+
+def close_pool():
+    """Закрыть пул процесса (при остановке приложения)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,116 @@
+"""
+Отбрасывание повторных доставок webhook (одинаковый update_id)
+
+Если webhook не ответил вовремя или вернул ошибку, Telegram присылает то же
+обновление ещё раз. Окно последних update_id ограничено по размеру, поэтому
+память не растёт. Граница (наибольший принятый update_id) может сохраняться в
+базе - периодически и при остановке, - чтобы повторы, пришедшие сразу после
+перезапуска (в том числе после аварийного), тоже отбрасывались.
+"""
+import asyncio
+import logging
+from collections import deque
+
+from app.services import storage
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KEY = "webhook_last_update_id"
+
+
+class UpdateDeduplicator:
+    """Окно последних update_id фиксированного размера"""
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self._order = deque()
+        self._seen = set()
+        self.watermark = None  # граница, загруженная из базы
+        self.persisted = None  # последняя сохранённая в базу граница
+        self.max_update_id = None
+        self.duplicates = 0
+        self._persist_task = None
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """Было ли обновление уже принято"""
+        if update_id in self._seen:
+            return True
+        # После недели простоя Telegram начинает update_id заново со случайного
+        # значения, поэтому граница действует только в пределах окна под ней
+        if self.watermark is not None and self.watermark - self.window < update_id <= self.watermark:
+            return True
+        return False
+
+    def seen(self, update_id: int) -> bool:
+        """Проверить обновление перед обработкой; повтор учитывается в duplicates"""
+        if self.is_duplicate(update_id):
+            self.duplicates += 1
+            return True
+        return False
+
+    def add(self, update_id: int):
+        """Запомнить принятое обновление (самые старые вытесняются из окна)"""
+        if update_id in self._seen:
+            return
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.window:
+            self._seen.discard(self._order.popleft())
+        if self.max_update_id is None or update_id > self.max_update_id:
+            self.max_update_id = update_id
+
+    async def load(self):
+        """Загрузить сохранённую границу из базы"""
+        value = await storage.get_state(WATERMARK_KEY)
+        if value is not None:
+            self.watermark = self.persisted = int(value)
+            logger.info(f"Loaded update_id watermark: {self.watermark}")
+
+    async def persist(self):
+        """Сохранить наибольший принятый update_id в базу.
+
+        Граница в памяти (watermark) не меняется: обновления, пришедшие не по
+        порядку, ещё могут быть приняты до следующего перезапуска.
+        """
+        if self.max_update_id is None:
+            return
+        if self.persisted is not None and self.max_update_id <= self.persisted:
+            return
+        max_update_id = self.max_update_id
+        await storage.set_state(WATERMARK_KEY, str(max_update_id))
+        self.persisted = max_update_id
+
+    def start(self, interval: float):
+        """Сохранять границу в базу каждые interval секунд"""
+        if self._persist_task is None and interval > 0:
+            self._persist_task = asyncio.create_task(self._persist_loop(interval), name="dedup-persist")
+
+    async def _persist_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.persist()
+            except Exception as e:
+                logger.error(f"Error saving update_id watermark: {e}")
+
+    async def close(self):
+        """Остановить периодическое сохранение и сохранить границу"""
+        task, self._persist_task = self._persist_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        try:
+            await self.persist()
+        except Exception as e:
+            logger.error(f"Error saving update_id watermark: {e}")
+
+    def stats(self) -> dict:
+        """Размер окна и число отброшенных повторов"""
+        return {
+            "window": self.window,
+            "size": len(self._order),
+            "max_update_id": self.max_update_id,
+            "watermark": self.watermark,
+            "persisted": self.persisted,
+            "duplicates": self.duplicates,
+        }
@@ -0,0 +1,235 @@
+"""
+Рейтинг игроков чата (/leaderboard) в памяти процесса
+
+Рейтинги всех игроков загружаются из базы один раз (лениво, при первом
+запросе), состав чата - из chat_members при первом обращении к чату. Дальше
+индексы обновляются при каждом set_rating и изменении состава, и запросы места
+и страницы топа в базу не ходят. Вышедшие участники и опустевшие чаты из
+индексов удаляются, имена хранятся только для игроков с рейтингом.
+
+RankingIndex - отсортированный список (-rating, telegram_id), который
+поддерживается через bisect: поиск O(log n), вставка/удаление сдвигают хвост
+списка, что на размерах одного бота дешевле любой древовидной структуры на
+чистом Python.
+"""
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from typing import NamedTuple, Optional
+
+from app.services import storage
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderboardEntry(NamedTuple):
+    """Строка топа"""
+    rank: int
+    telegram_id: int
+    rating: float
+    username: Optional[str]
+    first_name: Optional[str]
+
+
+class RankingIndex:
+    """Игроки, упорядоченные по убыванию рейтинга"""
+
+    def __init__(self):
+        self._keys = []  # (-rating, telegram_id)
+        self._ratings = {}
+
+    def set(self, telegram_id: int, rating: Optional[float]):
+        """Добавить/обновить игрока; рейтинг None или 0 убирает его из индекса"""
+        old = self._ratings.pop(telegram_id, None)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, telegram_id))]
+        if rating is None or rating <= 0:
+            return
+        self._ratings[telegram_id] = rating
+        insort(self._keys, (-rating, telegram_id))
+
+    def remove(self, telegram_id: int):
+        self.set(telegram_id, None)
+
+    def rating(self, telegram_id: int) -> Optional[float]:
+        return self._ratings.get(telegram_id)
+
+    def rank(self, telegram_id: int) -> Optional[int]:
+        """Место игрока (с 1); при равном рейтинге места совпадают"""
+        rating = self._ratings.get(telegram_id)
+        if rating is None:
+            return None
+        return bisect_left(self._keys, (-rating, float("-inf"))) + 1
+
+    def page(self, offset: int = 0, limit: int = 10):
+        """Игроки с offset по offset + limit: [(telegram_id, rating), ...]"""
+        return [(telegram_id, -key) for key, telegram_id in self._keys[offset:offset + limit]]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, telegram_id):
+        return telegram_id in self._ratings
+
+
+class Leaderboard:
+    """Общий индекс рейтингов и индексы по чатам"""
+
+    def __init__(self):
+        self._global = None  # RankingIndex, загружается из базы при первом запросе
+        self._chats = {}  # chat_id -> RankingIndex
+        self._members = {}  # chat_id -> {telegram_id}
+        self._members_loaded = set()  # чаты, состав которых уже прочитан из базы
+        self._user_chats = {}  # telegram_id -> {chat_id}
+        self._names = {}  # telegram_id -> (username, first_name), только игроки с рейтингом
+        self._load_lock = asyncio.Lock()
+        self._backlog = {}  # изменения, пришедшие во время загрузки
+        self._generation = 0  # растёт при clear(): загрузка, начатая раньше, устарела
+
+    @property
+    def loaded(self) -> bool:
+        return self._global is not None
+
+    async def _ensure_loaded(self):
+        if self._global is not None:
+            return
+        async with self._load_lock:
+            while self._global is None:
+                generation = self._generation
+                rows = await storage.get_ratings()
+                if generation != self._generation:
+                    # clear() во время запроса - рейтинги в базе поменялись пачкой, читаем заново
+                    continue
+                index = RankingIndex()
+                names = {}
+                for telegram_id, rating, username, first_name in rows:
+                    index.set(telegram_id, rating)
+                    names[telegram_id] = (username, first_name)
+                # Записи, сделанные во время запроса, могли в него не попасть
+                for telegram_id, rating in self._backlog.items():
+                    index.set(telegram_id, rating)
+                    if telegram_id not in index:
+                        names.pop(telegram_id, None)
+                self._backlog.clear()
+                self._names = names
+                self._global = index
+                self._chats.clear()
+                logger.info(f"Leaderboard loaded: {len(index)} rated players")
+
+    def _chat_index(self, chat_id: int) -> RankingIndex:
+        index = self._chats.get(chat_id)
+        if index is None:
+            index = self._chats[chat_id] = RankingIndex()
+            for telegram_id in self._members.get(chat_id, ()):
+                index.set(telegram_id, self._global.rating(telegram_id))
+        return index
+
+    def _remember_name(self, telegram_id: int, username: str = None, first_name: str = None):
+        # Имена нужны только строкам топа; до загрузки индекса они придут из базы
+        if username is None and first_name is None:
+            return
+        if self._global is not None and telegram_id in self._global:
+            self._names[telegram_id] = (username, first_name)
+
+    def record_rating(self, telegram_id: int, rating: float, username: str = None, first_name: str = None):
+        """Обновить индексы после записи рейтинга в базу"""
+        if self._global is None:
+            # Индекс ещё не загружен - новое значение придёт вместе с загрузкой из базы
+            if self._load_lock.locked():
+                self._backlog[telegram_id] = rating
+            return
+        self._global.set(telegram_id, rating)
+        if telegram_id in self._global:
+            self._remember_name(telegram_id, username, first_name)
+        else:
+            self._names.pop(telegram_id, None)
+        for chat_id in self._user_chats.get(telegram_id, ()):
+            index = self._chats.get(chat_id)
+            if index is not None:
+                index.set(telegram_id, rating)
+
+    def add_member(self, chat_id: int, telegram_id: int, username: str = None, first_name: str = None):
+        """Отметить, что игрок состоит в чате"""
+        self._remember_name(telegram_id, username, first_name)
+        members = self._members.setdefault(chat_id, set())
+        if telegram_id in members:
+            return
+        members.add(telegram_id)
+        self._user_chats.setdefault(telegram_id, set()).add(chat_id)
+        index = self._chats.get(chat_id)
+        # Без общего индекса (после clear()) индексы чатов строятся заново при загрузке
+        if index is not None and self._global is not None:
+            index.set(telegram_id, self._global.rating(telegram_id))
+
+    def remove_member(self, chat_id: int, telegram_id: int):
+        """Игрок покинул чат; пустые записи о чате и игроке удаляются"""
+        members = self._members.get(chat_id)
+        if members is not None:
+            members.discard(telegram_id)
+            if not members:
+                del self._members[chat_id]
+        chats = self._user_chats.get(telegram_id)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del self._user_chats[telegram_id]
+        index = self._chats.get(chat_id)
+        if index is not None:
+            index.remove(telegram_id)
+            if chat_id not in self._members:
+                del self._chats[chat_id]
+
+    async def index(self, chat_id: Optional[int] = None) -> RankingIndex:
+        """Индекс чата (или общий, если chat_id=None)"""
+        while True:
+            await self._ensure_loaded()
+            if chat_id is None:
+                return self._global
+            if chat_id in self._members_loaded:
+                return self._chat_index(chat_id)
+            generation = self._generation
+            await self._load_members(chat_id)
+            if generation == self._generation:
+                return self._chat_index(chat_id)
+            # clear() во время чтения состава - общий индекс сброшен, загружаем заново
+
+    async def _load_members(self, chat_id: int):
+        for telegram_id in await storage.get_chat_member_ids(chat_id):
+            # Выход из чата мог ещё не дойти до базы
+            if storage.known_chat_members.get((chat_id, telegram_id)) is not False:
+                self.add_member(chat_id, telegram_id)
+        self._members_loaded.add(chat_id)
+
+    def _entry(self, index: RankingIndex, telegram_id: int, rating: float) -> LeaderboardEntry:
+        username, first_name = self._names.get(telegram_id, (None, None))
+        return LeaderboardEntry(index.rank(telegram_id), telegram_id, rating, username, first_name)
+
+    async def top(self, chat_id: Optional[int] = None, limit: int = 10, offset: int = 0):
+        """Страница топа чата"""
+        index = await self.index(chat_id)
+        return [self._entry(index, telegram_id, rating) for telegram_id, rating in index.page(offset, limit)]
+
+    async def rank(self, chat_id: Optional[int], telegram_id: int):
+        """(место, всего игроков с рейтингом) - место None, если рейтинга нет"""
+        index = await self.index(chat_id)
+        return index.rank(telegram_id), len(index)
+
+    def clear(self):
+        """Сбросить индексы (перезагрузятся из базы при следующем запросе)"""
+        self._generation += 1
+        self._global = None
+        self._chats.clear()
+        self._backlog.clear()
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self._global is not None,
+            "players": len(self._global) if self._global is not None else 0,
+            "chats": len(self._members),
+            "chat_indexes": len(self._chats),
+            "users_in_chats": len(self._user_chats),
+            "names": len(self._names),
+        }
+
+
+leaderboard = Leaderboard()
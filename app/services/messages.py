@@ -0,0 +1,169 @@
+"""
+Тексты ответов бота
+
+Статические тексты (справка, приветствие, подсказки) собираются и
+интернируются один раз при импорте, описание уровня по рейтингу ищется bisect по таблице порогов,
+а изменяемые части подставляются f-строками в функциях render_*. Отладочная
+строка в ответах добавляется только при REPLY_DEBUG_INFO=true.
+"""
+import sys
+from bisect import bisect_right
+
+from app.core.config import settings
+from app.core.rating_scale import MIN_RATING, MAX_RATING
+
+RATING_TOO_HIGH = "🤯 Что-то на Тапию ты не похож и даже не Чингото! Рейтинг по шкале Playtomic от 0.5 до 6.0"
+RATING_TOO_LOW = "❌ Рейтинг слишком низкий! Минимальный рейтинг по шкале Playtomic: 0.5"
+RATING_SCALE = "📊 Шкала Playtomic: от 0.5 до 6.0 (6.0 = ПРО уровень)"
+
+# Нижние границы уровней и их описания: _TIER_MESSAGES[i] - для рейтинга
+# из [_TIER_BOUNDS[i - 1], _TIER_BOUNDS[i])
+_TIER_BOUNDS = (1.5, 2.5, 3.5, 4.5, 5.5)
+_TIER_MESSAGES = (
+    "🎯 Начинающий путь в паделе!",
+    "🌱 Начинающий игрок!",
+    "📈 Развивающийся игрок!",
+    "👍 Хороший игрок!",
+    "💪 Отличный игрок!",
+    "🏆 ПРО уровень! Очень сильный игрок!",
+)
+
+_COMMANDS_SHORT = """Доступные команды:
+/getrating - Узнать рейтинг
+/setrating - Установить рейтинг
+/setptid - Установить PlayTomic ID
+/getptid - Узнать PlayTomic ID
+/profile - Полный профиль
+/help - Помощь"""
+
+HELP_ADMIN = sys.intern("""🎾 Команды бота (Администратор):
+
+/start - Начать работу с ботом
+/getrating [аргумент] - Узнать рейтинг (свой или указанного пользователя)
+/setrating - Установить рейтинг
+/setptid - Установить PlayTomic ID
+/getptid - Узнать PlayTomic ID
+/profile - Полный профиль пользователя
+/leaderboard [N] - Топ игроков чата
+/history [аргумент] - История изменений рейтинга
+/match @a @b vs @c @d 6-4 6-3 - Записать матч
+/teams @p1 @p2 ... - Сбалансированные пары по кортам
+/replaymatches - Пересчитать рейтинги по всем матчам
+/importratings - Импорт рейтингов из CSV/JSON файла
+/exportratings [csv|jsonl|parquet] - Выгрузка рейтингов файлом
+/createuser - Создать пользователя (только админы)
+/help - Показать эту справку
+
+📝 Форматы команд для админов:
+• /setrating @username 25 - по @username (если пользователь есть в БД)
+• /setrating 123456789 25 - по telegram_id (создает если нет)
+• /setrating 25 (в ответ) - в ответ на сообщение
+• /setrating 25 - себе
+
+• /createuser 123456789 3.5 john_player - создать нового пользователя
+• /getrating @username - рейтинг по @username
+• /getrating 123456789 - рейтинг по telegram_id""")
+
+HELP_USER = sys.intern("""🎾 Команды бота:
+
+/start - Начать работу с ботом
+/getrating [аргумент] - Узнать рейтинг (свой или указанного пользователя)
+/setrating - Установить свой рейтинг
+/setptid - Установить свой PlayTomic ID
+/getptid - Узнать PlayTomic ID
+/profile - Свой профиль
+/leaderboard [N] - Топ игроков чата
+/history - История изменений рейтинга
+/match @a @b vs @c @d 6-4 6-3 - Записать матч
+/teams @p1 @p2 ... - Сбалансированные пары по кортам
+/help - Показать эту справку
+
+📝 Что вы можете:
+• /setrating 12 - установить себе рейтинг
+• /getrating @username - узнать рейтинг пользователя
+• /profile - посмотреть свой профиль
+
+💡 Администраторы могут устанавливать рейтинг другим:
+• /setrating @username 25""")
+
+SETRATING_USAGE_ADMIN = sys.intern(
+    "Использование:\n"
+    "• В ответ на сообщение: /setrating 2.5\n"
+    "• По @username: /setrating @john_doe 2,3\n"
+    "• Себе: /setrating 2.0\n\n"
+    "💡 Поддерживаются дробные числа: 2.5, 1,3, 0.7\n"
+    f"{RATING_SCALE}"
+)
+SETRATING_USAGE_USER = sys.intern(
+    "Использование:\n"
+    "• Себе: /setrating 2.5\n\n"
+    "💡 Только администраторы могут устанавливать рейтинг другим пользователям.\n"
+    f"{RATING_SCALE}"
+)
+OWN_RATING_NOT_SET = sys.intern(
+    "💡 Ваш рейтинг не установлен! Используйте команду /setrating чтобы установить свой рейтинг из PlayTomic.\n"
+    "Пример: /setrating 3.5\n\n"
+    f"{RATING_SCALE}"
+)
+
+
+def rating_tier_message(rating: float) -> str:
+    """Описание уровня игрока по шкале Playtomic"""
+    if rating > MAX_RATING:
+        return RATING_TOO_HIGH
+    if rating < MIN_RATING:
+        return RATING_TOO_LOW
+    return _TIER_MESSAGES[bisect_right(_TIER_BOUNDS, rating)]
+
+
+def debug_suffix(**fields) -> str:
+    """Отладочная строка для ответа (пустая, если REPLY_DEBUG_INFO выключен)"""
+    if not settings.REPLY_DEBUG_INFO:
+        return ""
+    return "\n🔍 Отладка: " + ", ".join(f"{key}={value}" for key, value in fields.items())
+
+
+def render_welcome(first_name: str, rating: float, new_user: bool) -> str:
+    """Приветствие /start"""
+    if new_user:
+        return (
+            f"🎾 Добро пожаловать в Rating Bot, {first_name}!\n\n"
+            f"✅ Вы успешно зарегистрированы в системе!\n"
+            f"📊 Ваш начальный рейтинг: {rating}\n\n"
+            f"Этот бот управляет рейтингами игроков и PlayTomic ID.\n\n"
+            f"{_COMMANDS_SHORT}"
+        )
+    return (
+        f"🎾 С возвращением, {first_name}!\n\n"
+        f"📊 Ваш текущий рейтинг: {rating}\n\n"
+        f"{_COMMANDS_SHORT}"
+    )
+
+
+def render_welcome_error(first_name: str) -> str:
+    """Приветствие /start, если регистрация не удалась"""
+    return (
+        f"🎾 Добро пожаловать в Rating Bot, {first_name}!\n\n"
+        f"⚠️ Произошла ошибка при регистрации. Попробуйте позже.\n\n"
+        f"Доступные команды:\n/help - Помощь"
+    )
+
+
+def render_rating(title: str, rating: float, pt_userid: str = "", own: bool = False) -> str:
+    """Ответ /getrating: рейтинг с описанием уровня или подсказкой, если он не установлен"""
+    pt_info = f" (PlayTomic: {pt_userid})" if pt_userid else ""
+    if rating == 0.0:
+        if own:
+            return f"🏆 Ваш рейтинг: {rating}{pt_info}\n\n{OWN_RATING_NOT_SET}"
+        return f"🏆 {title} рейтинг: {rating}{pt_info}\n\n💡 У пользователя {title} рейтинг не установлен."
+    return f"🏆 {title} рейтинг: {rating}{pt_info}\n\n{rating_tier_message(rating)}"
+
+
+def render_rating_set(display_name: str, rating: float) -> str:
+    """Ответ /setrating после записи"""
+    return f"✅ Рейтинг {display_name} установлен: {rating}\n\n{rating_tier_message(rating)}"
+
+
+def render_invalid_rating(rating: float) -> str:
+    """Ответ /setrating на рейтинг вне шкалы"""
+    return f"❌ {rating_tier_message(rating)}\n\n💡 Пожалуйста, введите корректное значение от 0.5 до 6.0"
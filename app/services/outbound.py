@@ -0,0 +1,250 @@
+"""
+Исходящие сообщения: лимиты Telegram, объединение ответов, повтор после 429
+
+Ответы ставятся в очередь своего чата, и обработчик не ждёт доставки (если
+не попросил wait=True). Воркер чата отправляет сообщения, соблюдая два
+token bucket: общий на бота (OUTBOUND_GLOBAL_RATE сообщений в секунду) и
+свой у чата (OUTBOUND_CHAT_RATE в личке, OUTBOUND_GROUP_RATE в минуту в
+группах). Пока сообщение ждёт токена, следующие ответы в тот же чат
+дописываются к нему - вместо двух сообщений подряд уходит одно. Объединяются
+только ответы на одно и то же сообщение (reply_to): ответы разным
+пользователям уходят отдельными сообщениями, каждый - на своё. На 429
+(RetryAfter) воркер ждёт столько, сколько просит Telegram, и повторяет.
+
+Пока отправитель не запущен (start()), сообщения отправляются сразу, как
+раньше - так работают тесты и скрипты без event loop приложения.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+from telegram.error import RetryAfter
+
+from app.core.config import settings
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+MERGE_SEPARATOR = "\n\n"
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float = 1.0, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def reserve(self) -> float:
+        """Занять токен; возвращает, сколько секунд нужно подождать до отправки"""
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    @property
+    def refill_time(self) -> float:
+        """За сколько секунд пустой bucket наполняется целиком"""
+        return self.capacity / self.rate
+
+
+class _Outgoing:
+    """Сообщение в очереди чата (возможно, объединённое из нескольких ответов)"""
+    __slots__ = ("parts", "length", "send", "reply_to", "waiters")
+
+    def __init__(self, text: str, send, reply_to: Optional[int] = None):
+        self.parts = [text]
+        self.length = len(text)
+        self.send = send
+        self.reply_to = reply_to
+        self.waiters: List[asyncio.Future] = []
+
+    def can_merge(self, text: str, reply_to: Optional[int]) -> bool:
+        # Ответ другому сообщению дописывать нельзя - он процитировал бы чужое
+        return reply_to == self.reply_to and self.length + len(MERGE_SEPARATOR) + len(text) <= MAX_MESSAGE_LENGTH
+
+    def merge(self, text: str):
+        self.parts.append(text)
+        self.length += len(MERGE_SEPARATOR) + len(text)
+
+    @property
+    def text(self) -> str:
+        return MERGE_SEPARATOR.join(self.parts)
+
+
+class OutboundSender:
+    """Очереди исходящих сообщений по чатам с общими и чатовыми лимитами"""
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: int = 3,
+        max_retries: int = 3,
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, capacity=max(1.0, global_rate))
+        # Bucket чата живёт, пока не наполнится заново - дальше он равен новому
+        self._buckets = TTLCache(maxsize=100000, ttl=chat_burst / min(chat_rate, group_rate))
+        self._queues = {}
+        self._workers = {}
+        self._running = False
+        # Метрики
+        self.queued = 0
+        self.merged = 0
+        self.sent = 0
+        self.retries = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        """Включить очереди (до этого сообщения отправляются сразу)"""
+        self._running = True
+
+    async def send(
+        self,
+        chat_id: int,
+        text: str,
+        send: Callable[[str], Awaitable],
+        wait: bool = False,
+        reply_to: Optional[int] = None,
+    ):
+        """Отправить text в чат через send(text).
+
+        reply_to - сообщение, на которое отвечает send: объединяются только
+        ответы с одинаковым reply_to. Без wait=True возвращается сразу,
+        доставка идёт в фоне, ошибки только логируются; с wait=True ждёт
+        отправки, возвращает фактически отправленное сообщение и пробрасывает
+        ошибку доставки.
+        """
+        if not self._running or chat_id is None:
+            return await send(text)
+
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        self.queued += 1
+        if queue and queue[-1].can_merge(text, reply_to):
+            outgoing = queue[-1]
+            outgoing.merge(text)
+            self.merged += 1
+        else:
+            outgoing = _Outgoing(text, send, reply_to)
+            queue.append(outgoing)
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id, queue), name=f"outbound-{chat_id}")
+
+        if wait:
+            waiter = asyncio.get_running_loop().create_future()
+            outgoing.waiters.append(waiter)
+            return await waiter
+
+    def _reserve_chat(self, chat_id: int) -> float:
+        """Занять токен чата; возвращает задержку до отправки"""
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательный chat_id - группа или канал, у них лимит строже
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = TokenBucket(rate, capacity=self.chat_burst)
+        delay = bucket.reserve()
+        self._buckets.set(chat_id, bucket, ttl=delay + bucket.refill_time)
+        return delay
+
+    async def _drain(self, chat_id: int, queue: deque):
+        try:
+            while queue:
+                # Пока ждём токены, новые ответы дописываются к queue[0]
+                delay = self._reserve_chat(chat_id)
+                if delay:
+                    await asyncio.sleep(delay)
+                delay = self._global.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                await self._deliver(queue.popleft())
+        finally:
+            self._workers.pop(chat_id, None)
+            if not queue and self._queues.get(chat_id) is queue:
+                del self._queues[chat_id]
+
+    async def _deliver(self, outgoing: _Outgoing):
+        text = outgoing.text
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await outgoing.send(text)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    self._fail(outgoing, e)
+                    return
+                self.retries += 1
+                retry_after = e.retry_after
+                retry_after = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after
+                logger.warning(f"Telegram flood control: retry in {retry_after}s")
+                await asyncio.sleep(retry_after)
+            except Exception as e:
+                self._fail(outgoing, e)
+                return
+            else:
+                self.sent += 1
+                for waiter in outgoing.waiters:
+                    if not waiter.done():
+                        waiter.set_result(result)
+                return
+
+    def _fail(self, outgoing: _Outgoing, error: Exception):
+        self.errors += 1
+        logger.error(f"Failed to send message: {error}")
+        for waiter in outgoing.waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+
+    async def close(self, timeout: float = None):
+        """Доотправить очереди (не дольше timeout) и вернуться к прямой отправке"""
+        workers = list(self._workers.values())
+        if workers:
+            done, pending = await asyncio.wait(workers, timeout=timeout)
+            if pending:
+                dropped = sum(len(queue) for queue in self._queues.values())
+                logger.warning(f"Outbound queues not drained in {timeout}s, dropping {dropped} messages")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        self._queues.clear()
+        self._running = False
+
+    def stats(self) -> dict:
+        """Метрики отправителя"""
+        return {
+            "running": self._running,
+            "chats": len(self._queues),
+            "pending": sum(len(queue) for queue in self._queues.values()),
+            "queued": self.queued,
+            "merged": self.merged,
+            "sent": self.sent,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+
+outbound = OutboundSender(
+    global_rate=settings.OUTBOUND_GLOBAL_RATE,
+    chat_rate=settings.OUTBOUND_CHAT_RATE,
+    group_rate=settings.OUTBOUND_GROUP_RATE / 60,
+    chat_burst=settings.OUTBOUND_CHAT_BURST,
+    max_retries=settings.OUTBOUND_MAX_RETRIES,
+)
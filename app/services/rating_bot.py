@@ -1,31 +1,54 @@
+import asyncio
 import logging
+import tempfile
 from telegram import Update
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, CommandHandler, ChatMemberHandler, MessageHandler, TypeHandler, filters
 from telegram.constants import ChatMemberStatus
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.models.database import get_db, UserRating
+from app.core import metrics, tracing
+from app.core.config import settings
+from app.core.rating_scale import parse_rating, is_valid_playtomic_rating
+from app.services import messages, rating_io, storage
+from app.services.cache import TTLCache
+from app.services.leaderboard import leaderboard
+from app.services.outbound import outbound
+from app.services.rating_engine import parse_score
+from app.services.team_balancer import balance_teams
 
 logger = logging.getLogger(__name__)
 
 # --- helper: безопасная отправка сообщений ---
-async def safe_reply(update: Update, text: str):
-    """Безопасная отправка сообщения с проверкой на None"""
-    if update.message:
-        await update.message.reply_text(text)
-    elif update.callback_query:
-        await update.callback_query.message.reply_text(text)
-    elif update.effective_chat:
-        await update.get_bot().send_message(chat_id=update.effective_chat.id, text=text)
+async def safe_reply(update: Update, text: str, wait: bool = False):
+    """Безопасная отправка сообщения с проверкой на None.
+
+    Ответ уходит через очередь исходящих сообщений чата (лимиты Telegram,
+    объединение ответов подряд); wait=True - дождаться доставки, получить
+    отправленное сообщение и ошибку доставки, если она была.
+    """
+    message = update.message or (update.callback_query.message if update.callback_query else None)
+    chat = getattr(update, "effective_chat", None)
+    if message:
+        send = message.reply_text
+        reply_to = getattr(message, "message_id", None)
+    elif chat:
+        send = lambda message_text: update.get_bot().send_message(chat_id=chat.id, text=message_text)
+        reply_to = None
     else:
         logger.error(f"Cannot send message - no valid chat context: {text}")
+        return
+    chat_id = chat.id if chat is not None else None
+    return await outbound.send(chat_id, text, send, wait=wait, reply_to=reply_to)
 
 # Функции для работы с базой данных SQLite
-import sqlite3
+# Синхронные версии для скриптов и тестов; обработчики используют app.services.storage
 import os
 from datetime import datetime
 
+from app.models.sqlite_pool import connect, get_pool
+
 def get_db_path():
     """Получить путь к базе данных"""
     # Для локальной разработки используем local_rating_bot.db
@@ -34,67 +57,38 @@ def get_db_path():
     return db_url.replace("sqlite+aiosqlite:///", "")
 
 def get_db_connection():
-    """Получить подключение к базе данных"""
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def ensure_user_exists(telegram_id: int, username: str = None, first_name: str = None):
-    """Убедиться, что пользователь существует в базе"""
-    conn = get_db_connection()
-    try:
-        # Сначала пытаемся создать запись
+    """Получить отдельное подключение к базе данных (закрывает вызывающий)"""
+    return connect(get_db_path())
+
+def get_connection_pool():
+    """Получить пул подключений процесса (писатель + читатели)"""
+    return get_pool(get_db_path())
+
+def _ensure_user(conn, telegram_id: int, username: str = None, first_name: str = None):
+    """Создать/обновить пользователя в рамках уже открытой транзакции"""
+    # Сначала пытаемся создать запись
+    conn.execute(
+        "INSERT OR IGNORE INTO user_ratings (telegram_id, telegram_username, first_name, rating, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (telegram_id, username, first_name, 0, datetime.now(), datetime.now())
+    )
+    
+    # Если запись уже существует, обновляем username и first_name (они могут измениться),
+    # но только если они действительно другие - иначе это лишняя запись
+    if username is not None or first_name is not None:
         conn.execute(
-            "INSERT OR IGNORE INTO user_ratings (telegram_id, telegram_username, first_name, rating, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (telegram_id, username, first_name, 0, datetime.now(), datetime.now())
+            "UPDATE user_ratings SET telegram_username = ?, first_name = ?, updated_at = ? "
+            "WHERE telegram_id = ? AND (telegram_username IS NOT ? OR first_name IS NOT ?)",
+            (username, first_name, datetime.now(), telegram_id, username, first_name)
         )
-        
-        # Если запись уже существует, обновляем username и first_name (они могут измениться)
-        if username is not None or first_name is not None:
-            conn.execute(
-                "UPDATE user_ratings SET telegram_username = ?, first_name = ?, updated_at = ? WHERE telegram_id = ?",
-                (username, first_name, datetime.now(), telegram_id)
-            )
-        
-        conn.commit()
-    finally:
-        conn.close()
 
-def parse_rating(rating_str: str) -> float:
-    """Парсинг рейтинга с поддержкой точки и запятой как десятичного разделителя"""
-    try:
-        # Заменяем запятую на точку для стандартного парсинга
-        normalized_str = rating_str.replace(',', '.')
-        rating = float(normalized_str)
-        
-        # Ограничиваем точность до 2 знаков после запятой
-        return round(rating, 2)
-    except ValueError:
-        return None
-
-def is_valid_playtomic_rating(rating: float) -> bool:
-    """Проверка, является ли рейтинг валидным по шкале Playtomic (0.5-6.0)"""
-    return 0.5 <= rating <= 6.0
+def ensure_user_exists(telegram_id: int, username: str = None, first_name: str = None):
+    """Убедиться, что пользователь существует в базе"""
+    with get_connection_pool().writer() as conn:
+        _ensure_user(conn, telegram_id, username, first_name)
 
 def get_playtomic_rating_message(rating: float) -> str:
     """Получить сообщение о рейтинге по шкале Playtomic"""
-    if rating > 6.0:
-        return "🤯 Что-то на Тапию ты не похож и даже не Чингото! Рейтинг по шкале Playtomic от 0.5 до 6.0"
-    elif rating < 0.5:
-        return "❌ Рейтинг слишком низкий! Минимальный рейтинг по шкале Playtomic: 0.5"
-    elif rating >= 5.5:
-        return "🏆 ПРО уровень! Очень сильный игрок!"
-    elif rating >= 4.5:
-        return "💪 Отличный игрок!"
-    elif rating >= 3.5:
-        return "👍 Хороший игрок!"
-    elif rating >= 2.5:
-        return "📈 Развивающийся игрок!"
-    elif rating >= 1.5:
-        return "🌱 Начинающий игрок!"
-    else:
-        return "🎯 Начинающий путь в паделе!"
+    return messages.rating_tier_message(rating)
 
 def is_valid_rating(rating_str: str) -> bool:
     """Проверка, является ли строка валидным рейтингом по шкале Playtomic"""
@@ -106,17 +100,81 @@ def get_user_id_by_username(username: str) -> int:
     # Убираем @ если есть
     clean_username = username.lstrip('@').lower()
     
-    conn = get_db_connection()
-    try:
+    with get_connection_pool().reader() as conn:
         cursor = conn.execute(
             "SELECT telegram_id FROM user_ratings WHERE LOWER(telegram_username) = ?", 
             (clean_username,)
         )
         result = cursor.fetchone()
         return result[0] if result else None
-    finally:
-        conn.close()
 
+# Кэш поиска @username в чатах: (chat_id, username в нижнем регистре) -> (id, username, first_name).
+# Ненайденные пользователи кэшируются как (None, None, None) на короткое время.
+user_lookup_cache = TTLCache(maxsize=settings.USER_LOOKUP_CACHE_SIZE, ttl=settings.USER_LOOKUP_POSITIVE_TTL)
+# Список администраторов чата: chat_id -> tuple[ChatMember]
+chat_admins_cache = TTLCache(maxsize=settings.USER_LOOKUP_CACHE_SIZE, ttl=settings.CHAT_ADMINS_CACHE_TTL)
+
+_NOT_FOUND = (None, None, None)
+
+async def get_chat_administrators_cached(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    """Список администраторов чата с кэшированием"""
+    admins = chat_admins_cache.get(chat_id)
+    if admins is None:
+        admins = tuple(await context.bot.get_chat_administrators(chat_id))
+        chat_admins_cache.set(chat_id, admins)
+        # Заодно прогреваем кэш is_admin
+        for admin in admins:
+            if admin.user:
+                admin_cache.set((chat_id, admin.user.id), True)
+    return admins
+
+async def _find_user_via_get_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int, clean_username: str):
+    """Метод 1: получаем ID через get_chat("@username") и проверяем участие в чате"""
+    search_username = f"@{clean_username}"
+    try:
+        logger.info(f"Trying get_chat('{search_username}') to get user ID...")
+        user_chat = await context.bot.get_chat(search_username)
+    except Exception as get_chat_error:
+        logger.info(f"get_chat('{search_username}') failed: {get_chat_error}")
+        return None
+
+    if not user_chat or not user_chat.id:
+        return None
+    user_id = user_chat.id
+    logger.info(f"SUCCESS: Got user ID {user_id} from get_chat('{search_username}')")
+
+    # Теперь проверяем, что этот пользователь есть в нашем чате
+    try:
+        member = await context.bot.get_chat_member(chat_id, user_id)
+    except Exception as member_check_error:
+        logger.warning(f"Could not verify user @{clean_username} (ID={user_id}) in chat: {member_check_error}")
+        return None
+
+    if member and member.user and not member.user.is_bot:
+        logger.info(f"SUCCESS: User @{clean_username} (ID={user_id}) confirmed in chat")
+        admin_cache.set(
+            (chat_id, user_id),
+            member.status in (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR),
+        )
+        return member.user.id, member.user.username, member.user.first_name
+    logger.warning(f"User @{clean_username} (ID={user_id}) not found in chat or is a bot")
+    return None
+
+async def _find_user_via_admins(context: ContextTypes.DEFAULT_TYPE, chat_id: int, clean_username: str):
+    """Метод 2: поиск среди администраторов чата"""
+    try:
+        admins = await get_chat_administrators_cached(context, chat_id)
+    except Exception as admin_error:
+        logger.warning(f"Could not get administrators: {admin_error}")
+        return None
+
+    for admin in admins:
+        if admin.user and admin.user.username and admin.user.username.lower() == clean_username.lower():
+            logger.info(f"SUCCESS: Found user among administrators: @{admin.user.username} → ID={admin.user.id}")
+            return admin.user.id, admin.user.username, admin.user.first_name
+    return None
+
+@tracing.traced()
 async def get_user_from_chat(update: Update, context: ContextTypes.DEFAULT_TYPE, username: str):
     """Получить информацию о пользователе из чата по @username"""
     try:
@@ -132,52 +190,44 @@ async def get_user_from_chat(update: Update, context: ContextTypes.DEFAULT_TYPE,
         if not clean_username:
             logger.warning(f"Empty username after cleaning: '{username}'")
             return None, None, None
+
+        cache_key = (chat.id, clean_username.lower())
+        cached = user_lookup_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Lookup cache hit for '@{clean_username}' in chat {chat.id}")
+            return cached
             
-        logger.info(f"Searching for user '{clean_username}' in chat {chat.id} ({getattr(chat, 'title', 'No title')})")
-        logger.info(f"Original input: '{username}' → cleaned: '{clean_username}'")
-        
-        # Метод 1: Получаем ID пользователя через get_chat("@username")
+        # Сначала известные участники чата - один индексированный запрос вместо вызовов Telegram API
         try:
-            search_username = f"@{clean_username}"
-            logger.info(f"Trying get_chat('{search_username}') to get user ID...")
-            user_chat = await context.bot.get_chat(search_username)
+            found = await storage.find_chat_member_by_username(chat.id, clean_username)
+        except Exception as db_error:
+            logger.warning(f"Chat members lookup failed: {db_error}")
+            found = None
+        if found is not None:
+            logger.info(f"Found '@{clean_username}' among known members of chat {chat.id}")
+            user_lookup_cache.set(cache_key, found)
+            return found
             
-            if user_chat and user_chat.id:
-                user_id = user_chat.id
-                logger.info(f"SUCCESS: Got user ID {user_id} from get_chat('{search_username}')")
-                
-                # Теперь проверяем, что этот пользователь есть в нашем чате
-                try:
-                    member = await context.bot.get_chat_member(chat.id, user_id)
-                    if member and member.user and not member.user.is_bot:
-                        logger.info(f"SUCCESS: User @{clean_username} (ID={user_id}) confirmed in chat")
-                        return member.user.id, member.user.username, member.user.first_name
-                    else:
-                        logger.warning(f"User @{clean_username} (ID={user_id}) not found in chat or is a bot")
-                        
-                except Exception as member_check_error:
-                    logger.warning(f"Could not verify user @{clean_username} (ID={user_id}) in chat: {member_check_error}")
-                    
-        except Exception as get_chat_error:
-            logger.info(f"get_chat('{search_username}') failed: {get_chat_error}")
+        logger.info(f"Searching for user '{clean_username}' in chat {chat.id} ({getattr(chat, 'title', 'No title')})")
         
-        # Метод 2 (запасной): Поиск через администраторов
+        # Оба способа независимы - запускаем одновременно и берём первый успешный результат
+        probes = [
+            asyncio.create_task(_find_user_via_get_chat(context, chat.id, clean_username)),
+            asyncio.create_task(_find_user_via_admins(context, chat.id, clean_username)),
+        ]
         try:
-            logger.info("Fallback: searching through chat administrators...")
-            admins = await context.bot.get_chat_administrators(chat.id)
-            logger.info(f"Found {len(admins)} administrators")
-            
-            for admin in admins:
-                if admin.user and admin.user.username:
-                    logger.debug(f"Checking admin: @{admin.user.username}")
-                    if admin.user.username.lower() == clean_username.lower():
-                        logger.info(f"SUCCESS: Found user among administrators: @{admin.user.username} → ID={admin.user.id}")
-                        return admin.user.id, admin.user.username, admin.user.first_name
-                        
-        except Exception as admin_error:
-            logger.warning(f"Could not get administrators: {admin_error}")
+            for next_done in asyncio.as_completed(probes):
+                found = await next_done
+                if found is not None:
+                    user_lookup_cache.set(cache_key, found)
+                    remember_chat_member(chat.id, *found)
+                    return found
+        finally:
+            for probe in probes:
+                probe.cancel()
         
         logger.warning(f"User '@{username}' not found in chat {chat.id} with any method")
+        user_lookup_cache.set(cache_key, _NOT_FOUND, ttl=settings.USER_LOOKUP_NEGATIVE_TTL)
         return None, None, None
         
     except Exception as e:
@@ -185,62 +235,56 @@ async def get_user_from_chat(update: Update, context: ContextTypes.DEFAULT_TYPE,
         return None, None, None
 
 def set_rating(user_id: int, rating: float, username: str = None, first_name: str = None):
-    """Установить рейтинг пользователя в базе данных"""
-    ensure_user_exists(user_id, username, first_name)
-    conn = get_db_connection()
-    try:
+    """Установить рейтинг пользователя в базе данных (с точкой в rating_history, как storage.set_rating)"""
+    with get_connection_pool().writer() as conn:
+        _ensure_user(conn, user_id, username, first_name)
         conn.execute(
             "UPDATE user_ratings SET rating = ?, updated_at = ? WHERE telegram_id = ?",
             (rating, datetime.now(), user_id)
         )
-        conn.commit()
-    finally:
-        conn.close()
+        storage.append_history(conn, [(user_id, rating)])
 
 def get_rating(user_id: int) -> float:
     """Получить рейтинг пользователя из базы данных"""
-    conn = get_db_connection()
-    try:
+    with get_connection_pool().reader() as conn:
         cursor = conn.execute("SELECT rating FROM user_ratings WHERE telegram_id = ?", (user_id,))
         result = cursor.fetchone()
         return result[0] if result and result[0] is not None else 0.0
-    finally:
-        conn.close()
 
 def user_exists_in_db(user_id: int) -> bool:
     """Проверить, существует ли пользователь в базе данных"""
-    conn = get_db_connection()
-    try:
+    with get_connection_pool().reader() as conn:
         cursor = conn.execute("SELECT 1 FROM user_ratings WHERE telegram_id = ?", (user_id,))
         result = cursor.fetchone()
         return result is not None
-    finally:
-        conn.close()
 
 def set_pt_userid(user_id: int, pt_userid: str):
     """Установить PlayTomic ID пользователя в базе данных"""
-    ensure_user_exists(user_id)
-    conn = get_db_connection()
-    try:
+    with get_connection_pool().writer() as conn:
+        _ensure_user(conn, user_id)
         conn.execute(
             "UPDATE user_ratings SET PT_userId = ?, updated_at = ? WHERE telegram_id = ?",
             (pt_userid, datetime.now(), user_id)
         )
-        conn.commit()
-    finally:
-        conn.close()
 
 def get_pt_userid(user_id: int) -> str:
     """Получить PlayTomic ID пользователя из базы данных"""
-    conn = get_db_connection()
-    try:
+    with get_connection_pool().reader() as conn:
         cursor = conn.execute("SELECT PT_userId FROM user_ratings WHERE telegram_id = ?", (user_id,))
         result = cursor.fetchone()
         return result[0] if result and result[0] is not None else ""
-    finally:
-        conn.close()
+
+def get_all_users():
+    """Получить всех пользователей из базы данных"""
+    with get_connection_pool().reader() as conn:
+        cursor = conn.execute("SELECT telegram_id, telegram_username, first_name, rating FROM user_ratings")
+        return cursor.fetchall()
 
 # --- helper: проверка админа ---
+# (chat_id, user_id) -> является ли админом; сбрасывается по chat_member / my_chat_member
+admin_cache = TTLCache(maxsize=settings.ADMIN_CACHE_SIZE, ttl=settings.ADMIN_CACHE_TTL)
+
+@tracing.traced()
 async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Проверка, является ли пользователь администратором чата"""
     chat = update.effective_chat
@@ -248,8 +292,147 @@ async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     if not chat or chat.type == "private":
         # В личке запрещаем (можно поменять на True, если хотите разрешить только «известным» админам)
         return False
+    key = (chat.id, user.id)
+    cached = admin_cache.get(key)
+    if cached is not None:
+        return cached
     member = await context.bot.get_chat_member(chat.id, user.id)
-    return member.status in (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR)
+    result = member.status in (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR)
+    admin_cache.set(key, result)
+    return result
+
+def is_group_chat(chat) -> bool:
+    """Группа или супергруппа (в них есть участники и свой топ)"""
+    return chat is not None and chat.type in ("group", "supergroup")
+
+def remember_chat_member(chat_id: int, telegram_id: int, username: str = None, first_name: str = None):
+    """Запомнить участника чата: топ чата в памяти, chat_members и профиль (пачкой).
+
+    Профиль нужен поиску по @username среди участников чата без вызовов Bot API.
+    """
+    leaderboard.add_member(chat_id, telegram_id, username, first_name)
+    storage.record_chat_member(chat_id, telegram_id)
+    storage.record_profile(telegram_id, username, first_name)
+
+def forget_chat_member(chat_id: int, telegram_id: int):
+    """Участник покинул чат"""
+    leaderboard.remove_member(chat_id, telegram_id)
+    storage.record_chat_member(chat_id, telegram_id, present=False)
+
+LEADERBOARD_DEFAULT_SIZE = 10
+LEADERBOARD_MAX_SIZE = 50
+LEADERBOARD_MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+def format_leaderboard_entry(entry) -> str:
+    """Строка топа: место, имя, @username, рейтинг"""
+    name = entry.first_name or (f"@{entry.username}" if entry.username else f"user_id={entry.telegram_id}")
+    if entry.first_name and entry.username:
+        name += f" (@{entry.username})"
+    medal = LEADERBOARD_MEDALS.get(entry.rank, "")
+    return f"{entry.rank}. {medal + ' ' if medal else ''}{name} — {entry.rating}"
+
+MATCH_USAGE = (
+    "Использование:\n"
+    "• /match @a @b vs @c @d 6-4 6-3\n"
+    "• Вместо @username можно указать telegram_id\n\n"
+    "Первая пара - команда A, счёт указывается с её стороны."
+)
+
+async def resolve_player(update: Update, context: ContextTypes.DEFAULT_TYPE, token: str):
+    """Игрок по @username или telegram_id: (telegram_id, отображаемое имя) или None"""
+    if token.isdigit():
+        profile = await storage.get_user_profile(int(token))
+        if not profile.exists:
+            return None
+        return profile.telegram_id, f"@{profile.username}" if profile.username else (profile.first_name or token)
+    if not token.startswith('@'):
+        return None
+    telegram_id = await storage.get_user_id_by_username(token)
+    if telegram_id is None:
+        chat_user_id, chat_username, chat_first_name = await get_user_from_chat(update, context, token)
+        if chat_user_id is None:
+            return None
+        await storage.ensure_user_exists(chat_user_id, chat_username, chat_first_name)
+        telegram_id = chat_user_id
+    return telegram_id, token
+
+def parse_match_args(args):
+    """Разобрать аргументы /match: ([a1, a2], [b1, b2], счёт) или None"""
+    lowered = [arg.lower() for arg in args]
+    if "vs" not in lowered:
+        return None
+    split = lowered.index("vs")
+    team_a = args[:split]
+    rest = args[split + 1:]
+    if len(team_a) != 2 or len(rest) < 3:
+        return None
+    team_b, score_tokens = rest[:2], rest[2:]
+    score = parse_score(score_tokens)
+    if score is None:
+        return None
+    return team_a, team_b, score
+
+TEAMS_MAX_PLAYERS = 32
+TEAMS_USAGE = (
+    "Использование:\n"
+    "• /teams @p1 @p2 @p3 @p4 ... - от 4 до 32 игроков, число кратно 4\n"
+    "• Вместо @username можно указать telegram_id"
+)
+
+def format_lineup(lineup, names: dict) -> str:
+    """Текст ответа /teams: пары по кортам"""
+    lines = [f"🎾 Составы на {len(lineup.courts)} корт(а) (макс. разница пар {lineup.max_imbalance:.2f}):"]
+    for number, court in enumerate(lineup.courts, 1):
+        team_a = " + ".join(names[player] for player in court.team_a)
+        team_b = " + ".join(names[player] for player in court.team_b)
+        lines += [
+            "",
+            f"Корт {number}:",
+            f"  {team_a} ({court.rating_a:.2f})",
+            "  vs",
+            f"  {team_b} ({court.rating_b:.2f})",
+        ]
+    return "\n".join(lines)
+
+IMPORT_USAGE = (
+    "Использование:\n"
+    "• Отправьте CSV/JSON файл с подписью /importratings\n"
+    "• Или ответьте /importratings на сообщение с файлом\n\n"
+    "Колонки: telegram_id или username, rating (и необязательная first_name).\n"
+    "CSV - с заголовком, разделитель запятая или точка с запятой."
+)
+
+EXPORT_USAGE = (
+    "Использование:\n"
+    "• /exportratings - все рейтинги в CSV\n"
+    "• /exportratings jsonl или /exportratings parquet"
+)
+
+HISTORY_SIZE = 10
+SPARKLINE_BLOCKS = "▁▂▃▄▅▆▇█"
+
+def sparkline(values) -> str:
+    """Мини-график из блочных символов"""
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARKLINE_BLOCKS[3] * len(values)
+    scale = (len(SPARKLINE_BLOCKS) - 1) / (high - low)
+    return "".join(SPARKLINE_BLOCKS[round((value - low) * scale)] for value in values)
+
+def format_rating_history(title: str, history) -> str:
+    """Текст ответа /history: изменения по датам, мини-график и итог"""
+    lines = [f"📈 История рейтинга {title}:", ""]
+    previous = None
+    for ts, rating in history:
+        line = f"{datetime.fromtimestamp(ts).strftime('%d.%m.%Y %H:%M')} — {rating}"
+        if previous is not None and rating != previous:
+            line += f" ({rating - previous:+.2f})"
+        lines.append(line)
+        previous = rating
+    if len(history) > 1:
+        change = history[-1][1] - history[0][1]
+        lines += ["", f"Тренд: {sparkline([rating for _, rating in history])}", f"Изменение: {change:+.2f}"]
+    return "\n".join(lines)
 
 class RatingBot:
     @staticmethod
@@ -260,54 +443,19 @@ class RatingBot:
         # Автоматически добавляем пользователя в БД при первом запуске
         try:
             # Проверяем, есть ли пользователь в БД
-            if not user_exists_in_db(user.id):
+            profile = await storage.get_user_profile(user.id)
+            if not profile.exists:
                 # Пользователя нет в БД - добавляем его
-                ensure_user_exists(user.id, user.username, user.first_name)
+                await storage.ensure_user_exists(user.id, user.username, user.first_name)
                 logger.info(f"New user added to DB: {user.id} (@{user.username or 'no_username'}) - {user.first_name}")
-                
-                welcome_text = f"""
-🎾 Добро пожаловать в Rating Bot, {user.first_name}!
-
-✅ Вы успешно зарегистрированы в системе!
-📊 Ваш начальный рейтинг: 0.0
-
-Этот бот управляет рейтингами игроков и PlayTomic ID.
-
-Доступные команды:
-/getrating - Узнать рейтинг
-/setrating - Установить рейтинг  
-/setptid - Установить PlayTomic ID
-/getptid - Узнать PlayTomic ID
-/profile - Полный профиль
-/help - Помощь
-                """
+                welcome_text = messages.render_welcome(user.first_name, 0.0, new_user=True)
             else:
                 # Пользователь уже есть в БД
-                current_rating = get_rating(user.id)
-                welcome_text = f"""
-🎾 С возвращением, {user.first_name}!
-
-📊 Ваш текущий рейтинг: {current_rating}
-
-Доступные команды:
-/getrating - Узнать рейтинг
-/setrating - Установить рейтинг
-/setptid - Установить PlayTomic ID  
-/getptid - Узнать PlayTomic ID
-/profile - Полный профиль
-/help - Помощь
-                """
+                welcome_text = messages.render_welcome(user.first_name, profile.rating, new_user=False)
                 
         except Exception as e:
             logger.error(f"Error in start command: {e}")
-            welcome_text = f"""
-🎾 Добро пожаловать в Rating Bot, {user.first_name}!
-
-⚠️ Произошла ошибка при регистрации. Попробуйте позже.
-
-Доступные команды:
-/help - Помощь
-            """
+            welcome_text = messages.render_welcome_error(user.first_name)
         
         await safe_reply(update, welcome_text)
 
@@ -316,49 +464,7 @@ class RatingBot:
         """Команда /help"""
         is_user_admin = await is_admin(update, context)
         
-        if is_user_admin:
-            help_text = """
-🎾 Команды бота (Администратор):
-
-/start - Начать работу с ботом
-/getrating [аргумент] - Узнать рейтинг (свой или указанного пользователя)
-/setrating - Установить рейтинг
-/setptid - Установить PlayTomic ID
-/getptid - Узнать PlayTomic ID
-/profile - Полный профиль пользователя
-/createuser - Создать пользователя (только админы)
-/help - Показать эту справку
-
-📝 Форматы команд для админов:
-• /setrating @username 25 - по @username (если пользователь есть в БД)
-• /setrating 123456789 25 - по telegram_id (создает если нет)
-• /setrating 25 (в ответ) - в ответ на сообщение
-• /setrating 25 - себе
-
-• /createuser 123456789 25 john_player - создать нового пользователя
-• /getrating @username - рейтинг по @username
-• /getrating 123456789 - рейтинг по telegram_id
-            """
-        else:
-            help_text = """
-🎾 Команды бота:
-
-/start - Начать работу с ботом
-/getrating [аргумент] - Узнать рейтинг (свой или указанного пользователя)
-/setrating - Установить свой рейтинг
-/setptid - Установить свой PlayTomic ID
-/getptid - Узнать PlayTomic ID
-/profile - Свой профиль
-/help - Показать эту справку
-
-📝 Что вы можете:
-• /setrating 12 - установить себе рейтинг
-• /getrating @username - узнать рейтинг пользователя
-• /profile - посмотреть свой профиль
-
-💡 Администраторы могут устанавливать рейтинг другим:
-• /setrating @username 25
-            """
+        help_text = messages.HELP_ADMIN if is_user_admin else messages.HELP_USER
         
         await safe_reply(update, help_text)
 
@@ -368,6 +474,7 @@ class RatingBot:
         args = context.args
         target_user_id = None
         target_username = None
+        profile = None
         
         # Если это ответ на сообщение
         if update.message and update.message.reply_to_message:
@@ -376,7 +483,8 @@ class RatingBot:
             
         # Если указан @username
         elif args and len(args) == 1 and args[0].startswith('@'):
-            target_user_id = get_user_id_by_username(args[0])
+            profile = await storage.get_user_profile_by_username(args[0])
+            target_user_id = profile.telegram_id
             
             # Если не найден в БД, ищем в чате
             if target_user_id is None:
@@ -384,7 +492,7 @@ class RatingBot:
                 
                 if chat_user_id is not None:
                     # Найден в чате! Создаем в БД
-                    ensure_user_exists(chat_user_id, chat_username, chat_first_name)
+                    await storage.ensure_user_exists(chat_user_id, chat_username, chat_first_name)
                     target_user_id = chat_user_id
                     await safe_reply(update, f"✅ Пользователь {args[0]} найден в чате и добавлен в базу данных!")
                 else:
@@ -411,32 +519,15 @@ class RatingBot:
             target_user_id = update.effective_user.id
             target_username = "Ваш"
 
-        rating = get_rating(target_user_id)
-        pt_userid = get_pt_userid(target_user_id)
-        pt_info = f" (PlayTomic: {pt_userid})" if pt_userid else ""
-        
-        # Отладочная информация
-        debug_info = f"\n🔍 Отладка: target_user_id={target_user_id}, args={args}, current_user={update.effective_user.id}"
-        
-        # Если рейтинг равен 0, предлагаем установить его
-        if rating == 0.0:
-            if target_user_id == update.effective_user.id:
-                # Свой рейтинг
-                message = f"🏆 Ваш рейтинг: {rating}{pt_info}\n\n"
-                message += "💡 Ваш рейтинг не установлен! Используйте команду /setrating чтобы установить свой рейтинг из PlayTomic.\n"
-                message += "Пример: /setrating 3.5\n\n"
-                message += "📊 Шкала Playtomic: от 0.5 до 6.0 (6.0 = ПРО уровень)"
-            else:
-                # Чужой рейтинг
-                message = f"🏆 {target_username} рейтинг: {rating}{pt_info}\n\n"
-                message += f"💡 У пользователя {target_username} рейтинг не установлен."
-        else:
-            # Получаем описание рейтинга по шкале Playtomic
-            playtomic_message = get_playtomic_rating_message(rating)
-            message = f"🏆 {target_username} рейтинг: {rating}{pt_info}\n\n{playtomic_message}"
-        
-        # Добавляем отладочную информацию для тестирования
-        message += debug_info
+        if profile is None or profile.telegram_id != target_user_id:
+            profile = await storage.get_user_profile(target_user_id)
+        message = messages.render_rating(
+            target_username, profile.rating, profile.pt_userid, own=target_user_id == update.effective_user.id
+        )
+        # Отладочная информация - только при REPLY_DEBUG_INFO
+        message += messages.debug_suffix(
+            target_user_id=target_user_id, args=args, current_user=update.effective_user.id
+        )
         
         await safe_reply(update, message)
 
@@ -450,7 +541,7 @@ class RatingBot:
         is_user_admin = await is_admin(update, context)
         
         # Сохраняем/обновляем информацию о текущем пользователе
-        ensure_user_exists(current_user_id, current_username, current_first_name)
+        await storage.ensure_user_exists(current_user_id, current_username, current_first_name)
         
         # Определяем цель
         target_user_id = None
@@ -469,7 +560,7 @@ class RatingBot:
             target_display_name = target_first_name
             rating_val = parse_rating(args[0])
             # Сохраняем информацию о целевом пользователе
-            ensure_user_exists(target_user_id, target_username, target_first_name)
+            await storage.ensure_user_exists(target_user_id, target_username, target_first_name)
 
         # Вариант 2: /setrating @username <rating> (только для админов)
         elif len(args) == 2 and args[0].startswith('@') and parse_rating(args[1]) is not None:
@@ -477,7 +568,7 @@ class RatingBot:
                 return await safe_reply(update, "❌ Устанавливать рейтинг другим пользователям могут только администраторы чата.")
             
             # Сначала ищем в базе данных
-            target_user_id = get_user_id_by_username(args[0])
+            target_user_id = await storage.get_user_id_by_username(args[0])
             if target_user_id is not None:
                 # Пользователь найден в БД, получаем его данные
                 target_username = args[0].lstrip('@')
@@ -489,7 +580,7 @@ class RatingBot:
                 
                 if chat_user_id is not None:
                     # Найден в чате! Создаем в БД
-                    ensure_user_exists(chat_user_id, chat_username, chat_first_name)
+                    await storage.ensure_user_exists(chat_user_id, chat_username, chat_first_name)
                     target_user_id = chat_user_id
                     target_username = chat_username
                     target_first_name = chat_first_name
@@ -521,7 +612,7 @@ class RatingBot:
             rating_val = parse_rating(args[1])
             
             # Создаем пользователя если его нет (только для админов)
-            ensure_user_exists(target_user_id, None, None)
+            await storage.ensure_user_exists(target_user_id, None, None)
 
         # Вариант 4: /setrating <rating> — себе (доступно всем)
         elif len(args) == 1:
@@ -535,39 +626,29 @@ class RatingBot:
 
         if target_user_id is None or rating_val is None:
             if is_user_admin:
-                debug_info = f"\n🔍 Отладка: target_user_id={target_user_id}, rating_val={rating_val}, args={args}"
-                return await safe_reply(update, 
-                    "Использование:\n"
-                    "• В ответ на сообщение: /setrating 2.5\n"
-                    "• По @username: /setrating @john_doe 2,3\n"
-                    "• Себе: /setrating 2.0\n\n"
-                    "💡 Поддерживаются дробные числа: 2.5, 1,3, 0.7\n"
-                    "📊 Шкала Playtomic: от 0.5 до 6.0 (6.0 = ПРО уровень)" + debug_info
-                )
+                return await safe_reply(update, messages.SETRATING_USAGE_ADMIN + messages.debug_suffix(
+                    target_user_id=target_user_id, rating_val=rating_val, args=args
+                ))
             else:
-                return await safe_reply(update, 
-                    "Использование:\n"
-                    "• Себе: /setrating 2.5\n\n"
-                    "💡 Только администраторы могут устанавливать рейтинг другим пользователям.\n"
-                    "📊 Шкала Playtomic: от 0.5 до 6.0 (6.0 = ПРО уровень)"
-                )
+                return await safe_reply(update, messages.SETRATING_USAGE_USER)
 
         # Проверяем валидность рейтинга по шкале Playtomic
         if not is_valid_playtomic_rating(rating_val):
-            playtomic_message = get_playtomic_rating_message(rating_val)
-            return await safe_reply(update, f"❌ {playtomic_message}\n\n💡 Пожалуйста, введите корректное значение от 0.5 до 6.0")
+            return await safe_reply(update, messages.render_invalid_rating(rating_val))
         
-        set_rating(target_user_id, rating_val, target_username, target_first_name)
+        await storage.set_rating(target_user_id, rating_val, target_username, target_first_name)
+        leaderboard.record_rating(target_user_id, rating_val, target_username, target_first_name)
+        if is_group_chat(update.effective_chat):
+            remember_chat_member(update.effective_chat.id, target_user_id)
         
-        # Получаем сообщение о рейтинге
-        playtomic_message = get_playtomic_rating_message(rating_val)
-        await safe_reply(update, f"✅ Рейтинг {target_display_name} установлен: {rating_val}\n\n{playtomic_message}")
+        await safe_reply(update, messages.render_rating_set(target_display_name, rating_val))
 
     @staticmethod
     async def get_user_rating_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Получить рейтинг конкретного пользователя по ID, @username или в ответ на сообщение"""
         target_user_id = None
         target_username = None
+        profile = None
         
         # Если это ответ на сообщение
         if update.message and update.message.reply_to_message:
@@ -575,7 +656,8 @@ class RatingBot:
             target_username = update.message.reply_to_message.from_user.first_name
         # Если указан @username
         elif context.args and len(context.args) == 1 and context.args[0].startswith('@'):
-            target_user_id = get_user_id_by_username(context.args[0])
+            profile = await storage.get_user_profile_by_username(context.args[0])
+            target_user_id = profile.telegram_id
             
             # Если не найден в БД, ищем в чате
             if target_user_id is None:
@@ -583,7 +665,7 @@ class RatingBot:
                 
                 if chat_user_id is not None:
                     # Найден в чате! Создаем в БД
-                    ensure_user_exists(chat_user_id, chat_username, chat_first_name)
+                    await storage.ensure_user_exists(chat_user_id, chat_username, chat_first_name)
                     target_user_id = chat_user_id
                     await safe_reply(update, f"✅ Пользователь {context.args[0]} найден в чате и добавлен в базу данных!")
                 else:
@@ -604,8 +686,10 @@ class RatingBot:
             target_user_id = update.effective_user.id
             target_username = "Ваш"
 
-        rating = get_rating(target_user_id)
-        pt_userid = get_pt_userid(target_user_id)
+        if profile is None or profile.telegram_id != target_user_id:
+            profile = await storage.get_user_profile(target_user_id)
+        rating = profile.rating
+        pt_userid = profile.pt_userid
         pt_info = f" (PlayTomic: {pt_userid})" if pt_userid else ""
         await safe_reply(update, f"🏆 {target_username} рейтинг: {rating}{pt_info}")
 
@@ -654,7 +738,7 @@ class RatingBot:
                     "💡 Только администраторы могут устанавливать PlayTomic ID другим пользователям."
                 )
 
-        set_pt_userid(target_user_id, pt_userid)
+        await storage.set_pt_userid(target_user_id, pt_userid)
         who = "вам" if target_user_id == current_user_id else f"user_id={target_user_id}"
         await safe_reply(update, f"✅ PlayTomic ID {who} установлен: {pt_userid}")
 
@@ -676,7 +760,7 @@ class RatingBot:
             target_user_id = update.effective_user.id
             target_username = "Ваш"
 
-        pt_userid = get_pt_userid(target_user_id)
+        pt_userid = await storage.get_pt_userid(target_user_id)
         if pt_userid:
             await safe_reply(update, f"🎾 {target_username} PlayTomic ID: {pt_userid}")
         else:
@@ -700,8 +784,9 @@ class RatingBot:
             target_user_id = update.effective_user.id
             target_username = "Ваш"
 
-        rating = get_rating(target_user_id)
-        pt_userid = get_pt_userid(target_user_id)
+        profile = await storage.get_user_profile(target_user_id)
+        rating = profile.rating
+        pt_userid = profile.pt_userid
         
         profile_text = f"👤 {target_username} профиль:\n"
         profile_text += f"🏆 Рейтинг: {rating}\n"
@@ -723,38 +808,37 @@ class RatingBot:
             return await safe_reply(update, 
                 "Использование:\n"
                 "• /createuser <telegram_id> [rating] [playtomic_id]\n"
-                "• /createuser 123456789 25 john_player\n"
-                "• /createuser 987654321 15\n"
+                "• /createuser 123456789 3.5 john_player\n"
+                "• /createuser 987654321 1,5\n"
                 "• /createuser 555666777"
             )
 
+        # Рейтинг, если указан, проверяется по шкале Playtomic, как в /setrating
+        rating = 0
+        if len(args) > 1:
+            if not is_valid_rating(args[1]):
+                rating_val = parse_rating(args[1])
+                if rating_val is None:
+                    return await safe_reply(update, "❌ Некорректный рейтинг. Используйте число, например 3.5")
+                return await safe_reply(update, messages.render_invalid_rating(rating_val))
+            rating = parse_rating(args[1])
+
         try:
             telegram_id = int(args[0])
-            rating = int(args[1]) if len(args) > 1 and args[1].isdigit() else 0
             playtomic_id = args[2] if len(args) > 2 else None
             
-            # Проверяем, существует ли пользователь
-            existing_rating = get_rating(telegram_id)
-            if existing_rating is not None and telegram_id in [r[0] for r in get_all_users()]:
+            # Создаем пользователя вместе с рейтингом и PlayTomic ID одним запросом,
+            # если его ещё нет (проверка и вставка атомарны)
+            if not await storage.create_user(telegram_id, rating, playtomic_id):
                 return await safe_reply(update, f"❌ Пользователь с ID {telegram_id} уже существует в базе данных.")
-            
-            # Создаем пользователя
-            ensure_user_exists(telegram_id, None, None)
-            
-            # Устанавливаем рейтинг если указан
             if rating > 0:
-                set_rating(telegram_id, rating)
-            
-            # Устанавливаем PlayTomic ID если указан
-            if playtomic_id:
-                set_pt_userid(telegram_id, playtomic_id)
+                leaderboard.record_rating(telegram_id, rating)
             
             # Формируем ответ
             response = f"✅ Пользователь {telegram_id} создан!\n"
-            response += f"🏆 Рейтинг: {get_rating(telegram_id)}\n"
-            pt_id = get_pt_userid(telegram_id)
-            if pt_id:
-                response += f"🎾 PlayTomic ID: {pt_id}"
+            response += f"🏆 Рейтинг: {float(rating)}\n"
+            if playtomic_id:
+                response += f"🎾 PlayTomic ID: {playtomic_id}"
             
             await safe_reply(update, response)
             
@@ -871,8 +955,9 @@ class RatingBot:
             user = update.effective_user
             
             # Проверяем, есть ли пользователь в БД
-            if user_exists_in_db(user.id):
-                current_rating = get_rating(user.id)
+            profile = await storage.get_user_profile(user.id)
+            if profile.exists:
+                current_rating = profile.rating
                 response = f"✅ Вы есть в базе данных!\n"
                 response += f"👤 ID: {user.id}\n"
                 response += f"👤 Имя: {user.first_name}\n"
@@ -880,7 +965,7 @@ class RatingBot:
                 response += f"📊 Рейтинг: {current_rating}\n"
                 
                 # Проверяем PlayTomic ID
-                pt_id = get_pt_userid(user.id)
+                pt_id = profile.pt_userid
                 if pt_id:
                     response += f"🎾 PlayTomic ID: {pt_id}\n"
                 else:
@@ -896,14 +981,280 @@ class RatingBot:
             logger.error(f"Error in check_db command: {e}")
             await safe_reply(update, f"❌ Ошибка проверки БД: {e}")
 
-def get_all_users():
-    """Получить всех пользователей из базы данных"""
-    conn = get_db_connection()
-    try:
-        cursor = conn.execute("SELECT telegram_id, telegram_username, first_name, rating FROM user_ratings")
-        return cursor.fetchall()
-    finally:
-        conn.close()
+    @staticmethod
+    async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /history - последние изменения рейтинга (своего или указанного пользователя)"""
+        args = context.args
+        
+        # Если это ответ на сообщение
+        if update.message and update.message.reply_to_message:
+            target_user_id = update.message.reply_to_message.from_user.id
+            target_name = update.message.reply_to_message.from_user.first_name
+        # Если указан user_id
+        elif args and len(args) == 1 and args[0].isdigit():
+            target_user_id = int(args[0])
+            target_name = f"user_id={target_user_id}"
+        # Если указан @username
+        elif args and len(args) == 1 and args[0].startswith('@'):
+            target_user_id = await storage.get_user_id_by_username(args[0])
+            target_name = args[0]
+            if target_user_id is None:
+                return await safe_reply(update, f"❌ Пользователь {args[0]} не найден в базе данных.")
+        elif args:
+            return await safe_reply(update,
+                "Использование:\n"
+                "• /history - своя история рейтинга\n"
+                "• /history @username - история пользователя\n"
+                "• /history 123456789 - по telegram_id\n"
+                "• /history (в ответ на сообщение)"
+            )
+        else:
+            target_user_id = update.effective_user.id
+            target_name = "вашего"
+
+        history = await storage.get_rating_history(target_user_id, HISTORY_SIZE)
+        if not history:
+            return await safe_reply(update, f"📭 История рейтинга {target_name} пуста.")
+        await safe_reply(update, format_rating_history(target_name, history))
+
+    @staticmethod
+    async def match_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /match @a @b vs @c @d 6-4 6-3 - записать матч и пересчитать рейтинги"""
+        parsed = parse_match_args(context.args or [])
+        if parsed is None:
+            return await safe_reply(update, MATCH_USAGE)
+        team_a, team_b, score = parsed
+
+        players = []
+        names = []
+        for token in team_a + team_b:
+            resolved = await resolve_player(update, context, token)
+            if resolved is None:
+                return await safe_reply(update, f"❌ Игрок {token} не найден ни в базе данных, ни в чате.")
+            players.append(resolved[0])
+            names.append(resolved[1])
+        if len(set(players)) != 4:
+            return await safe_reply(update, "❌ В матче должны участвовать четыре разных игрока.")
+
+        # Записать матч могут его участники или администраторы чата
+        if update.effective_user.id not in players and not await is_admin(update, context):
+            return await safe_reply(update, "❌ Записать матч могут только его участники или администраторы чата.")
+
+        rated = {row[0] for row in await storage.get_ratings(players)}
+        unrated = [name for player, name in zip(players, names) if player not in rated]
+        if unrated:
+            return await safe_reply(update,
+                f"❌ Нет рейтинга у игроков: {', '.join(unrated)}\n\n"
+                "💡 Сначала установите рейтинг: /setrating 2.5"
+            )
+
+        chat = update.effective_chat
+        result = await storage.record_match(
+            players, score,
+            chat_id=chat.id if chat else None,
+            recorded_by=update.effective_user.id,
+        )
+        for player, rating in zip(players, result.after):
+            leaderboard.record_rating(player, rating)
+            if is_group_chat(chat):
+                remember_chat_member(chat.id, player)
+
+        winners = names[:2] if score.team_a_won else names[2:]
+        expected = result.expected_a if score.team_a_won else 1 - result.expected_a
+        lines = [
+            f"🎾 Матч записан: {names[0]} + {names[1]} vs {names[2]} + {names[3]} — {score}",
+            f"🏆 Победа: {' + '.join(winners)} (шансы по рейтингу {expected:.0%})",
+            "",
+        ]
+        for name, before, after in zip(names, result.before, result.after):
+            lines.append(f"{name}: {before} → {after} ({after - before:+.2f})")
+        await safe_reply(update, "\n".join(lines))
+
+    @staticmethod
+    async def replay_matches_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /replaymatches - пересчитать рейтинги по всей истории матчей (только админы)"""
+        if not await is_admin(update, context):
+            return await safe_reply(update, "❌ Команда доступна только администраторам чата.")
+        await safe_reply(update, "🔄 Пересчитываю рейтинги по истории матчей...")
+        ratings = await storage.replay_matches()
+        if not ratings:
+            return await safe_reply(update, "📭 Записанных матчей пока нет.")
+        # Рейтинги изменились пачкой - индексы топа перечитаем из базы
+        leaderboard.clear()
+        await safe_reply(update, f"✅ Рейтинги пересчитаны: {len(ratings)} игроков.")
+
+    @staticmethod
+    async def import_ratings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /importratings - массовый импорт рейтингов из CSV/JSON (только админы)
+
+        Файл прикладывается к сообщению с командой в подписи или команда
+        отправляется ответом на сообщение с файлом.
+        """
+        if not await is_admin(update, context):
+            return await safe_reply(update, "❌ Команда доступна только администраторам чата.")
+        message = update.message
+        document = None
+        if message:
+            document = message.document
+            if document is None and message.reply_to_message:
+                document = message.reply_to_message.document
+        if document is None:
+            return await safe_reply(update, IMPORT_USAGE)
+        if document.file_size and document.file_size > settings.IMPORT_MAX_FILE_SIZE:
+            return await safe_reply(
+                update, f"❌ Файл слишком большой (максимум {settings.IMPORT_MAX_FILE_SIZE // 1024} КБ)."
+            )
+
+        telegram_file = await document.get_file()
+        data = await telegram_file.download_as_bytearray()
+        try:
+            summary = await rating_io.import_ratings_bytes(bytes(data), document.file_name)
+        except UnicodeDecodeError:
+            return await safe_reply(update, "❌ Файл должен быть в кодировке UTF-8.")
+        if summary.imported:
+            # Рейтинги изменились пачкой - индексы топа перечитаем из базы
+            leaderboard.clear()
+        await safe_reply(update, rating_io.format_summary(summary))
+
+    @staticmethod
+    async def export_ratings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /exportratings [csv|jsonl|parquet] - выгрузка всех рейтингов файлом (только админы)"""
+        if not await is_admin(update, context):
+            return await safe_reply(update, "❌ Команда доступна только администраторам чата.")
+
+        fmt = (context.args[0].lower() if context.args else "csv")
+        if fmt not in rating_io.EXPORT_FORMATS or not update.message:
+            return await safe_reply(update, EXPORT_USAGE)
+
+        # Файл пишется на диск по мере чтения базы, но при отправке InputFile
+        # python-telegram-bot читает его в память целиком - поэтому размер
+        # ограничен EXPORT_MAX_FILE_SIZE, большие выгрузки делаются через CLI
+        with tempfile.TemporaryDirectory() as directory:
+            filename = f"ratings_{datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+            path = os.path.join(directory, filename)
+            try:
+                count = await rating_io.export_ratings(path, fmt)
+            except RuntimeError as e:
+                return await safe_reply(update, f"❌ {e}")
+            if os.path.getsize(path) > settings.EXPORT_MAX_FILE_SIZE:
+                return await safe_reply(
+                    update,
+                    f"❌ Выгрузка больше {settings.EXPORT_MAX_FILE_SIZE // (1024 * 1024)} МБ и не может быть "
+                    f"отправлена в чат. Используйте: python ratings_tool.py export ratings.{fmt}",
+                )
+            with open(path, "rb") as document:
+                await update.message.reply_document(
+                    document=document, filename=filename, caption=f"📤 Экспорт рейтингов: {count} пользователей"
+                )
+
+    @staticmethod
+    async def teams_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /teams @p1 @p2 ... - сбалансированные пары 2 на 2 по кортам"""
+        tokens = context.args or []
+        if (len(tokens) < 4 or len(tokens) % 4 or len(tokens) > TEAMS_MAX_PLAYERS
+                or not all(token.startswith('@') or token.isdigit() for token in tokens)):
+            return await safe_reply(update, TEAMS_USAGE)
+
+        # Рейтинги всех игроков - одним запросом
+        rows = await storage.get_players(
+            [int(token) for token in tokens if token.isdigit()],
+            [token for token in tokens if token.startswith('@')],
+        )
+        by_id = {row[0]: row for row in rows}
+        by_username = {row[2].lower(): row for row in rows if row[2]}
+
+        players = []
+        names = {}
+        missing = []
+        for token in tokens:
+            row = by_id.get(int(token)) if token.isdigit() else by_username.get(token.lstrip('@').lower())
+            if row is None or not row[1] or row[1] <= 0:
+                missing.append(token)
+                continue
+            if row[0] in names:
+                return await safe_reply(update, f"❌ Игрок {token} указан дважды.")
+            names[row[0]] = token if token.startswith('@') else (row[3] or token)
+            players.append((row[0], row[1]))
+        if missing:
+            return await safe_reply(update,
+                f"❌ Не найдены или без рейтинга: {', '.join(missing)}\n\n"
+                "💡 Игрокам нужно написать боту /start и установить рейтинг: /setrating 2.5"
+            )
+
+        # Отжиг для больших составов занимает до TEAMS_TIME_BUDGET - не держим event loop
+        lineup = await asyncio.to_thread(balance_teams, players, settings.TEAMS_TIME_BUDGET)
+        await safe_reply(update, format_lineup(lineup, names))
+
+    @staticmethod
+    async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /leaderboard [N] - топ игроков чата"""
+        args = context.args
+        limit = LEADERBOARD_DEFAULT_SIZE
+        if args:
+            if len(args) != 1 or not args[0].isdigit() or int(args[0]) < 1:
+                return await safe_reply(update,
+                    "Использование:\n"
+                    f"• /leaderboard - топ-{LEADERBOARD_DEFAULT_SIZE} игроков чата\n"
+                    f"• /leaderboard 20 - топ-20 (не больше {LEADERBOARD_MAX_SIZE})"
+                )
+            limit = min(int(args[0]), LEADERBOARD_MAX_SIZE)
+
+        # В личке показываем общий топ, в группе - только участников чата
+        chat = update.effective_chat
+        chat_id = chat.id if is_group_chat(chat) else None
+        entries = await leaderboard.top(chat_id, limit)
+        if not entries:
+            return await safe_reply(update,
+                "📭 Пока нет игроков с рейтингом.\n\n"
+                "💡 Установите себе рейтинг: /setrating 2.5"
+            )
+
+        title = f"🏆 Топ-{limit} игроков чата:" if chat_id is not None else f"🏆 Топ-{limit} игроков:"
+        lines = [title, ""] + [format_leaderboard_entry(entry) for entry in entries]
+
+        user = update.effective_user
+        if user is not None:
+            rank, total = await leaderboard.rank(chat_id, user.id)
+            if rank is not None and rank > len(entries):
+                lines += ["", f"📍 Ваше место: {rank} из {total}"]
+            elif rank is None:
+                lines += ["", "📍 У вас ещё нет рейтинга: /setrating 2.5"]
+
+        await safe_reply(update, "\n".join(lines))
+
+    @staticmethod
+    async def track_chat_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запоминаем авторов сообщений в группах - из них строится топ чата"""
+        if update.chat_member or update.my_chat_member:
+            # Актор изменения состава - не обязательно участник; обрабатывает chat_member_update
+            return
+        chat = update.effective_chat
+        user = update.effective_user
+        if not is_group_chat(chat) or user is None or user.is_bot:
+            return
+        remember_chat_member(chat.id, user.id, user.username, user.first_name)
+
+    @staticmethod
+    async def chat_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обновления chat_member / my_chat_member - сбрасываем кэши прав и поиска участников"""
+        if update.chat_member:
+            member_update = update.chat_member
+            chat_id = member_update.chat.id
+            member = member_update.new_chat_member
+            admin_cache.invalidate((chat_id, member.user.id))
+            if member.status in (ChatMemberStatus.LEFT, ChatMemberStatus.BANNED):
+                forget_chat_member(chat_id, member.user.id)
+            elif not member.user.is_bot:
+                remember_chat_member(chat_id, member.user.id, member.user.username, member.user.first_name)
+        elif update.my_chat_member:
+            # Изменились права самого бота - сведения по чату могли устареть целиком
+            chat_id = update.my_chat_member.chat.id
+            admin_cache.invalidate_matching(lambda key: key[0] == chat_id)
+        else:
+            return
+        # Состав чата изменился - результаты поиска по @username для него тоже сбрасываем
+        chat_admins_cache.invalidate(chat_id)
+        user_lookup_cache.invalidate_matching(lambda key: key[0] == chat_id)
 
     @staticmethod
     async def get_user_id_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -922,8 +1273,9 @@ def get_all_users():
             response += f"📝 Username: @{target_user.username or 'нет'}\n"
             
             # Проверяем, есть ли в базе
-            rating = get_rating(target_user.id)
-            pt_id = get_pt_userid(target_user.id)
+            profile = await storage.get_user_profile(target_user.id)
+            rating = profile.rating
+            pt_id = profile.pt_userid
             response += f"🏆 Рейтинг в БД: {rating}\n"
             if pt_id:
                 response += f"🎾 PlayTomic ID: {pt_id}"
@@ -933,13 +1285,14 @@ def get_all_users():
         # Если указан @username
         elif args and len(args) == 1 and args[0].startswith('@'):
             username = args[0]
-            telegram_id = get_user_id_by_username(username)
+            profile = await storage.get_user_profile_by_username(username)
+            telegram_id = profile.telegram_id
             
-            if telegram_id is None:
+            if not profile.exists:
                 await safe_reply(update, f"❌ Пользователь {username} не найден в базе данных.")
             else:
-                rating = get_rating(telegram_id)
-                pt_id = get_pt_userid(telegram_id)
+                rating = profile.rating
+                pt_id = profile.pt_userid
                 
                 response = f"👤 Информация о {username}:\n"
                 response += f"🆔 Telegram ID: {telegram_id}\n"
@@ -954,3 +1307,39 @@ def get_all_users():
                 "• В ответ на сообщение: /getuserid\n"
                 "• По @username: /getuserid @john_doe"
             )
+
+def register_handlers(application):
+    """Зарегистрировать обработчики бота (общие для webhook и polling)"""
+    application.add_handler(CommandHandler("start", RatingBot.start_command))
+    application.add_handler(CommandHandler("help", RatingBot.help_command))
+    application.add_handler(CommandHandler("getrating", RatingBot.get_rating_command))
+    application.add_handler(CommandHandler("getuserrating", RatingBot.get_user_rating_command))
+    application.add_handler(CommandHandler("setrating", RatingBot.set_rating_command))
+    application.add_handler(CommandHandler("setptid", RatingBot.set_pt_userid_command))
+    application.add_handler(CommandHandler("getptid", RatingBot.get_pt_userid_command))
+    application.add_handler(CommandHandler("profile", RatingBot.get_profile_command))
+    application.add_handler(CommandHandler("createuser", RatingBot.create_user_command))
+    application.add_handler(CommandHandler("getuserid", RatingBot.get_user_id_command))
+    application.add_handler(CommandHandler("debugchat", RatingBot.debug_chat_command))
+    application.add_handler(CommandHandler("test", RatingBot.test_command))
+    application.add_handler(CommandHandler("finduser", RatingBot.find_user_command))
+    application.add_handler(CommandHandler("checkdb", RatingBot.check_db_command))
+    application.add_handler(CommandHandler("leaderboard", RatingBot.leaderboard_command))
+    application.add_handler(CommandHandler("history", RatingBot.history_command))
+    application.add_handler(CommandHandler("match", RatingBot.match_command))
+    application.add_handler(CommandHandler("teams", RatingBot.teams_command))
+    application.add_handler(CommandHandler("replaymatches", RatingBot.replay_matches_command))
+    application.add_handler(CommandHandler("importratings", RatingBot.import_ratings_command))
+    application.add_handler(CommandHandler("exportratings", RatingBot.export_ratings_command))
+    # Файл с командой в подписи - CommandHandler подписи не видит
+    application.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/importratings(@\w+)?(\s|$)"),
+        RatingBot.import_ratings_command,
+    ))
+    application.add_handler(ChatMemberHandler(RatingBot.chat_member_update, ChatMemberHandler.ANY_CHAT_MEMBER))
+    # Группа -1: срабатывает для каждого обновления до команд и не мешает им
+    application.add_handler(TypeHandler(Update, RatingBot.track_chat_activity), group=-1)
+    # Время и ошибки каждого обработчика - в /metrics, вызовы - span'ами в трассу
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = metrics.instrument_handler(tracing.traced()(handler.callback))
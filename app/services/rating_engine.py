@@ -0,0 +1,164 @@
+"""
+Пересчёт рейтинга по результатам матчей 2 на 2 (Elo на шкале Playtomic 0.5-6.0)
+
+Рейтинг команды - среднее рейтингов игроков. Ожидаемый результат команды A:
+
+    E = 1 / (1 + 10 ** ((R_b - R_a) / ELO_SCALE))
+
+Оба игрока команды получают одинаковое изменение K * (S - E) * margin, где
+S - 1 за победу и 0 за поражение, margin растёт с разницей геймов. После
+каждого матча рейтинг ограничивается шкалой и округляется до сотых. Формулы
+записаны через NumPy и одинаково работают для одного матча и для массива
+матчей: replay() пересчитывает всю историю "раундами" - матчами, в которых
+ни один игрок не встречается дважды, поэтому каждый раунд считается одной
+векторной операцией.
+"""
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.rating_scale import MIN_RATING, MAX_RATING
+
+# Разница в 1.0 уровня даёт более сильной команде ~85% ожидаемых побед
+ELO_SCALE = 1.3
+# Наибольшее изменение рейтинга за матч без учёта разницы геймов
+ELO_K = 0.1
+# Разница геймов, при которой множитель margin достигает 2
+MARGIN_GAMES = 12
+
+_SET_RE = re.compile(r"^(\d{1,2})[-:](\d{1,2})$")
+
+
+class MatchScore(NamedTuple):
+    """Счёт матча с точки зрения команды A"""
+    sets: Tuple[Tuple[int, int], ...]
+    sets_a: int
+    sets_b: int
+    games_a: int
+    games_b: int
+
+    @property
+    def team_a_won(self) -> bool:
+        if self.sets_a != self.sets_b:
+            return self.sets_a > self.sets_b
+        return self.games_a > self.games_b
+
+    def __str__(self):
+        return " ".join(f"{a}-{b}" for a, b in self.sets)
+
+
+class MatchResult(NamedTuple):
+    """Рейтинги четырёх игроков (a1, a2, b1, b2) до и после матча"""
+    before: Tuple[float, float, float, float]
+    after: Tuple[float, float, float, float]
+    expected_a: float
+
+
+def parse_score(tokens: List[str]) -> Optional[MatchScore]:
+    """Разобрать счёт вида ["6-4", "6-3"]; None - если счёт некорректен"""
+    if not tokens or len(tokens) > 5:
+        return None
+    sets = []
+    for token in tokens:
+        match = _SET_RE.match(token.strip())
+        if not match:
+            return None
+        games_a, games_b = int(match.group(1)), int(match.group(2))
+        if games_a == games_b:
+            return None
+        sets.append((games_a, games_b))
+    sets_a = sum(1 for a, b in sets if a > b)
+    score = MatchScore(
+        tuple(sets),
+        sets_a,
+        len(sets) - sets_a,
+        sum(a for a, _ in sets),
+        sum(b for _, b in sets),
+    )
+    if score.sets_a == score.sets_b and score.games_a == score.games_b:
+        # Победителя определить нельзя
+        return None
+    return score
+
+
+def expected_score(team_a, team_b):
+    """Ожидаемый результат команды A (скаляр или массив)"""
+    return 1.0 / (1.0 + np.power(10.0, (np.asarray(team_b) - np.asarray(team_a)) / ELO_SCALE))
+
+
+def rating_deltas(team_a, team_b, team_a_won, game_diff):
+    """Изменение рейтинга каждого игрока команды A (у команды B - с обратным знаком)"""
+    expected = expected_score(team_a, team_b)
+    actual = np.asarray(team_a_won, dtype=float)
+    margin = 1.0 + np.minimum(np.abs(np.asarray(game_diff, dtype=float)), MARGIN_GAMES) / MARGIN_GAMES
+    return ELO_K * (actual - expected) * margin, expected
+
+
+def clamp(ratings):
+    """Ограничить шкалой Playtomic и округлить до сотых (так рейтинг хранится)"""
+    return np.round(np.clip(ratings, MIN_RATING, MAX_RATING), 2)
+
+
+def rate_match(ratings: Tuple[float, float, float, float], score: MatchScore) -> MatchResult:
+    """Новые рейтинги игроков (a1, a2, b1, b2) после одного матча"""
+    a1, a2, b1, b2 = ratings
+    delta, expected = rating_deltas(
+        (a1 + a2) / 2, (b1 + b2) / 2, score.team_a_won, score.games_a - score.games_b
+    )
+    after = clamp(np.array([a1 + delta, a2 + delta, b1 - delta, b2 - delta]))
+    return MatchResult(
+        tuple(float(r) for r in ratings),
+        tuple(float(r) for r in after),
+        float(expected),
+    )
+
+
+def schedule_rounds(players: np.ndarray) -> np.ndarray:
+    """Номер раунда для каждого матча: матчи одного раунда не делят игроков,
+    а для каждого игрока порядок его матчей сохраняется"""
+    last_round = {}
+    rounds = np.empty(len(players), dtype=np.int64)
+    for index, row in enumerate(players.tolist()):
+        current = max(last_round.get(player, -1) for player in row) + 1
+        rounds[index] = current
+        for player in row:
+            last_round[player] = current
+    return rounds
+
+
+def replay(players, team_a_won, game_diff, initial: dict) -> dict:
+    """Пересчитать рейтинги по всей истории матчей.
+
+    players - массив (n, 4) telegram_id в порядке a1, a2, b1, b2, матчи в
+    хронологическом порядке; initial - рейтинг каждого игрока до первого матча.
+    Возвращает {telegram_id: рейтинг после всех матчей}.
+    """
+    players = np.asarray(players, dtype=np.int64).reshape(-1, 4)
+    if len(players) == 0:
+        return {}
+    team_a_won = np.asarray(team_a_won, dtype=bool)
+    game_diff = np.asarray(game_diff, dtype=np.int64)
+
+    # telegram_id -> позиция в плотном массиве рейтингов
+    ids, slots = np.unique(players, return_inverse=True)
+    slots = slots.reshape(-1, 4)
+    ratings = np.array([initial[telegram_id] for telegram_id in ids.tolist()], dtype=float)
+
+    rounds = schedule_rounds(players)
+    order = np.argsort(rounds, kind="stable")
+    boundaries = np.flatnonzero(np.diff(rounds[order])) + 1
+    for batch in np.split(order, boundaries):
+        current = slots[batch]
+        team_a = ratings[current[:, :2]].mean(axis=1)
+        team_b = ratings[current[:, 2:]].mean(axis=1)
+        delta, _ = rating_deltas(team_a, team_b, team_a_won[batch], game_diff[batch])
+        # В пределах раунда игроки не повторяются - присваивание по индексам безопасно
+        ratings[current[:, 0]] += delta
+        ratings[current[:, 1]] += delta
+        ratings[current[:, 2]] -= delta
+        ratings[current[:, 3]] -= delta
+        touched = current.ravel()
+        ratings[touched] = clamp(ratings[touched])
+
+    return {telegram_id: float(rating) for telegram_id, rating in zip(ids.tolist(), ratings)}
@@ -0,0 +1,302 @@
+"""
+Массовый импорт и экспорт рейтингов (/importratings, /exportratings и ratings_tool.py)
+
+Файл читается построчно: CSV (разделитель "," или ";", заголовок обязателен),
+JSONL (по объекту на строку) или JSON-массив объектов. Колонки:
+
+    telegram_id, username, first_name, rating
+
+Игрок определяется по telegram_id или @username (username ищется в базе
+одним запросом), рейтинг разбирается parse_rating (точка или запятая) и
+проверяется по шкале Playtomic. Все корректные строки записываются одной
+транзакцией (storage.import_ratings), ошибочные попадают в сводку с номером
+строки. Если игрок встречается в файле несколько раз, действует последняя строка.
+
+Экспорт читает user_ratings пачками (storage.iter_users) и дописывает файл
+по мере чтения - CSV, JSONL или Parquet (нужен pyarrow), память не зависит
+от числа пользователей. Экспортированный CSV/JSONL можно импортировать обратно.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.core.rating_scale import parse_rating, is_valid_playtomic_rating
+from app.services import storage
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - Parquet необязателен
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "json", "jsonl")
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = ("telegram_id", "username", "first_name", "rating", "pt_userid", "created_at", "updated_at")
+SUMMARY_MAX_ERRORS = 10
+
+_ID_COLUMNS = ("telegram_id", "id", "user_id")
+_USERNAME_COLUMNS = ("username", "telegram_username")
+
+
+class ImportRow(NamedTuple):
+    """Разобранная строка файла"""
+    line: int
+    telegram_id: Optional[int]
+    username: Optional[str]
+    first_name: Optional[str]
+    rating: float
+
+
+class ImportSummary(NamedTuple):
+    """Итог импорта"""
+    created: int
+    updated: int
+    unchanged: int
+    errors: List[Tuple[int, str]]
+
+    @property
+    def imported(self) -> int:
+        return self.created + self.updated
+
+
+def detect_format(filename: str = None, head: str = "") -> str:
+    """Формат по расширению файла, а без него - по первому символу содержимого"""
+    if filename:
+        extension = filename.rsplit(".", 1)[-1].lower()
+        if extension in FORMATS:
+            return extension
+        if extension == "ndjson":
+            return "jsonl"
+    stripped = head.lstrip("\ufeff \t\r\n")
+    if stripped.startswith("["):
+        return "json"
+    if stripped.startswith("{"):
+        return "jsonl"
+    return "csv"
+
+
+def _records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """(номер строки, словарь колонок) - по мере чтения файла"""
+    if fmt == "csv":
+        lines = iter(lines)
+        header = next(lines, "")
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        reader = csv.DictReader(_chain_first(header, lines), delimiter=delimiter)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(lines, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, ValueError(f"некорректный JSON: {e.msg}")
+    elif fmt == "json":
+        # Массив нельзя разобрать по частям - читаем целиком
+        records = json.loads("".join(lines))
+        if not isinstance(records, list):
+            raise ValueError("JSON должен быть массивом объектов")
+        for index, record in enumerate(records, 1):
+            yield index, record
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+
+def _chain_first(first: str, rest: Iterator[str]) -> Iterator[str]:
+    yield first
+    yield from rest
+
+
+def _field(record: dict, names) -> Optional[str]:
+    for name in names:
+        value = record.get(name)
+        if value is not None and str(value).strip():
+            return str(value).strip()
+    return None
+
+
+def parse_rows(lines: Iterable[str], fmt: str) -> Iterator[object]:
+    """Разобрать файл: ImportRow для корректных строк, (строка, ошибка) - для остальных"""
+    for line_number, record in _records(lines, fmt):
+        if isinstance(record, Exception):
+            yield line_number, str(record)
+            continue
+        if not isinstance(record, dict):
+            yield line_number, "ожидается объект с колонками"
+            continue
+        record = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+
+        telegram_id = _field(record, _ID_COLUMNS)
+        username = _field(record, _USERNAME_COLUMNS)
+        if telegram_id is not None:
+            if not telegram_id.isdigit():
+                yield line_number, f"некорректный telegram_id: {telegram_id}"
+                continue
+            telegram_id = int(telegram_id)
+        if username is not None:
+            username = username.lstrip("@") or None
+        if telegram_id is None and username is None:
+            yield line_number, "не указан telegram_id или username"
+            continue
+
+        raw_rating = _field(record, ("rating",))
+        rating = parse_rating(raw_rating) if raw_rating is not None else None
+        if rating is None:
+            yield line_number, f"некорректный рейтинг: {raw_rating}"
+            continue
+        if not is_valid_playtomic_rating(rating):
+            yield line_number, f"рейтинг {rating} вне шкалы Playtomic (0.5-6.0)"
+            continue
+        yield ImportRow(line_number, telegram_id, username, _field(record, ("first_name",)), rating)
+
+
+async def import_ratings(lines: Iterable[str], fmt: str) -> ImportSummary:
+    """Разобрать файл и записать все корректные строки одной транзакцией"""
+    errors = []
+    rows = []
+    try:
+        for item in parse_rows(lines, fmt):
+            if isinstance(item, ImportRow):
+                rows.append(item)
+            else:
+                errors.append(item)
+    except (ValueError, csv.Error) as e:
+        # Файл не разбирается целиком (битый JSON-массив, неизвестный формат)
+        return ImportSummary(0, 0, 0, errors + [(0, str(e))])
+
+    # Игроки без telegram_id - по username одним запросом
+    usernames = {row.username.lower() for row in rows if row.telegram_id is None}
+    by_username = {}
+    if usernames:
+        for telegram_id, _, username, _ in await storage.get_players(usernames=list(usernames)):
+            if username:
+                by_username[username.lower()] = telegram_id
+
+    players = {}
+    for row in rows:
+        telegram_id = row.telegram_id
+        if telegram_id is None:
+            telegram_id = by_username.get(row.username.lower())
+            if telegram_id is None:
+                errors.append((row.line, f"пользователь @{row.username} не найден в базе"))
+                continue
+        players[telegram_id] = (telegram_id, row.rating, row.username, row.first_name)
+
+    created, updated, unchanged = await storage.import_ratings(players.values()) if players else ([], [], [])
+    errors.sort()
+    logger.info(
+        f"Rating import: {len(created)} created, {len(updated)} updated, "
+        f"{len(unchanged)} unchanged, {len(errors)} errors"
+    )
+    return ImportSummary(len(created), len(updated), len(unchanged), errors)
+
+
+async def import_ratings_bytes(data: bytes, filename: str = None) -> ImportSummary:
+    """Импорт из содержимого загруженного файла"""
+    text = data.decode("utf-8-sig")
+    fmt = detect_format(filename, text[:64])
+    return await import_ratings(io.StringIO(text, newline=""), fmt)
+
+
+def format_summary(summary: ImportSummary, max_errors: int = SUMMARY_MAX_ERRORS) -> str:
+    """Текст сводки для ответа бота и вывода CLI"""
+    lines = [
+        "📥 Импорт рейтингов:",
+        f"✅ Новых игроков: {summary.created}",
+        f"🔄 Обновлено: {summary.updated}",
+        f"➖ Без изменений: {summary.unchanged}",
+        f"❌ Ошибок: {len(summary.errors)}",
+    ]
+    for line_number, message in summary.errors[:max_errors]:
+        lines.append(f"  • строка {line_number}: {message}" if line_number else f"  • {message}")
+    if len(summary.errors) > max_errors:
+        lines.append(f"  … и ещё {len(summary.errors) - max_errors}")
+    return "\n".join(lines)
+
+
+def _export_record(row) -> dict:
+    record = dict(zip(EXPORT_FIELDS, row))
+    for key in ("created_at", "updated_at"):
+        if record[key] is not None:
+            record[key] = record[key].isoformat(sep=" ")
+    return record
+
+
+def _parquet_schema():
+    return pyarrow.schema([
+        ("telegram_id", pyarrow.int64()),
+        ("username", pyarrow.string()),
+        ("first_name", pyarrow.string()),
+        ("rating", pyarrow.float64()),
+        ("pt_userid", pyarrow.string()),
+        ("created_at", pyarrow.timestamp("us")),
+        ("updated_at", pyarrow.timestamp("us")),
+    ])
+
+
+async def export_ratings(path: str, fmt: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Выгрузить всех пользователей в файл path по мере чтения; возвращает число строк"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    if fmt == "parquet" and pyarrow is None:
+        raise RuntimeError("Для экспорта в Parquet нужен пакет pyarrow")
+
+    if fmt == "parquet":
+        count = await _export_parquet(path, chunk_size)
+    else:
+        count = await _export_text(path, fmt, chunk_size)
+    logger.info(f"Rating export: {count} users -> {path} ({fmt})")
+    return count
+
+
+async def _export_parquet(path: str, chunk_size: int) -> int:
+    # Запись файла (кодирование и сжатие пачек) идёт в потоке, чтобы большая
+    # выгрузка не останавливала цикл событий; чтение базы остаётся пачками
+    count = 0
+    schema = _parquet_schema()
+    writer = await asyncio.to_thread(pyarrow.parquet.ParquetWriter, path, schema)
+    try:
+        async for rows in storage.iter_users(chunk_size):
+            # Пачка - одна row group: в памяти только текущая пачка
+            await asyncio.to_thread(_write_parquet_batch, writer, schema, rows)
+            count += len(rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return count
+
+
+def _write_parquet_batch(writer, schema, rows: List[tuple]):
+    columns = list(zip(*rows))
+    writer.write_batch(pyarrow.record_batch(
+        [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    ))
+
+
+async def _export_text(path: str, fmt: str, chunk_size: int) -> int:
+    # Файловые операции - в потоке, как и для Parquet
+    count = 0
+    out = await asyncio.to_thread(open, path, "w", encoding="utf-8", newline="")
+    try:
+        writer = csv.writer(out) if fmt == "csv" else None
+        if writer is not None:
+            await asyncio.to_thread(writer.writerow, EXPORT_FIELDS)
+        async for rows in storage.iter_users(chunk_size):
+            await asyncio.to_thread(_write_text_chunk, out, writer, rows)
+            count += len(rows)
+    finally:
+        await asyncio.to_thread(out.close)
+    return count
+
+
+def _write_text_chunk(out, writer, rows: List[tuple]):
+    if writer is not None:
+        writer.writerows(_export_record(row).values() for row in rows)
+    else:
+        out.writelines(json.dumps(_export_record(row), ensure_ascii=False) + "\n" for row in rows)
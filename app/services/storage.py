@@ -0,0 +1,680 @@
+"""
+Асинхронный слой хранения для обработчиков бота.
+
+Повторяет синхронные хелперы из rating_bot.py: запросы - обычный sqlite3 на
+долгоживущих подключениях pool (писатель + читатели, app.models.sqlite_pool),
+но выполняются в потоках DB-исполнителя, поэтому обращение к базе не
+блокирует event loop. Каждый вызов - одна передача в поток: все запросы
+функции (и транзакция записи целиком) идут там без ORM-сессии и без
+переключения на каждый execute. Запись идёт в одном потоке писателя в
+порядке вызова, чтения в режиме WAL идут параллельно.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from app.core.config import settings
+from app.core.metrics import timed_db
+from app.services.cache import TTLCache
+from app.services.write_behind import WriteBehindBuffer
+from app.models.database import pool
+from app.services import rating_engine
+
+logger = logging.getLogger(__name__)
+
+# Потоки для запросов: по одному на читателя пула и один поток писателя -
+# транзакции записи выполняются строго в порядке вызова _write
+_read_executor = ThreadPoolExecutor(max_workers=settings.SQLITE_READ_POOL_SIZE, thread_name_prefix="db-read")
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+# Ограничение SQLite на число параметров в одном запросе
+_CHUNK = 500
+
+
+class UserProfile(NamedTuple):
+    """Компактная запись пользователя для обработчиков команд"""
+    telegram_id: Optional[int]
+    exists: bool
+    rating: float
+    pt_userid: str
+    username: Optional[str]
+    first_name: Optional[str]
+
+
+def _in_reader(query):
+    with pool.reader() as conn:
+        return query(conn)
+
+
+def _in_writer(transaction):
+    with pool.writer() as conn:
+        return transaction(conn)
+
+
+async def _read(query):
+    """Выполнить query(conn) на подключении-читателе в потоке DB"""
+    return await asyncio.get_running_loop().run_in_executor(_read_executor, _in_reader, query)
+
+
+async def _write(transaction):
+    """Выполнить transaction(conn) на писателе в потоке DB (commit при успехе).
+
+    Транзакция ставится в очередь писателя сразу при вызове: записи,
+    начатые раньше, и коммитятся раньше.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_write_executor, _in_writer, transaction)
+
+
+def _execute(conn, sql: str, params=()):
+    """Курсор со строками-кортежами (без sqlite3.Row)"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params)
+
+
+def _placeholders(count: int) -> str:
+    return ", ".join("?" * count)
+
+
+# Известные профили (telegram_id -> (username, first_name)) - чтобы не писать
+# в базу, когда ничего не изменилось. None - пользователь есть, профиль неизвестен.
+known_profiles = TTLCache(maxsize=settings.PROFILE_CACHE_SIZE, ttl=settings.PROFILE_CACHE_TTL)
+_UNKNOWN = object()
+
+_INSERT_USER = (
+    "INSERT INTO user_ratings (telegram_id, telegram_username, first_name, rating, created_at, updated_at) "
+    "VALUES (?, ?, ?, 0, ?, ?)"
+)
+# INSERT ... ON CONFLICT DO UPDATE, который не трогает строку без изменений
+_PROFILE_UPSERT = (
+    _INSERT_USER
+    + " ON CONFLICT (telegram_id) DO UPDATE SET telegram_username = excluded.telegram_username, "
+    "first_name = excluded.first_name, updated_at = excluded.updated_at "
+    "WHERE telegram_username IS NOT excluded.telegram_username OR first_name IS NOT excluded.first_name"
+)
+
+
+def _ensure_user(conn, telegram_id: int, username: str = None, first_name: str = None):
+    """Создать/обновить пользователя в рамках уже открытой транзакции"""
+    now = datetime.now()
+    if username is None and first_name is None:
+        # Профиль неизвестен - только создаём запись, если её нет
+        conn.execute(_INSERT_USER + " ON CONFLICT (telegram_id) DO NOTHING", (telegram_id, None, None, now, now))
+        return
+    # username и first_name могут измениться - обновляем, только если они другие
+    conn.execute(_PROFILE_UPSERT, (telegram_id, username, first_name, now, now))
+
+
+def _claim_profile(telegram_id: int, username: str = None, first_name: str = None):
+    """Снять из profile_writes профиль, который сейчас будет записан напрямую.
+
+    Вызывается до _write: сброс буфера, уже забравший старое значение, стоит
+    в очереди писателя раньше и не перезапишет новый профиль, а более поздние
+    изменения (record_profile во время записи) остаются в очереди.
+    """
+    if username is not None or first_name is not None:
+        profile_writes.discard(telegram_id)
+
+
+def _remember_profile(telegram_id: int, username: str = None, first_name: str = None):
+    """Запомнить записанный профиль"""
+    if username is None and first_name is None:
+        if known_profiles.get(telegram_id, _UNKNOWN) is _UNKNOWN:
+            known_profiles.set(telegram_id, None)
+        return
+    known_profiles.set(telegram_id, (username, first_name))
+
+
+@timed_db
+async def _flush_profiles(items: dict):
+    """Записать накопленные изменения профилей одной транзакцией"""
+    now = datetime.now()
+    rows = [
+        (telegram_id, username, first_name, now, now)
+        for telegram_id, (username, first_name) in items.items()
+    ]
+    await _write(lambda conn: conn.executemany(_PROFILE_UPSERT, rows))
+    # Профили, записанные только через буфер (record_profile), теперь известны
+    for telegram_id, profile in items.items():
+        if known_profiles.get(telegram_id, _UNKNOWN) is _UNKNOWN:
+            known_profiles.set(telegram_id, profile)
+
+
+# Изменения username/first_name известных пользователей пишутся пачками
+profile_writes = WriteBehindBuffer(
+    _flush_profiles,
+    interval=settings.PROFILE_FLUSH_INTERVAL,
+    batch_size=settings.PROFILE_FLUSH_BATCH_SIZE,
+    name="profiles",
+)
+
+
+@timed_db
+async def create_users(users):
+    """Создать пользователей [(telegram_id, rating, pt_userid), ...], которых ещё нет.
+
+    INSERT ... ON CONFLICT DO NOTHING RETURNING на пачку строк: рейтинг и
+    PlayTomic ID пишутся тем же запросом, существующие строки не меняются.
+    Возвращает (созданные telegram_id, уже существовавшие telegram_id).
+    """
+    users = {telegram_id: (rating, pt_userid) for telegram_id, rating, pt_userid in users}
+    if not users:
+        return [], []
+    now = datetime.now()
+    rows = [(telegram_id, rating or 0, pt_userid, now, now) for telegram_id, (rating, pt_userid) in users.items()]
+
+    def transaction(conn):
+        created = set()
+        for start in range(0, len(rows), _CHUNK):
+            chunk = rows[start:start + _CHUNK]
+            result = conn.execute(
+                "INSERT INTO user_ratings (telegram_id, rating, PT_userId, created_at, updated_at) VALUES "
+                + ", ".join(["(?, ?, ?, ?, ?)"] * len(chunk))
+                + " ON CONFLICT (telegram_id) DO NOTHING RETURNING telegram_id",
+                [value for row in chunk for value in row],
+            )
+            created.update(row[0] for row in result.fetchall())
+        rated = [(telegram_id, users[telegram_id][0]) for telegram_id in created if users[telegram_id][0]]
+        if rated:
+            append_history(conn, rated)
+        return created
+
+    created = await _write(transaction)
+    for telegram_id in created:
+        _remember_profile(telegram_id)
+    return (
+        [telegram_id for telegram_id in users if telegram_id in created],
+        [telegram_id for telegram_id in users if telegram_id not in created],
+    )
+
+
+async def create_user(telegram_id: int, rating: float = 0, pt_userid: str = None) -> bool:
+    """Создать пользователя, если его нет; True - создан, False - уже существовал.
+
+    Без @timed_db: запрос измеряется один раз в create_users.
+    """
+    created, _ = await create_users([(telegram_id, rating, pt_userid)])
+    return bool(created)
+
+
+@timed_db
+async def ensure_user_exists(telegram_id: int, username: str = None, first_name: str = None):
+    """Убедиться, что пользователь существует в базе.
+
+    Новый пользователь записывается сразу. Для уже известного пользователя
+    запись пропускается, если профиль не изменился, а изменения username и
+    first_name попадают в profile_writes и сбрасываются пачкой.
+    """
+    if known_profiles.get(telegram_id, _UNKNOWN) is not _UNKNOWN:
+        record_profile(telegram_id, username, first_name)
+        return
+
+    _claim_profile(telegram_id, username, first_name)
+    await _write(lambda conn: _ensure_user(conn, telegram_id, username, first_name))
+    _remember_profile(telegram_id, username, first_name)
+
+
+def record_profile(telegram_id: int, username: str = None, first_name: str = None):
+    """Запомнить username/first_name без ожидания: изменения пишутся пачкой через profile_writes.
+
+    Пользователь, которого ещё нет в базе, создаётся той же пачкой - так в
+    базу попадают участники чатов, которые не вызывали команд бота.
+    """
+    if username is None and first_name is None:
+        return
+    profile = (username, first_name)
+    known = known_profiles.get(telegram_id, _UNKNOWN)
+    if profile_writes.get(telegram_id, known) == profile:
+        return
+    profile_writes.put(telegram_id, profile)
+    if known is not _UNKNOWN:
+        known_profiles.set(telegram_id, profile)
+
+
+async def flush_profiles():
+    """Сбросить отложенные изменения профилей"""
+    await profile_writes.close()
+
+
+# Известный состав чатов: (chat_id, telegram_id) -> True (участник) / False (вышел)
+known_chat_members = TTLCache(maxsize=settings.CHAT_MEMBER_CACHE_SIZE, ttl=settings.PROFILE_CACHE_TTL)
+
+
+@timed_db
+async def _flush_chat_members(items: dict):
+    """Записать изменения состава чатов одной транзакцией"""
+    now = datetime.now()
+    joined = [(chat_id, telegram_id, now) for (chat_id, telegram_id), present in items.items() if present]
+    left = [key for key, present in items.items() if not present]
+
+    def transaction(conn):
+        if joined:
+            conn.executemany(
+                "INSERT INTO chat_members (chat_id, telegram_id, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (chat_id, telegram_id) DO NOTHING",
+                joined,
+            )
+        if left:
+            conn.executemany("DELETE FROM chat_members WHERE chat_id = ? AND telegram_id = ?", left)
+
+    await _write(transaction)
+
+
+chat_member_writes = WriteBehindBuffer(
+    _flush_chat_members,
+    interval=settings.PROFILE_FLUSH_INTERVAL,
+    batch_size=settings.PROFILE_FLUSH_BATCH_SIZE,
+    name="chat_members",
+)
+
+
+def record_chat_member(chat_id: int, telegram_id: int, present: bool = True):
+    """Отметить участие в чате (или выход из него); в базу пишется пачкой и только при изменении"""
+    key = (chat_id, telegram_id)
+    if known_chat_members.get(key) is present:
+        return
+    known_chat_members.set(key, present)
+    chat_member_writes.put(key, present)
+
+
+@timed_db
+async def get_chat_member_ids(chat_id: int):
+    """telegram_id всех известных участников чата (по первичному ключу chat_members)"""
+    def query(conn):
+        rows = _execute(conn, "SELECT telegram_id FROM chat_members WHERE chat_id = ?", (chat_id,))
+        return [row[0] for row in rows]
+
+    return await _read(query)
+
+
+@timed_db
+async def find_chat_member_by_username(chat_id: int, username: str):
+    """Участник чата по @username: (telegram_id, username, first_name) или None"""
+    clean_username = username.lstrip('@').lower()
+
+    def query(conn):
+        return _execute(
+            conn,
+            "SELECT u.telegram_id, u.telegram_username, u.first_name FROM user_ratings u "
+            "JOIN chat_members m ON m.telegram_id = u.telegram_id "
+            "WHERE m.chat_id = ? AND lower(u.telegram_username) = ? LIMIT 1",
+            (chat_id, clean_username),
+        ).fetchone()
+
+    return await _read(query)
+
+
+async def flush_writes():
+    """Сбросить все отложенные записи (вызывается при остановке)"""
+    await profile_writes.close()
+    await chat_member_writes.close()
+
+
+@timed_db
+async def get_user_id_by_username(username: str) -> int:
+    """Получить telegram_id по username"""
+    # Убираем @ если есть
+    clean_username = username.lstrip('@').lower()
+
+    def query(conn):
+        row = conn.execute(
+            "SELECT telegram_id FROM user_ratings WHERE lower(telegram_username) = ? LIMIT 1", (clean_username,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    return await _read(query)
+
+
+@timed_db
+async def set_rating(user_id: int, rating: float, username: str = None, first_name: str = None):
+    """Установить рейтинг пользователя в базе данных"""
+    def transaction(conn):
+        _ensure_user(conn, user_id, username, first_name)
+        conn.execute(
+            "UPDATE user_ratings SET rating = ?, updated_at = ? WHERE telegram_id = ?",
+            (rating, datetime.now(), user_id),
+        )
+        append_history(conn, [(user_id, rating)])
+
+    _claim_profile(user_id, username, first_name)
+    await _write(transaction)
+    _remember_profile(user_id, username, first_name)
+
+
+def to_centi(rating: float) -> int:
+    """Рейтинг в сотых долях (так он хранится в rating_history)"""
+    return int(round(rating * 100))
+
+
+def append_history(conn, changes, ts: int = None):
+    """Добавить точки истории [(telegram_id, rating), ...] в рамках открытой транзакции"""
+    ts = int(time.time()) if ts is None else ts
+    # Несколько изменений за одну секунду - остаётся последнее
+    conn.executemany(
+        "INSERT INTO rating_history (telegram_id, ts, rating_centi) VALUES (?, ?, ?) "
+        "ON CONFLICT (telegram_id, ts) DO UPDATE SET rating_centi = excluded.rating_centi",
+        [(telegram_id, ts, to_centi(rating)) for telegram_id, rating in changes],
+    )
+
+
+@timed_db
+async def get_rating_history(user_id: int, limit: int = 10):
+    """Последние limit изменений рейтинга: [(ts, rating), ...] от старых к новым"""
+    def query(conn):
+        return _execute(
+            conn,
+            "SELECT ts, rating_centi FROM rating_history WHERE telegram_id = ? ORDER BY ts DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+
+    return [(ts, rating_centi / 100) for ts, rating_centi in reversed(await _read(query))]
+
+
+def _scalar(conn, sql: str, params=()):
+    row = conn.execute(sql, params).fetchone()
+    return row[0] if row is not None else None
+
+
+@timed_db
+async def get_rating(user_id: int) -> float:
+    """Получить рейтинг пользователя из базы данных"""
+    rating = await _read(lambda conn: _scalar(conn, "SELECT rating FROM user_ratings WHERE telegram_id = ?", (user_id,)))
+    return rating if rating is not None else 0.0
+
+
+@timed_db
+async def user_exists_in_db(user_id: int) -> bool:
+    """Проверить, существует ли пользователь в базе данных"""
+    def query(conn):
+        return conn.execute("SELECT 1 FROM user_ratings WHERE telegram_id = ?", (user_id,)).fetchone() is not None
+
+    return await _read(query)
+
+
+@timed_db
+async def set_pt_userid(user_id: int, pt_userid: str):
+    """Установить PlayTomic ID пользователя в базе данных"""
+    def transaction(conn):
+        _ensure_user(conn, user_id)
+        conn.execute(
+            "UPDATE user_ratings SET PT_userId = ?, updated_at = ? WHERE telegram_id = ?",
+            (pt_userid, datetime.now(), user_id),
+        )
+
+    await _write(transaction)
+    _remember_profile(user_id)
+
+
+@timed_db
+async def get_pt_userid(user_id: int) -> str:
+    """Получить PlayTomic ID пользователя из базы данных"""
+    pt_userid = await _read(
+        lambda conn: _scalar(conn, "SELECT PT_userId FROM user_ratings WHERE telegram_id = ?", (user_id,))
+    )
+    return pt_userid if pt_userid is not None else ""
+
+
+_PROFILE_SELECT = "SELECT telegram_id, rating, PT_userId, telegram_username, first_name FROM user_ratings"
+
+
+def _to_profile(telegram_id: int, row) -> UserProfile:
+    if row is None:
+        return UserProfile(telegram_id, False, 0.0, "", None, None)
+    telegram_id, rating, pt_userid, username, first_name = row
+    return UserProfile(
+        telegram_id,
+        True,
+        rating if rating is not None else 0.0,
+        pt_userid if pt_userid is not None else "",
+        username,
+        first_name,
+    )
+
+
+@timed_db
+async def get_user_profile(user_id: int) -> UserProfile:
+    """Получить профиль пользователя одним запросом по уникальному индексу telegram_id"""
+    row = await _read(lambda conn: _execute(conn, _PROFILE_SELECT + " WHERE telegram_id = ?", (user_id,)).fetchone())
+    return _to_profile(user_id, row)
+
+
+@timed_db
+async def get_user_profile_by_username(username: str) -> UserProfile:
+    """Получить профиль по @username одним запросом (telegram_id=None, если не найден)"""
+    clean_username = username.lstrip('@').lower()
+
+    def query(conn):
+        return _execute(
+            conn, _PROFILE_SELECT + " WHERE lower(telegram_username) = ? LIMIT 1", (clean_username,)
+        ).fetchone()
+
+    return _to_profile(None, await _read(query))
+
+
+@timed_db
+async def get_all_users():
+    """Получить всех пользователей из базы данных"""
+    def query(conn):
+        return _execute(conn, "SELECT telegram_id, telegram_username, first_name, rating FROM user_ratings").fetchall()
+
+    return await _read(query)
+
+
+_EXPORT_SELECT = (
+    "SELECT telegram_id, telegram_username, first_name, rating, PT_userId, created_at, updated_at "
+    "FROM user_ratings WHERE telegram_id > ? ORDER BY telegram_id LIMIT ?"
+)
+
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+async def iter_users(chunk_size: int = 1000):
+    """Все пользователи пачками по chunk_size строк (по возрастанию telegram_id).
+
+    Каждая пачка - отдельный запрос по индексу telegram_id, начиная с
+    последнего прочитанного, поэтому память не растёт с размером таблицы и
+    подключение-читатель не занято между пачками.
+    """
+    last_id = -2 ** 63
+    while True:
+        rows = await _read(lambda conn: _execute(conn, _EXPORT_SELECT, (last_id, chunk_size)).fetchall())
+        if not rows:
+            return
+        yield [row[:5] + (_to_datetime(row[5]), _to_datetime(row[6])) for row in rows]
+        last_id = rows[-1][0]
+
+
+@timed_db
+async def get_state(key: str) -> Optional[str]:
+    """Получить служебное значение из bot_state"""
+    return await _read(lambda conn: _scalar(conn, "SELECT value FROM bot_state WHERE key = ?", (key,)))
+
+
+@timed_db
+async def set_state(key: str, value: str):
+    """Сохранить служебное значение в bot_state"""
+    now = datetime.now()
+    await _write(lambda conn: conn.execute(
+        "INSERT INTO bot_state (key, value, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+        (key, value, now),
+    ))
+
+
+_PLAYER_SELECT = "SELECT telegram_id, rating, telegram_username, first_name FROM user_ratings"
+
+
+@timed_db
+async def get_ratings(user_ids=None):
+    """Рейтинги игроков с рейтингом > 0: [(telegram_id, rating, username, first_name), ...]"""
+    def query(conn):
+        if user_ids is None:
+            return _execute(conn, _PLAYER_SELECT + " WHERE rating > 0").fetchall()
+        rows = []
+        ids = list(user_ids)
+        for start in range(0, len(ids), _CHUNK):
+            chunk = ids[start:start + _CHUNK]
+            rows.extend(_execute(
+                conn, _PLAYER_SELECT + f" WHERE rating > 0 AND telegram_id IN ({_placeholders(len(chunk))})", chunk
+            ))
+        return rows
+
+    return await _read(query)
+
+
+@timed_db
+async def get_players(user_ids=(), usernames=()):
+    """Игроки по telegram_id и/или @username одним запросом:
+    [(telegram_id, rating, username, first_name), ...] (рейтинг может быть 0)"""
+    user_ids = list(user_ids)
+    clean_usernames = [username.lstrip('@').lower() for username in usernames]
+    conditions = []
+    if user_ids:
+        conditions.append(f"telegram_id IN ({_placeholders(len(user_ids))})")
+    if clean_usernames:
+        conditions.append(f"lower(telegram_username) IN ({_placeholders(len(clean_usernames))})")
+    if not conditions:
+        return []
+    sql = _PLAYER_SELECT + " WHERE " + " OR ".join(conditions)
+    return await _read(lambda conn: _execute(conn, sql, user_ids + clean_usernames).fetchall())
+
+
+_RATING_UPDATE = "UPDATE user_ratings SET rating = ?, updated_at = ? WHERE telegram_id = ?"
+
+
+def _current_ratings(conn, ids) -> dict:
+    """{telegram_id: rating} для существующих пользователей из ids"""
+    current = {}
+    for start in range(0, len(ids), _CHUNK):
+        chunk = ids[start:start + _CHUNK]
+        current.update(_execute(
+            conn, f"SELECT telegram_id, rating FROM user_ratings WHERE telegram_id IN ({_placeholders(len(chunk))})",
+            chunk,
+        ))
+    return current
+
+
+@timed_db
+async def record_match(players, score, chat_id: int = None, recorded_by: int = None):
+    """Записать матч и пересчитать рейтинги четырёх игроков (a1, a2, b1, b2) одной транзакцией.
+
+    Возвращает rating_engine.MatchResult; рейтинги читаются под блокировкой
+    писателя, поэтому параллельные матчи не перетирают друг друга.
+    """
+    now = datetime.now()
+    ts = int(time.time())
+
+    def transaction(conn):
+        current = _current_ratings(conn, list(players))
+        match_result = rating_engine.rate_match(tuple(current.get(p) or 0.0 for p in players), score)
+        conn.execute(
+            "INSERT INTO matches (ts, chat_id, recorded_by, team_a_1, team_a_2, team_b_1, team_b_2, "
+            "score, team_a_won, game_diff, before_a_1, before_a_2, before_b_1, before_b_2, "
+            "after_a_1, after_a_2, after_b_1, after_b_2) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                ts, chat_id, recorded_by, *players,
+                str(score), score.team_a_won, score.games_a - score.games_b,
+                *match_result.before, *match_result.after,
+            ),
+        )
+        conn.executemany(_RATING_UPDATE, [(r, now, p) for p, r in zip(players, match_result.after)])
+        append_history(conn, list(zip(players, match_result.after)), ts=ts)
+        return match_result
+
+    return await _write(transaction)
+
+
+@timed_db
+async def replay_matches():
+    """Пересчитать рейтинги всех игроков по всей истории матчей.
+
+    Начальный рейтинг игрока - его рейтинг до первого записанного матча.
+    Возвращает {telegram_id: новый рейтинг}; рейтинги и история обновляются
+    одной транзакцией.
+    """
+    def query(conn):
+        return _execute(
+            conn,
+            "SELECT team_a_1, team_a_2, team_b_1, team_b_2, before_a_1, before_a_2, before_b_1, before_b_2, "
+            "team_a_won, game_diff FROM matches ORDER BY ts, id",
+        ).fetchall()
+
+    rows = await _read(query)
+    if not rows:
+        return {}
+
+    players = [row[0:4] for row in rows]
+    initial = {}
+    for row in rows:
+        for telegram_id, before in zip(row[0:4], row[4:8]):
+            initial.setdefault(telegram_id, before)
+    ratings = rating_engine.replay(
+        players, [bool(row[8]) for row in rows], [row[9] for row in rows], initial
+    )
+
+    now = datetime.now()
+
+    def transaction(conn):
+        conn.executemany(_RATING_UPDATE, [(r, now, p) for p, r in ratings.items()])
+        append_history(conn, list(ratings.items()))
+
+    await _write(transaction)
+    return ratings
+
+
+@timed_db
+async def import_ratings(rows):
+    """Массово установить рейтинги [(telegram_id, rating, username, first_name), ...] одной транзакцией.
+
+    Новые пользователи создаются сразу с рейтингом, у существующих рейтинг
+    обновляется одним executemany, история пишется для всех изменений.
+    Возвращает (created, updated, unchanged) - списки telegram_id.
+    """
+    rows = list(rows)
+    now = datetime.now()
+    ts = int(time.time())
+
+    def transaction(conn):
+        current = _current_ratings(conn, [row[0] for row in rows])
+        created = [row for row in rows if row[0] not in current]
+        existing = [row for row in rows if row[0] in current]
+        updated = [row for row in existing if current[row[0]] != row[1]]
+        unchanged = [row for row in existing if current[row[0]] == row[1]]
+
+        if created:
+            conn.executemany(
+                "INSERT INTO user_ratings (telegram_id, telegram_username, first_name, rating, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (telegram_id) DO NOTHING",
+                [
+                    (telegram_id, username, first_name, rating, now, now)
+                    for telegram_id, rating, username, first_name in created
+                ],
+            )
+        if updated:
+            conn.executemany(_RATING_UPDATE, [(row[1], now, row[0]) for row in updated])
+        profiles = [row for row in existing if row[2] is not None or row[3] is not None]
+        if profiles:
+            # Пустые поля файла не затирают известный профиль
+            conn.executemany(
+                "UPDATE user_ratings SET telegram_username = coalesce(?, telegram_username), "
+                "first_name = coalesce(?, first_name) WHERE telegram_id = ?",
+                [(username, first_name, telegram_id) for telegram_id, _, username, first_name in profiles],
+            )
+        if created or updated:
+            append_history(conn, [(row[0], row[1]) for row in created + updated], ts=ts)
+        return created, updated, unchanged, profiles
+
+    for telegram_id, _, username, first_name in rows:
+        _claim_profile(telegram_id, username, first_name)
+    created, updated, unchanged, profiles = await _write(transaction)
+    for telegram_id, _, username, first_name in created:
+        _remember_profile(telegram_id, username, first_name)
+    for telegram_id, *_ in profiles:
+        known_profiles.invalidate(telegram_id)
+    return [row[0] for row in created], [row[0] for row in updated], [row[0] for row in unchanged]
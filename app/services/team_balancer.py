@@ -0,0 +1,163 @@
+"""
+Подбор сбалансированных пар 2 на 2 на вечер игры (/teams)
+
+Игроки делятся на корты по четыре, на каждом корте - две пары. Стоимость
+корта = разница средних рейтингов пар + SPREAD_WEIGHT * разброс рейтингов
+на корте: матчи получаются равными, а на одном корте играют игроки близкого
+уровня. Внутри корта лучшая из трёх возможных раскладок на пары находится
+перебором, поэтому искать нужно только разбиение игроков по кортам.
+
+До EXACT_MAX_PLAYERS игроков разбиение ищется точно (перебор с мемоизацией по
+маске оставшихся игроков), для больших составов - отжигом с ограничением по
+времени: ответ всегда укладывается в time_budget.
+"""
+import math
+import random
+import time
+from functools import lru_cache
+from itertools import combinations
+from typing import List, NamedTuple, Sequence, Tuple
+
+EXACT_MAX_PLAYERS = 16
+SPREAD_WEIGHT = 0.25
+DEFAULT_TIME_BUDGET = 0.5
+
+# Три способа разбить четвёрку (0, 1, 2, 3) на две пары
+_PAIRINGS = (((0, 1), (2, 3)), ((0, 2), (1, 3)), ((0, 3), (1, 2)))
+
+
+class Court(NamedTuple):
+    """Корт: две пары telegram_id и их средние рейтинги"""
+    team_a: Tuple[int, int]
+    team_b: Tuple[int, int]
+    rating_a: float
+    rating_b: float
+
+    @property
+    def imbalance(self) -> float:
+        return abs(self.rating_a - self.rating_b)
+
+
+class Lineup(NamedTuple):
+    """Результат подбора"""
+    courts: List[Court]
+    cost: float
+    exact: bool
+
+    @property
+    def max_imbalance(self) -> float:
+        return max(court.imbalance for court in self.courts)
+
+
+def court_cost(ratings: Sequence[float]):
+    """(стоимость, раскладка на пары) для четырёх рейтингов"""
+    spread = max(ratings) - min(ratings)
+    best = None
+    for pairing in _PAIRINGS:
+        (a1, a2), (b1, b2) = pairing
+        imbalance = abs(ratings[a1] + ratings[a2] - ratings[b1] - ratings[b2]) / 2
+        if best is None or imbalance < best[0]:
+            best = (imbalance, pairing)
+    return best[0] + SPREAD_WEIGHT * spread, best[1]
+
+
+def _exact_groups(ratings: Sequence[float]):
+    """Точное разбиение на четвёрки с минимальной суммарной стоимостью"""
+    count = len(ratings)
+
+    @lru_cache(maxsize=None)
+    def group_cost(group):
+        return court_cost([ratings[i] for i in group])[0]
+
+    @lru_cache(maxsize=None)
+    def solve(remaining):
+        if not remaining:
+            return 0.0, ()
+        players = [i for i in range(count) if remaining >> i & 1]
+        first, rest = players[0], players[1:]
+        best = None
+        for others in combinations(rest, 3):
+            group = (first,) + others
+            mask = remaining
+            for i in group:
+                mask &= ~(1 << i)
+            cost, groups = solve(mask)
+            cost += group_cost(group)
+            if best is None or cost < best[0]:
+                best = (cost, (group,) + groups)
+        return best
+
+    return list(solve((1 << count) - 1)[1])
+
+
+def _annealed_groups(ratings: Sequence[float], time_budget: float, seed=None):
+    """Разбиение на четвёрки отжигом: обмен игроками между кортами"""
+    rnd = random.Random(seed)
+    order = sorted(range(len(ratings)), key=lambda i: ratings[i], reverse=True)
+    # Начальное решение: соседние по рейтингу игроки на одном корте
+    groups = [order[i:i + 4] for i in range(0, len(order), 4)]
+    costs = [court_cost([ratings[i] for i in group])[0] for group in groups]
+    total = sum(costs)
+    best_total, best_groups = total, [list(group) for group in groups]
+    if len(groups) < 2:
+        return best_groups
+
+    start = time.perf_counter()
+    deadline = start + time_budget
+    temperature_start, temperature_end = 0.5, 0.001
+    temperature = temperature_start
+    iteration = 0
+    while True:
+        iteration += 1
+        if iteration % 256 == 0:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            progress = (now - start) / time_budget
+            temperature = temperature_start * (temperature_end / temperature_start) ** progress
+
+        g1, g2 = rnd.sample(range(len(groups)), 2)
+        p1, p2 = rnd.randrange(4), rnd.randrange(4)
+        group1, group2 = groups[g1], groups[g2]
+        group1[p1], group2[p2] = group2[p2], group1[p1]
+        cost1 = court_cost([ratings[i] for i in group1])[0]
+        cost2 = court_cost([ratings[i] for i in group2])[0]
+        delta = cost1 + cost2 - costs[g1] - costs[g2]
+        if delta <= 0 or rnd.random() < math.exp(-delta / temperature):
+            costs[g1], costs[g2] = cost1, cost2
+            total += delta
+            if total < best_total - 1e-12:
+                best_total, best_groups = total, [list(group) for group in groups]
+        else:
+            group1[p1], group2[p2] = group2[p2], group1[p1]
+    return best_groups
+
+
+def balance_teams(players: Sequence[Tuple[int, float]], time_budget: float = DEFAULT_TIME_BUDGET, seed=None) -> Lineup:
+    """Разбить игроков [(telegram_id, rating), ...] на корты 2 на 2.
+
+    Число игроков должно быть кратно четырём.
+    """
+    if not players or len(players) % 4:
+        raise ValueError("Number of players must be a positive multiple of 4")
+    ids = [telegram_id for telegram_id, _ in players]
+    ratings = [rating for _, rating in players]
+
+    exact = len(players) <= EXACT_MAX_PLAYERS
+    groups = _exact_groups(ratings) if exact else _annealed_groups(ratings, time_budget, seed)
+
+    courts = []
+    total = 0.0
+    for group in groups:
+        group_ratings = [ratings[i] for i in group]
+        cost, ((a1, a2), (b1, b2)) = court_cost(group_ratings)
+        total += cost
+        courts.append(Court(
+            (ids[group[a1]], ids[group[a2]]),
+            (ids[group[b1]], ids[group[b2]]),
+            (group_ratings[a1] + group_ratings[a2]) / 2,
+            (group_ratings[b1] + group_ratings[b2]) / 2,
+        ))
+    # Сильнейший корт - первым
+    courts.sort(key=lambda court: court.rating_a + court.rating_b, reverse=True)
+    return Lineup(courts, total, exact)
@@ -0,0 +1,160 @@
+"""
+Диспетчер обновлений: по порядку внутри чата, параллельно между чатами
+
+Обновления одного чата выполняются строго в порядке поступления (записи
+рейтинга в группе не переставляются), а разные чаты обрабатываются
+одновременно - не больше max_concurrent_chats за раз. Используется и в
+webhook (app/main.py), и в polling (run_local.py) через
+Application.builder().concurrent_updates(...).
+
+Воркеры очереди webhook вызывают submit(): обновление занимает место в
+очереди своего чата, и воркер сразу берёт следующее, не дожидаясь, пока
+подойдёт очередь занятого чата.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable
+
+from telegram.ext import BaseUpdateProcessor
+
+from app.core.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Последовательная обработка внутри чата, параллельная - между чатами"""
+
+    def __init__(self, max_concurrent_chats: int = 8, max_pending_updates: int = 256):
+        # Семафор базового класса ограничивает общее число обновлений в работе,
+        # включая ожидающие своей очереди внутри чата
+        super().__init__(max(max_pending_updates, max_concurrent_chats))
+        self.max_concurrent_chats = max_concurrent_chats
+        self._chat_slots = asyncio.BoundedSemaphore(max_concurrent_chats)
+        self._chat_locks = {}
+        self._chat_refs = {}
+        self._active = 0
+        self._submitted = set()
+
+    @staticmethod
+    def chat_key(update: object):
+        """Ключ упорядочивания: чат, а для обновлений без чата - пользователь"""
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return ("user", user.id)
+        return None
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        key = self.chat_key(update)
+        update_id = getattr(update, "update_id", None)
+        with tracer.trace("update", update_id=update_id, chat=str(key)) as span:
+            await self._process(key, coroutine, span)
+
+    async def submit(self, update: object, coroutine: "Awaitable[Any]") -> asyncio.Task:
+        """Поставить обновление в очередь его чата и вернуться, не дожидаясь обработки.
+
+        Ждёт только свободного места среди max_pending_updates; порядок внутри
+        чата - порядок вызовов submit().
+        """
+        await self._semaphore.acquire()
+        key = self.chat_key(update)
+        # Место в очереди чата занимаем сразу, до запуска задачи
+        lock = self._register(key) if key is not None else None
+        started = time.perf_counter()
+        # Трасса обновления - своя, а не продолжение трассы вызвавшего воркера
+        task = asyncio.create_task(
+            self._process_submitted(update, coroutine, key, lock, started),
+            name=f"update-{getattr(update, 'update_id', None)}",
+            context=contextvars.Context(),
+        )
+        self._submitted.add(task)
+        task.add_done_callback(self._submitted.discard)
+        return task
+
+    async def _process_submitted(self, update, coroutine, key, lock, started: float):
+        try:
+            update_id = getattr(update, "update_id", None)
+            with tracer.trace("update", update_id=update_id, chat=str(key)) as span:
+                await self._process(key, coroutine, span, lock, started)
+        except Exception as e:
+            logger.error(f"Error processing update {getattr(update, 'update_id', None)}: {e}", exc_info=True)
+        finally:
+            self._semaphore.release()
+
+    async def join(self, timeout: float = None):
+        """Дождаться обновлений, переданных через submit() (при остановке)"""
+        tasks = list(self._submitted)
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} updates still in progress after {timeout}s, cancelling")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _register(self, key) -> asyncio.Lock:
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        self._chat_refs[key] = self._chat_refs.get(key, 0) + 1
+        return lock
+
+    async def _process(self, key, coroutine, span, lock: asyncio.Lock = None, started: float = None):
+        if started is None:
+            started = time.perf_counter()
+        if key is None:
+            async with self._chat_slots:
+                self._trace_wait(span, started)
+                await self._run(coroutine)
+            return
+
+        if lock is None:
+            lock = self._register(key)
+        try:
+            # Сначала очередь чата, потом слот: обновления, ждущие занятый чат,
+            # не занимают слоты и не задерживают другие чаты
+            async with lock:
+                async with self._chat_slots:
+                    self._trace_wait(span, started)
+                    await self._run(coroutine)
+        finally:
+            self._chat_refs[key] -= 1
+            if not self._chat_refs[key]:
+                del self._chat_refs[key]
+                del self._chat_locks[key]
+
+    @staticmethod
+    def _trace_wait(span, started: float):
+        """Записать в трассу ожидание очереди чата и свободного слота"""
+        if span is not None:
+            span.set(wait_ms=round((time.perf_counter() - started) * 1000, 3))
+
+    async def _run(self, coroutine):
+        self._active += 1
+        try:
+            await coroutine
+        finally:
+            self._active -= 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        """Текущая загрузка диспетчера"""
+        return {
+            "max_concurrent_chats": self.max_concurrent_chats,
+            "max_pending_updates": self.max_concurrent_updates,
+            "active_updates": self._active,
+            "chats_in_flight": len(self._chat_locks),
+            "pending_updates": sum(self._chat_refs.values()),
+            "submitted_in_flight": len(self._submitted),
+        }
@@ -0,0 +1,117 @@
+"""
+Очередь входящих обновлений webhook
+
+Webhook кладёт обновление в ограниченную очередь и сразу отвечает Telegram,
+а пул воркеров разбирает очередь в фоне. При переполнении очередь отказывает
+(webhook отвечает 503, Telegram повторит доставку позже).
+"""
+import asyncio
+import logging
+import time
+
+from app.core.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений с пулом воркеров"""
+
+    def __init__(self, handler, maxsize: int = 1000, workers: int = 8, name: str = "updates"):
+        self._handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.name = name
+        self._queue = None
+        self._tasks = []
+        self._accepting = False
+        self._busy = 0
+        # Метрики
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._total_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    async def start(self):
+        """Запустить воркеры"""
+        if self._accepting:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-worker-{index}")
+            for index in range(self.workers)
+        ]
+        self._accepting = True
+        logger.info(f"Update queue '{self.name}' started: maxsize={self.maxsize}, workers={self.workers}")
+
+    def put_nowait(self, update) -> bool:
+        """Поставить обновление в очередь; False - очередь переполнена или остановлена"""
+        if not self._accepting:
+            self.rejected += 1
+            return False
+        try:
+            self._queue.put_nowait((time.perf_counter(), update))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _worker(self):
+        while True:
+            enqueued_at, update = await self._queue.get()
+            wait = time.perf_counter() - enqueued_at
+            self._total_wait += wait
+            self._busy += 1
+            try:
+                with tracer.trace(self.name, queue_wait_ms=round(wait * 1000, 3)):
+                    await self._handler(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing queued update: {e}", exc_info=True)
+            finally:
+                self._busy -= 1
+                self._queue.task_done()
+
+    async def stop(self, drain: bool = True, timeout: float = None):
+        """Остановить приём; при drain=True дождаться обработки уже принятых обновлений"""
+        if self._queue is None:
+            return
+        self._accepting = False
+        if drain:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Update queue '{self.name}' drain timed out, {self._queue.qsize()} updates dropped"
+                )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Update queue '{self.name}' stopped")
+
+    def stats(self) -> dict:
+        """Метрики очереди (глубина, отказы, время ожидания)"""
+        taken = self.processed + self.failed + self._busy
+        return {
+            "running": self._accepting,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._total_wait / taken * 1000, 3) if taken else 0.0,
+        }
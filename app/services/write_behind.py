@@ -0,0 +1,132 @@
+"""
+Отложенная запись (write-behind) с объединением изменений
+
+Изменения копятся в памяти по ключу (остаётся только последнее значение) и
+сбрасываются в базу одной транзакцией - по таймеру или при наборе пачки.
+Идущий сброс никогда не отменяется: пока он пишет, новые изменения копятся,
+и после него сброс повторяется, пока в очереди набирается полная пачка.
+При остановке приложения нужно вызвать close(), чтобы сбросить остаток.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Буфер отложенной записи: последние значения по ключу, сброс пачкой"""
+
+    def __init__(self, flush, interval: float = 1.0, batch_size: int = 100, name: str = "write-behind"):
+        self._flush = flush  # async flush(items: dict) - запись одной транзакцией
+        self.interval = interval
+        self.batch_size = batch_size
+        self.name = name
+        self._pending = {}
+        self._task = None  # таймер или идущий сброс
+        self._sleeping = False
+        self._lock = asyncio.Lock()
+        # Метрики
+        self.buffered = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.errors = 0
+
+    def put(self, key, value):
+        """Поставить значение в очередь на запись (заменяет ещё не записанное)"""
+        if key in self._pending:
+            self.coalesced += 1
+        else:
+            self.buffered += 1
+        self._pending[key] = value
+        self._schedule()
+
+    def get(self, key, default=None):
+        """Ещё не записанное значение по ключу"""
+        return self._pending.get(key, default)
+
+    def discard(self, key):
+        """Убрать ключ из очереди (значение уже записано другим путём)"""
+        self._pending.pop(key, None)
+
+    def _schedule(self):
+        full = len(self._pending) >= self.batch_size
+        if self._task is not None and not self._task.done():
+            # Идущий сброс не прерываем: он сам продолжит, пока набираются
+            # полные пачки. Сокращаем только ожидание таймера.
+            if not (full and self._sleeping):
+                return
+            self._task.cancel()
+        delay = 0 if full else self.interval
+        # Пока таймер не дождался (или задача ещё не запущена), её можно отменить
+        self._sleeping = delay > 0
+        self._task = asyncio.create_task(self._run(delay), name=f"{self.name}-flush")
+
+    async def _run(self, delay: float):
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._sleeping = False
+            while await self.flush() and len(self._pending) >= self.batch_size:
+                pass
+        finally:
+            if self._task is asyncio.current_task():
+                self._task = None
+        # То, что пришло во время сброса, но не набрало пачку, - по таймеру
+        if self._pending and self._task is None:
+            self._schedule()
+
+    async def flush(self) -> bool:
+        """Записать всё накопленное одной транзакцией; False - запись не удалась"""
+        async with self._lock:
+            if not self._pending:
+                return True
+            items, self._pending = self._pending, {}
+            try:
+                await self._flush(items)
+            except asyncio.CancelledError:
+                self._restore(items)
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Write-behind '{self.name}' flush failed: {e}", exc_info=True)
+                self._restore(items)
+                return False
+            self.flushes += 1
+            self.flushed += len(items)
+            return True
+
+    def _restore(self, items: dict):
+        # Возвращаем в очередь то, что не успели перезаписать более новым значением
+        for key, value in items.items():
+            self._pending.setdefault(key, value)
+
+    async def close(self):
+        """Остановить таймер, дождаться идущего сброса и сбросить остаток"""
+        while True:
+            task = self._task
+            if task is None or task.done() or task is asyncio.current_task():
+                break
+            if self._sleeping:
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            if self._task is task:
+                self._task = None
+        await self.flush()
+
+    def clear(self):
+        """Забыть накопленные изменения без записи и обнулить метрики"""
+        self._pending.clear()
+        self._task = None
+        self.buffered = self.coalesced = self.flushes = self.flushed = self.errors = 0
+
+    def stats(self) -> dict:
+        """Метрики буфера"""
+        return {
+            "pending": len(self._pending),
+            "buffered": self.buffered,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "errors": self.errors,
+        }
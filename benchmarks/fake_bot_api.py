@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Telegram Bot API для офлайн-тестов и нагрузочных прогонов
+
+FastAPI-приложение, которое отвечает на вызовы бота так же, как
+api.telegram.org, но из памяти: пользователи, чаты, участники и
+администраторы задаются заранее и меняются на ходу (add_member, set_admin,
+remove_member), sendMessage/sendDocument только записываются. Бот
+направляется сюда через TELEGRAM_API_URL (base_url в Application.builder()).
+
+Что можно настроить, чтобы воспроизводимо проверять пути, зависящие от API:
+    latency / method_latency  - задержка ответа, общая и по методам
+    inject_flood()            - следующие N вызовов метода получат 429
+    flood_probability         - случайные 429 (с seed - воспроизводимо)
+    group_message_limit       - лимит сообщений в группу за окно, как у Telegram
+
+Сервер запускается в своём потоке (FakeBotApiServer), чтобы не делить event
+loop с измеряемым ботом, или отдельно:
+
+    python benchmarks/fake_bot_api.py --port 8081 --users 200 --chats 5
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=1:fake python run_local.py
+
+Обновления для polling кладутся через POST /fake/updates, отправленные ботом
+сообщения и счётчики вызовов видны в GET /fake/messages и GET /fake/stats.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from email.parser import BytesParser
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Rating Bot", "username": "rating_bench_bot"}
+
+# Права администратора: ChatMemberAdministrator требует все поля
+_ADMIN_RIGHTS = {
+    "can_be_edited": False,
+    "is_anonymous": False,
+    "can_manage_chat": True,
+    "can_delete_messages": True,
+    "can_manage_video_chats": True,
+    "can_restrict_members": True,
+    "can_promote_members": False,
+    "can_change_info": True,
+    "can_invite_users": True,
+}
+
+
+class ApiError(Exception):
+    """Ошибка метода в формате Bot API: {"ok": false, "error_code", "description"}"""
+
+    def __init__(self, code: int, description: str, retry_after: int = None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+    def to_dict(self) -> dict:
+        data = {"ok": False, "error_code": self.code, "description": self.description}
+        if self.retry_after is not None:
+            data["parameters"] = {"retry_after": self.retry_after}
+        return data
+
+
+def flood_error(retry_after: int) -> ApiError:
+    # Telegram не присылает retry_after < 1, а PTB без него не распознаёт RetryAfter
+    retry_after = max(1, int(retry_after))
+    return ApiError(429, f"Too Many Requests: retry after {retry_after}", retry_after=retry_after)
+
+
+def _chat_id(value):
+    """chat_id из параметра запроса: число или @username"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _parse_multipart(content_type: str, body: bytes) -> dict:
+    """Поля multipart-формы (sendDocument); у файлов - имя и размер вместо содержимого"""
+    message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+    params = {}
+    for part in message.get_payload() if message.is_multipart() else ():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True) or b""
+        filename = part.get_filename()
+        params[name] = {"filename": filename, "size": len(payload)} if filename else payload.decode()
+    return params
+
+
+class FakeBotApi:
+    """Состояние фальшивого Bot API: пользователи, чаты, отправленные сообщения, сбои"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        method_latency: Dict[str, float] = None,
+        flood_probability: float = 0.0,
+        flood_retry_after: int = 1,
+        group_message_limit: Optional[Tuple[int, float]] = None,
+        seed: int = None,
+    ):
+        self.latency = latency
+        self.method_latency = dict(method_latency or {})
+        self.flood_probability = flood_probability
+        self.flood_retry_after = flood_retry_after
+        self.group_message_limit = group_message_limit
+        self._rng = random.Random(seed)
+        self._injected = defaultdict(deque)
+        self._chat_sends = defaultdict(deque)
+        self.users: Dict[int, dict] = {}
+        self.usernames: Dict[str, int] = {}
+        self.chats: Dict[int, dict] = {}
+        self.calls = Counter()
+        self.floods = Counter()
+        # (время получения, chat_id, reply_to_message_id, text)
+        self.sent: List[tuple] = []
+        self.updates: deque = deque()
+        self._message_ids = 0
+        self._update_ids = 0
+
+    # --- модель чатов ---
+
+    def add_user(self, user_id: int, username: str = None, first_name: str = "User"):
+        user = {"id": user_id, "is_bot": False, "first_name": first_name}
+        if username:
+            user["username"] = username
+            self.usernames[username.lower()] = user_id
+        self.users[user_id] = user
+        return user
+
+    def add_chat(self, chat_id: int, title: str, members=(), admins=()):
+        """Группа; первый из admins - владелец"""
+        self.chats[chat_id] = {
+            "chat": {"id": chat_id, "type": "supergroup", "title": title},
+            "members": set(members) | set(admins),
+            "admins": list(admins),
+        }
+
+    def add_member(self, chat_id: int, user_id: int):
+        self.chats[chat_id]["members"].add(user_id)
+
+    def remove_member(self, chat_id: int, user_id: int):
+        chat = self.chats[chat_id]
+        chat["members"].discard(user_id)
+        if user_id in chat["admins"]:
+            chat["admins"].remove(user_id)
+
+    def set_admin(self, chat_id: int, user_id: int, admin: bool = True):
+        chat = self.chats[chat_id]
+        chat["members"].add(user_id)
+        if admin and user_id not in chat["admins"]:
+            chat["admins"].append(user_id)
+        elif not admin and user_id in chat["admins"]:
+            chat["admins"].remove(user_id)
+
+    def push_update(self, update: dict) -> dict:
+        """Положить обновление для getUpdates (update_id проставляется, если его нет)"""
+        if "update_id" not in update:
+            self._update_ids += 1
+            update = dict(update, update_id=self._update_ids)
+        self._update_ids = max(self._update_ids, update["update_id"])
+        self.updates.append(update)
+        return update
+
+    # --- сбои ---
+
+    def inject_flood(self, method: str, times: int = 1, retry_after: int = None):
+        """Следующие times вызовов method ответят 429"""
+        retry_after = self.flood_retry_after if retry_after is None else retry_after
+        self._injected[method].extend([retry_after] * times)
+
+    def _check_flood(self, method: str, params: dict):
+        injected = self._injected.get(method)
+        if injected:
+            self.floods[method] += 1
+            raise flood_error(injected.popleft())
+        if self.flood_probability and self._rng.random() < self.flood_probability:
+            self.floods[method] += 1
+            raise flood_error(self.flood_retry_after)
+        if self.group_message_limit and method in ("sendMessage", "sendDocument"):
+            chat_id = _chat_id(params.get("chat_id"))
+            if isinstance(chat_id, int) and chat_id < 0:
+                self._check_chat_limit(chat_id, method)
+
+    def _check_chat_limit(self, chat_id: int, method: str):
+        limit, window = self.group_message_limit
+        now = time.monotonic()
+        sends = self._chat_sends[chat_id]
+        while sends and sends[0] <= now - window:
+            sends.popleft()
+        if len(sends) >= limit:
+            self.floods[method] += 1
+            raise flood_error(max(1, math.ceil(sends[0] + window - now)))
+        sends.append(now)
+
+    def latency_for(self, method: str) -> float:
+        return self.method_latency.get(method, self.latency)
+
+    # --- методы ---
+
+    def _member(self, chat_id, user_id) -> dict:
+        user = self.users.get(user_id)
+        if user is None:
+            raise ApiError(400, "Bad Request: user not found")
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            raise ApiError(400, "Bad Request: chat not found")
+        if user_id not in chat["members"]:
+            return {"status": "left", "user": user}
+        if chat["admins"] and chat["admins"][0] == user_id:
+            return {"status": "creator", "user": user, "is_anonymous": False}
+        if user_id in chat["admins"]:
+            return {"status": "administrator", "user": user, **_ADMIN_RIGHTS}
+        return {"status": "member", "user": user}
+
+    def _message(self, chat_id, params) -> dict:
+        self._message_ids += 1
+        chat = self.chats.get(chat_id, {}).get("chat") or {"id": chat_id, "type": "private", "first_name": "User"}
+        message = {"message_id": self._message_ids, "date": int(time.time()), "chat": chat, "from": BOT_USER}
+        if "text" in params:
+            message["text"] = params["text"]
+        if isinstance(params.get("document"), dict):
+            message["document"] = {
+                "file_id": f"document-{self._message_ids}",
+                "file_unique_id": f"u{self._message_ids}",
+                "file_name": params["document"]["filename"],
+                "file_size": params["document"]["size"],
+            }
+            if "caption" in params:
+                message["caption"] = params["caption"]
+        return message
+
+    def call(self, method: str, params: dict):
+        """Результат метода; ошибки - ApiError"""
+        self.calls[method] += 1
+        self._check_flood(method, params)
+        if method == "getMe":
+            return BOT_USER
+        if method in ("setWebhook", "deleteWebhook", "answerCallbackQuery"):
+            return True
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": len(self.updates)}
+        if method in ("sendMessage", "sendDocument"):
+            chat_id = _chat_id(params.get("chat_id"))
+            reply_to = params.get("reply_to_message_id")
+            self.sent.append((time.perf_counter(), chat_id, int(reply_to) if reply_to else None, params.get("text")))
+            return self._message(chat_id, params)
+        if method == "getChatMember":
+            return self._member(_chat_id(params.get("chat_id")), _chat_id(params.get("user_id")))
+        if method == "getChatAdministrators":
+            chat = self.chats.get(_chat_id(params.get("chat_id")))
+            if chat is None:
+                raise ApiError(400, "Bad Request: chat not found")
+            return [self._member(chat["chat"]["id"], user_id) for user_id in chat["admins"]]
+        if method == "getChatMemberCount":
+            chat = self.chats.get(_chat_id(params.get("chat_id")))
+            if chat is None:
+                raise ApiError(400, "Bad Request: chat not found")
+            return len(chat["members"])
+        if method == "getChat":
+            chat_id = _chat_id(params.get("chat_id"))
+            if isinstance(chat_id, str):
+                user_id = self.usernames.get(chat_id.lstrip("@").lower())
+                if user_id is None:
+                    raise ApiError(400, "Bad Request: chat not found")
+                user = self.users[user_id]
+                return {"type": "private", **{key: value for key, value in user.items() if key != "is_bot"}}
+            chat = self.chats.get(chat_id)
+            if chat is None:
+                raise ApiError(400, "Bad Request: chat not found")
+            return chat["chat"]
+        raise ApiError(404, f"Not Found: method {method} is not supported by the fake API")
+
+    async def get_updates(self, params: dict) -> list:
+        """getUpdates с long polling: ждёт до timeout секунд, пока появятся обновления"""
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        while True:
+            # offset подтверждает все обновления до него
+            while self.updates and self.updates[0]["update_id"] < offset:
+                self.updates.popleft()
+            if self.updates or time.monotonic() >= deadline:
+                return list(self.updates)[:limit]
+            await asyncio.sleep(0.05)
+
+    def stats(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "floods": dict(self.floods),
+            "sent": len(self.sent),
+            "pending_updates": len(self.updates),
+        }
+
+    def create_app(self) -> FastAPI:
+        app = FastAPI(title="Fake Telegram Bot API")
+
+        @app.post("/bot{token}/{method}")
+        async def bot_method(token: str, method: str, request: Request):
+            # PTB шлёт параметры формой: urlencoded, а с файлами - multipart
+            content_type = request.headers.get("content-type", "")
+            body = await request.body()
+            if content_type.startswith("multipart/form-data"):
+                params = _parse_multipart(content_type, body)
+            else:
+                params = dict(parse_qsl(body.decode()))
+            delay = self.latency_for(method)
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                if method == "getUpdates":
+                    self.calls[method] += 1
+                    result = await self.get_updates(params)
+                else:
+                    result = self.call(method, params)
+            except ApiError as e:
+                return JSONResponse(e.to_dict(), status_code=e.code)
+            return {"ok": True, "result": result}
+
+        @app.post("/fake/updates")
+        async def push_update(request: Request):
+            return self.push_update(await request.json())
+
+        @app.get("/fake/messages")
+        async def sent_messages(chat_id: int = None):
+            return [
+                {"chat_id": chat, "reply_to_message_id": reply_to, "text": text}
+                for _, chat, reply_to, text in list(self.sent)
+                if chat_id is None or chat == chat_id
+            ]
+
+        @app.get("/fake/stats")
+        async def fake_stats():
+            return self.stats()
+
+        return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeBotApiServer:
+    """uvicorn с FakeBotApi в отдельном потоке"""
+
+    def __init__(self, api: FakeBotApi, host: str = "127.0.0.1", port: int = None):
+        self.api = api
+        self.host = host
+        self.port = port or _free_port()
+        self._server = uvicorn.Server(uvicorn.Config(
+            api.create_app(), host=self.host, port=self.port, log_level="warning", access_log=False,
+        ))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Значение для TELEGRAM_API_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout: float = 10.0):
+        self._thread = threading.Thread(target=self._server.run, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Fake Bot API server did not start")
+            time.sleep(0.01)
+        logger.info(f"Fake Bot API listening on {self.url}")
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_method_latency(values) -> Dict[str, float]:
+    """["sendMessage=0.05", ...] -> {"sendMessage": 0.05}"""
+    result = {}
+    for value in values or ():
+        method, _, seconds = value.partition("=")
+        result[method] = float(seconds)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--members-per-chat", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--method-latency", action="append", metavar="METHOD=SECONDS")
+    parser.add_argument("--flood-probability", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--flood-retry-after", type=int, default=1)
+    parser.add_argument("--group-limit", help="лимит сообщений в группу, например 20/60")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from benchmarks.load_test import Population
+
+    group_limit = None
+    if args.group_limit:
+        count, _, window = args.group_limit.partition("/")
+        group_limit = (int(count), float(window or 60))
+    api = FakeBotApi(
+        latency=args.latency,
+        method_latency=parse_method_latency(args.method_latency),
+        flood_probability=args.flood_probability,
+        flood_retry_after=args.flood_retry_after,
+        group_message_limit=group_limit,
+        seed=args.seed,
+    )
+    Population(random.Random(args.seed), args.users, args.chats, args.members_per_chat).install(api)
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Fake Bot API: {args.users} users, {args.chats} chats on http://{args.host}:{args.port}")
+    uvicorn.run(api.create_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест webhook на синтетических обновлениях Telegram
+
+Генерирует воспроизводимый (--seed) поток обновлений из многих групп:
+команды /getrating, /setrating, /leaderboard, /profile, /start, ответы на
+сообщения, упоминания @username и обычные сообщения. Обновления отправляются
+POST-запросами в FastAPI-приложение app.main прямо в процессе (через
+ASGI-транспорт httpx), а вызовы Bot API уходят в локальную замену
+(benchmarks/fake_bot_api.py) через TELEGRAM_API_URL - сеть не нужна.
+
+Отчёт: обновлений в секунду, перцентили задержки ответа webhook и задержки
+ответа бота (от POST до sendMessage с reply_to этого сообщения), время
+обработчиков и функций storage из /metrics, занятость подключений к базе
+(писатель один - его занятость близкая к 100% означает очередь на запись) и
+вызовы Bot API по методам. С --json результат сохраняется, с --baseline
+сравнивается с прошлым прогоном (код возврата 1 при регрессии).
+
+Запуск:
+    python benchmarks/load_test.py --chats 50 --users 2000 --updates 5000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_bot_api import FakeBotApi, FakeBotApiServer, parse_method_latency
+from benchmarks.webhook_latency import percentile
+
+BOT_TOKEN = "123456:LOAD-TEST"
+BASE_USER_ID = 100000
+BASE_CHAT_ID = -1001000000000
+
+# Виды обновлений и их доли в потоке
+UPDATE_MIX = (
+    ("getrating", 30),
+    ("getrating_mention", 15),
+    ("setrating", 15),
+    ("setrating_mention", 5),
+    ("setrating_reply", 5),
+    ("leaderboard", 10),
+    ("profile", 5),
+    ("start", 5),
+    ("text", 10),
+)
+CHATTER = ("го на корт в 19:00", "кто играет завтра?", "отличная игра!", "👍", "беру ракетку")
+
+
+class Population:
+    """Синтетические пользователи и группы (у каждой группы свои участники и админы)"""
+
+    def __init__(self, rng: random.Random, users: int, chats: int, members_per_chat: int):
+        self.users = [
+            {"id": BASE_USER_ID + index, "is_bot": False, "first_name": f"Player{index}", "username": f"player{index}"}
+            for index in range(users)
+        ]
+        self.chats = {}
+        for index in range(chats):
+            members = rng.sample(self.users, min(members_per_chat, users))
+            self.chats[BASE_CHAT_ID - index] = {
+                "chat": {"id": BASE_CHAT_ID - index, "type": "supergroup", "title": f"Padel {index}"},
+                "members": members,
+                "admins": members[:2],
+            }
+
+    def install(self, api: FakeBotApi):
+        """Передать пользователей и группы фальшивому Bot API"""
+        for user in self.users:
+            api.add_user(user["id"], user["username"], user["first_name"])
+        for chat_id, chat in self.chats.items():
+            api.add_chat(
+                chat_id, chat["chat"]["title"],
+                members=[user["id"] for user in chat["members"]],
+                admins=[user["id"] for user in chat["admins"]],
+            )
+
+
+class UpdateFactory:
+    """JSON обновлений в том виде, в каком их присылает Telegram"""
+
+    def __init__(self, population: Population, rng: random.Random):
+        self.population = population
+        self.rng = rng
+        self.chat_ids = list(population.chats)
+        self.kinds = [kind for kind, _ in UPDATE_MIX]
+        self.weights = [weight for _, weight in UPDATE_MIX]
+        self.update_id = 0
+        self.message_id = 0
+
+    def _message(self, chat: dict, author: dict, text: str, entities=()) -> dict:
+        self.message_id += 1
+        message = {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": chat["chat"],
+            "from": author,
+            "text": text,
+        }
+        if entities:
+            message["entities"] = list(entities)
+        return message
+
+    def _command(self, chat, author, command, *args):
+        text = " ".join((f"/{command}",) + args)
+        entities = [{"type": "bot_command", "offset": 0, "length": len(command) + 1}]
+        for arg in args:
+            if arg.startswith("@"):
+                entities.append({"type": "mention", "offset": text.index(arg), "length": len(arg)})
+        return self._message(chat, author, text, entities)
+
+    def _rating(self) -> str:
+        rating = f"{self.rng.uniform(0.5, 6.0):.1f}"
+        return rating.replace(".", ",") if self.rng.random() < 0.2 else rating
+
+    def make(self) -> dict:
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        chat = self.population.chats[self.rng.choice(self.chat_ids)]
+        author = self.rng.choice(chat["members"])
+        target = self.rng.choice(chat["members"])
+        mention = f"@{target['username']}"
+
+        if kind == "getrating":
+            message = self._command(chat, author, "getrating")
+        elif kind == "getrating_mention":
+            message = self._command(chat, author, "getrating", mention)
+        elif kind == "setrating":
+            message = self._command(chat, author, "setrating", self._rating())
+        elif kind == "setrating_mention":
+            message = self._command(chat, self.rng.choice(chat["admins"]), "setrating", mention, self._rating())
+        elif kind == "setrating_reply":
+            replied = self._message(chat, target, self.rng.choice(CHATTER))
+            message = self._command(chat, self.rng.choice(chat["admins"]), "setrating", self._rating())
+            message["reply_to_message"] = replied
+        elif kind in ("leaderboard", "profile", "start"):
+            message = self._command(chat, author, kind)
+        else:
+            message = self._message(chat, author, self.rng.choice(CHATTER))
+
+        self.update_id += 1
+        return {"update_id": self.update_id, "message": message}
+
+
+class PoolUsage:
+    """Сколько времени подключения пула storage были заняты за прогон"""
+
+    def __init__(self, pool, role: str):
+        self.pool = pool
+        self.role = role
+        self._start = self._counters()
+
+    def _counters(self):
+        return getattr(self.pool, f"{self.role}_checkouts"), getattr(self.pool, f"{self.role}_busy")
+
+    @property
+    def checkouts(self) -> int:
+        return self._counters()[0] - self._start[0]
+
+    @property
+    def busy(self) -> float:
+        return self._counters()[1] - self._start[1]
+
+
+def histogram_summary(child, buckets) -> dict:
+    """count/mean/p95 по гистограмме метрик (p95 - верхняя граница корзины)"""
+    p95 = float("inf")
+    cumulative = 0
+    for bound, count in zip(tuple(buckets) + (float("inf"),), child.counts):
+        cumulative += count
+        if cumulative >= 0.95 * child.count:
+            p95 = bound
+            break
+    return {
+        "count": child.count,
+        "mean_ms": round(child.sum / child.count * 1000, 3) if child.count else 0.0,
+        "p95_ms": p95 * 1000 if p95 != float("inf") else None,
+    }
+
+
+def latency_summary(values) -> dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3),
+    }
+
+
+def configure_environment(args, api_url: str, db_path: str):
+    """Настройки читаются при импорте app.*, поэтому выставляются до него"""
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": api_url,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+        "WEBHOOK_URL": "",
+        "WEBHOOK_DEDUP_PERSIST": "false",
+        "WEBHOOK_QUEUE_SIZE": str(args.queue_size),
+        "TRACE_SAMPLE_RATE": "0",
+    })
+    if not args.telegram_limits:
+        # Без лимитов Telegram измеряется сам бот, а не очередь исходящих
+        os.environ.update({
+            "OUTBOUND_GLOBAL_RATE": "1000000",
+            "OUTBOUND_CHAT_RATE": "1000000",
+            "OUTBOUND_GROUP_RATE": "60000000",
+        })
+
+
+async def wait_idle(update_queue, update_processor, outbound, accepted: int, timeout: float):
+    """Дождаться обработки принятых обновлений и отправки ответов"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        queue = update_queue.stats()
+        done = queue["processed"] + queue["failed"]
+        if (
+            done >= accepted
+            and queue["busy_workers"] == 0
+            and update_processor.stats()["submitted_in_flight"] == 0
+            and outbound.stats()["pending"] == 0
+        ):
+            return True
+        await asyncio.sleep(0.005)
+    return False
+
+
+async def run(args, population: Population, api: FakeBotApi) -> dict:
+    import logging
+
+    import httpx
+
+    from app import main
+    from app.core import metrics
+    from app.services import storage
+    from app.services.outbound import outbound
+
+    # app.main включает INFO-логи на каждое обновление - в тесте они только мешают
+    logging.getLogger().setLevel(args.log_level)
+    await main.startup_event()
+    try:
+        rng = random.Random(args.seed)
+        # Часть игроков уже с рейтингом - как в рабочей базе
+        rated = [
+            (user["id"], round(rng.uniform(0.5, 6.0), 2), None)
+            for user in population.users if rng.random() < args.rated_share
+        ]
+        await storage.create_users(rated)
+
+        factory = UpdateFactory(population, rng)
+        updates = [factory.make() for _ in range(args.updates)]
+
+        writer = PoolUsage(storage.pool, "writer")
+        readers = PoolUsage(storage.pool, "reader")
+        posted_at = {}
+        ack_latencies = []
+        statuses = Counter()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+            async def post(index, update):
+                message = update["message"]
+                if args.rate:
+                    # Открытая нагрузка: обновление i уходит в момент i / rate, не дожидаясь прошлых
+                    await asyncio.sleep(max(0.0, started + index / args.rate - time.perf_counter()))
+                async with semaphore:
+                    sent = time.perf_counter()
+                    posted_at[(message["chat"]["id"], message["message_id"])] = sent
+                    response = await client.post(main.settings.WEBHOOK_PATH, json=update)
+                    ack_latencies.append(time.perf_counter() - sent)
+                    statuses[response.status_code] += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post(index, update) for index, update in enumerate(updates)))
+            idle = await wait_idle(main.update_queue, main.update_processor, outbound, statuses[200], args.timeout)
+            elapsed = time.perf_counter() - started
+
+        reply_latencies = [
+            received - posted_at[(chat_id, reply_to)]
+            for received, chat_id, reply_to, _ in list(api.sent)
+            if (chat_id, reply_to) in posted_at
+        ]
+        handlers = {
+            labels[0]: histogram_summary(child, metrics.handler_duration.buckets)
+            for labels, child in sorted(metrics.handler_duration._children.items()) if child.count
+        }
+        helpers = {
+            labels[0]: histogram_summary(child, metrics.db_duration.buckets)
+            for labels, child in sorted(metrics.db_duration._children.items()) if child.count
+        }
+        return {
+            "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline", "log_level")},
+            "completed": idle,
+            "elapsed_s": round(elapsed, 3),
+            "updates_per_s": round(len(updates) / elapsed, 1),
+            "http_statuses": {str(code): count for code, count in sorted(statuses.items())},
+            "webhook_ack": latency_summary(ack_latencies),
+            "reply": latency_summary(reply_latencies),
+            "handlers": handlers,
+            "handler_errors": {labels[0]: value for labels, value in metrics.handler_errors._values.items()},
+            "db_helpers": helpers,
+            "db_pool": {
+                "writer_busy_share": round(writer.busy / elapsed, 3),
+                "writer_checkouts": writer.checkouts,
+                "reader_busy_share": round(readers.busy / elapsed / main.settings.SQLITE_READ_POOL_SIZE, 3),
+                "reader_checkouts": readers.checkouts,
+            },
+            "bot_api_calls": dict(api.calls.most_common()),
+            "bot_api_floods": dict(api.floods),
+            "update_queue": main.update_queue.stats(),
+            "outbound": outbound.stats(),
+        }
+    finally:
+        await main.shutdown_event()
+
+
+def print_report(result: dict):
+    config = result["config"]
+    print(
+        f"updates={config['updates']} chats={config['chats']} users={config['users']} "
+        f"concurrency={config['concurrency']} rate={config['rate'] or 'max'} api_latency={config['api_latency'] * 1000:.0f}ms seed={config['seed']}"
+    )
+    if not result["completed"]:
+        print("⚠️  Не все обновления обработаны до таймаута")
+    print(f"\nthroughput: {result['updates_per_s']:.1f} updates/s ({result['elapsed_s']:.2f}s)")
+    print(f"http: {result['http_statuses']}")
+    for name in ("webhook_ack", "reply"):
+        summary = result[name]
+        if summary["count"]:
+            print(
+                f"{name:12s} n={summary['count']:6d}  p50={summary['p50_ms']:8.2f}ms  "
+                f"p95={summary['p95_ms']:8.2f}ms  p99={summary['p99_ms']:8.2f}ms  max={summary['max_ms']:8.2f}ms"
+            )
+    for title, rows in (("handlers", result["handlers"]), ("storage", result["db_helpers"])):
+        print(f"\n{title}:")
+        for name, row in sorted(rows.items(), key=lambda item: -item[1]["count"] * item[1]["mean_ms"]):
+            p95 = f"{row['p95_ms']:.1f}" if row["p95_ms"] is not None else ">10000"
+            print(f"  {name:32s} n={row['count']:6d}  mean={row['mean_ms']:8.3f}ms  p95<={p95}ms")
+    if result["handler_errors"]:
+        print(f"\nhandler errors: {result['handler_errors']}")
+    pool = result["db_pool"]
+    print(
+        f"\ndb writer busy {pool['writer_busy_share']:.0%} ({pool['writer_checkouts']} checkouts), "
+        f"readers busy {pool['reader_busy_share']:.0%} ({pool['reader_checkouts']} checkouts)"
+    )
+    print(f"bot api calls: {result['bot_api_calls']}")
+    if result["bot_api_floods"]:
+        print(f"bot api 429: {result['bot_api_floods']}, outbound retries: {result['outbound']['retries']}")
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Регрессии относительно прошлого прогона: (метрика, было, стало)"""
+    regressions = []
+    if result["updates_per_s"] < baseline["updates_per_s"] * (1 - tolerance):
+        regressions.append(("updates_per_s", baseline["updates_per_s"], result["updates_per_s"]))
+    for name in ("reply", "webhook_ack"):
+        for key in ("p50_ms", "p95_ms"):
+            before = baseline.get(name, {}).get(key)
+            after = result[name].get(key)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append((f"{name}.{key}", before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook load test with synthetic updates")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--members-per-chat", type=int, default=40)
+    parser.add_argument("--rated-share", type=float, default=0.5, help="доля игроков с рейтингом в базе")
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных POST в webhook")
+    parser.add_argument("--rate", type=float, default=0, help="обновлений в секунду (0 - как можно быстрее)")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--api-latency", type=float, default=0.02, help="задержка фальшивого Bot API, секунды")
+    parser.add_argument("--method-latency", action="append", metavar="METHOD=SECONDS", help="задержка отдельного метода")
+    parser.add_argument("--flood-probability", type=float, default=0.0, help="доля ответов 429 от Bot API")
+    parser.add_argument("--telegram-limits", action="store_true", help="оставить лимиты исходящих сообщений")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="сравнить с сохранённым результатом")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    population = Population(random.Random(args.seed), args.users, args.chats, args.members_per_chat)
+    api = FakeBotApi(
+        latency=args.api_latency,
+        method_latency=parse_method_latency(args.method_latency),
+        flood_probability=args.flood_probability,
+        seed=args.seed,
+    )
+    population.install(api)
+    server = FakeBotApiServer(api)
+    server.start()
+
+    db_file = tempfile.NamedTemporaryFile(delete=False, suffix=".db")
+    db_file.close()
+    configure_environment(args, server.url, db_file.name)
+    try:
+        result = asyncio.run(run(args, population, api))
+    finally:
+        server.stop()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(db_file.name + suffix)
+            except FileNotFoundError:
+                pass
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != result["config"]:
+            print("⚠️  Параметры прогона отличаются от базового - сравнение приблизительное")
+        regressions = compare(result, baseline, args.tolerance)
+        for metric, before, after in regressions:
+            print(f"❌ {metric}: {before} -> {after}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Нет регрессий больше {args.tolerance:.0%} относительно {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки webhook под конкурентными командами
+
+Сравнивает синхронные хелперы rating_bot.py (sqlite3 прямо в event loop)
+и асинхронный слой app.services.storage. Для каждого режима одновременно
+запускаются N «команд» (ensure_user_exists + get_rating + get_pt_userid +
+set_rating, как в /setrating и /getrating) и лёгкий «пинг» webhook, который
+показывает, насколько долго event loop не может ответить на другие запросы.
+
+Асинхронный слой выполняет те же запросы sqlite3 на подключениях пула, но
+в потоках DB-исполнителя: одна передача в поток на вызов storage. Типичный
+прогон с --commands 5000 (1 ядро, база в WAL):
+
+    sync:  ~5600-6500 cmd/s, команда p99 ~0.2 ms, event loop заблокирован на весь прогон
+    async: ~3300-4200 cmd/s, команда p99 ~30 ms,  event loop p99 ~1-7 ms
+
+Пропускная способность async - 0.55-0.7 от sync (переход в поток и обратно
+на каждый вызов), зато event loop остаётся свободным для других обновлений
+(webhook, Bot API), пока идёт запрос к базе.
+
+Запуск:
+    python benchmarks/webhook_latency.py --users 1000 --commands 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, pct):
+    """Процентиль по отсортированной выборке (nearest-rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def format_ms(values):
+    return (
+        f"p50={percentile(values, 50) * 1000:7.2f}ms  "
+        f"p99={percentile(values, 99) * 1000:7.2f}ms  "
+        f"max={max(values) * 1000:7.2f}ms"
+    )
+
+
+async def run_mode(mode, user_ids, commands, concurrency):
+    """Прогнать команды в режиме sync или async и собрать задержки"""
+    from app.services import rating_bot, storage
+
+    async def command_sync(user_id):
+        rating_bot.ensure_user_exists(user_id, f"user{user_id}", "Bench")
+        rating_bot.get_rating(user_id)
+        rating_bot.get_pt_userid(user_id)
+        rating_bot.set_rating(user_id, round(random.uniform(0.5, 6.0), 2))
+
+    async def command_async(user_id):
+        await storage.ensure_user_exists(user_id, f"user{user_id}", "Bench")
+        await storage.get_rating(user_id)
+        await storage.get_pt_userid(user_id)
+        await storage.set_rating(user_id, round(random.uniform(0.5, 6.0), 2))
+
+    command = command_sync if mode == "sync" else command_async
+    semaphore = asyncio.Semaphore(concurrency)
+    command_latencies = []
+    probe_latencies = []
+    done = asyncio.Event()
+
+    async def webhook(user_id):
+        async with semaphore:
+            started = time.perf_counter()
+            await command(user_id)
+            command_latencies.append(time.perf_counter() - started)
+
+    async def probe():
+        # «Пустой» webhook: сколько ждёт ответ, пока loop занят командами
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0)
+            probe_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.001)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(webhook(random.choice(user_ids)) for _ in range(commands)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    return elapsed, command_latencies, probe_latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Webhook latency benchmark")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--commands", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    db_file = tempfile.NamedTemporaryFile(delete=False, suffix=".db")
+    db_file.close()
+    # Настройки читаются при импорте, поэтому URL выставляем до импорта app.*
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_file.name}"
+
+    from app.models.database import init_db, engine
+    from app.services import rating_bot
+
+    await init_db()
+    user_ids = [100000 + i for i in range(args.users)]
+    conn = rating_bot.get_db_connection()
+    try:
+        conn.executemany(
+            "INSERT INTO user_ratings (telegram_id, telegram_username, first_name, rating) VALUES (?, ?, ?, ?)",
+            [(user_id, f"user{user_id}", "Bench", 0.0) for user_id in user_ids],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"users={args.users} commands={args.commands} concurrency={args.concurrency}")
+    throughput = {}
+    try:
+        for mode in ("sync", "async"):
+            elapsed, commands, probes = await run_mode(mode, user_ids, args.commands, args.concurrency)
+            throughput[mode] = args.commands / elapsed
+            print(f"\n[{mode}] {throughput[mode]:8.1f} cmd/s")
+            print(f"  command latency: {format_ms(commands)}")
+            print(f"  webhook (loop) latency: {format_ms(probes)}  mean={statistics.mean(probes) * 1000:.2f}ms")
+        print(f"\nasync/sync throughput: x{throughput['async'] / throughput['sync']:.3f}")
+    finally:
+        await engine.dispose()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(db_file.name + suffix)
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
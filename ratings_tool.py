@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Массовые операции с рейтингами из командной строки
+
+    python ratings_tool.py import roster.csv
+    python ratings_tool.py --database local_rating_bot.db import roster.json
+    python ratings_tool.py export backup.csv
+    python ratings_tool.py export ratings.parquet --chunk-size 5000
+
+Формат файла определяется по расширению (импорт: csv, json, jsonl; экспорт:
+csv, jsonl, parquet), колонки - как у /importratings: telegram_id или
+username, rating, first_name. Экспорт читает базу пачками и не держит
+таблицу в памяти.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+
+def build_parser():
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Импорт и экспорт рейтингов игроков")
+    parser.add_argument("--database", help="путь к SQLite базе (по умолчанию - DATABASE_URL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="импортировать рейтинги из CSV/JSON/JSONL")
+    import_parser.add_argument("path", help="файл с рейтингами")
+    import_parser.add_argument("--format", choices=("csv", "json", "jsonl"), help="формат файла")
+
+    export_parser = commands.add_parser("export", help="выгрузить всех пользователей в CSV/JSONL/Parquet")
+    export_parser.add_argument("path", help="файл для выгрузки")
+    export_parser.add_argument("--format", choices=("csv", "jsonl", "parquet"), help="формат файла")
+    export_parser.add_argument("--chunk-size", type=int, default=1000, help="строк за одно чтение из базы")
+    return parser
+
+
+async def run_import(path, fmt=None):
+    """Импорт файла одной транзакцией"""
+    from app.models.database import init_db, close_db
+    from app.services import rating_io
+
+    await init_db()
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as source:
+            fmt = fmt or rating_io.detect_format(path)
+            started = time.perf_counter()
+            summary = await rating_io.import_ratings(source, fmt)
+            elapsed = time.perf_counter() - started
+    finally:
+        await close_db()
+
+    print(rating_io.format_summary(summary, max_errors=len(summary.errors)))
+    print(f"⏱️  {elapsed:.3f} с")
+    return summary
+
+
+async def run_export(path, fmt=None, chunk_size=1000):
+    """Выгрузка базы в файл пачками"""
+    from app.models.database import init_db, close_db
+    from app.services import rating_io
+
+    fmt = fmt or path.rsplit(".", 1)[-1].lower()
+    if fmt not in rating_io.EXPORT_FORMATS:
+        print(f"❌ Неизвестный формат: {fmt} (укажите --format)")
+        return None
+
+    await init_db()
+    try:
+        started = time.perf_counter()
+        count = await rating_io.export_ratings(path, fmt, chunk_size)
+        elapsed = time.perf_counter() - started
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return None
+    finally:
+        await close_db()
+
+    print(f"📤 Выгружено пользователей: {count} -> {path}")
+    print(f"⏱️  {elapsed:.3f} с")
+    return count
+
+
+def main():
+    """Главная функция"""
+    args = build_parser().parse_args()
+    if args.database:
+        # Движок создаётся при импорте app.models.database - задаём путь до него
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{args.database}"
+
+    if args.command == "import":
+        if not os.path.exists(args.path):
+            print(f"❌ Файл не найден: {args.path}")
+            sys.exit(1)
+        summary = asyncio.run(run_import(args.path, args.format))
+        sys.exit(1 if summary.errors and not summary.imported else 0)
+    elif args.command == "export":
+        count = asyncio.run(run_export(args.path, args.format, args.chunk_size))
+        sys.exit(1 if count is None else 0)
+
+
+if __name__ == "__main__":
+    main()
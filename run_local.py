@@ -8,15 +8,21 @@ import asyncio
 import logging
 import os
 from dotenv import load_dotenv
+from telegram import Update
 from telegram.ext import Application
 
 # Загружаем переменные окружения
 load_dotenv('.env.local')
 
 # Импортируем обработчики из основного приложения
-from app.services.rating_bot import RatingBot
+from app.core.config import settings
+from app.core.metrics import InstrumentedRequest
+from app.core.tracing import tracer
+from app.services import storage
+from app.services.outbound import outbound
+from app.services.rating_bot import register_handlers
+from app.services.update_processor import ChatOrderedUpdateProcessor
 from app.models.database import init_db
-from telegram.ext import CommandHandler
 
 # Настройка логирования
 logging.basicConfig(
@@ -41,23 +47,27 @@ async def main():
     logger.info("✅ База данных инициализирована")
     
     # Создаем приложение с правильными таймаутами
+    # Обновления одного чата идут по порядку, разные чаты - параллельно
     application = (
         Application.builder()
         .token(bot_token)
-        .get_updates_read_timeout(10)
-        .get_updates_write_timeout(10)
-        .get_updates_connect_timeout(10)
+        .base_url(f"{settings.TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{settings.TELEGRAM_API_URL}/file/bot")
+        .concurrent_updates(ChatOrderedUpdateProcessor(
+            max_concurrent_chats=settings.MAX_CONCURRENT_CHATS,
+            max_pending_updates=settings.MAX_PENDING_UPDATES,
+        ))
+        # Те же пулы и таймауты, что у PTB, плюс счётчики вызовов Bot API,
+        # как в app/main.py (getUpdates считается отдельным методом)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedRequest(
+            connection_pool_size=1, read_timeout=10, write_timeout=10, connect_timeout=10,
+        ))
         .build()
     )
     
     # Добавляем обработчики команд
-    application.add_handler(CommandHandler("start", RatingBot.start_command))
-    application.add_handler(CommandHandler("help", RatingBot.help_command))
-    application.add_handler(CommandHandler("getrating", RatingBot.get_rating_command))
-    application.add_handler(CommandHandler("setrating", RatingBot.set_rating_command))
-    application.add_handler(CommandHandler("setptid", RatingBot.set_pt_userid_command))
-    application.add_handler(CommandHandler("getptid", RatingBot.get_pt_userid_command))
-    application.add_handler(CommandHandler("profile", RatingBot.get_profile_command))
+    register_handlers(application)
     
     logger.info("✅ Обработчики команд добавлены")
     
@@ -69,9 +79,10 @@ async def main():
         # Инициализируем приложение
         await application.initialize()
         await application.start()
+        outbound.start()
         
         # Запуск с polling (опрос сервера Telegram)
-        await application.updater.start_polling()
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
         
         logger.info("✅ Бот успешно запущен и работает!")
         
@@ -105,7 +116,11 @@ async def main():
             logger.info("🔄 Завершение работы...")
             await application.updater.stop()
             await application.stop()
+            # Доотправляем ответы до закрытия HTTP-клиента бота
+            await outbound.close(timeout=settings.WEBHOOK_DRAIN_TIMEOUT)
             await application.shutdown()
+            await storage.flush_writes()
+            await asyncio.to_thread(tracer.close, settings.WEBHOOK_DRAIN_TIMEOUT)
             logger.info("✅ Бот остановлен корректно")
         except Exception as e:
             logger.error(f"Ошибка при остановке: {e}")
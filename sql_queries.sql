@@ -77,6 +77,41 @@ WHERE telegram_id = 123456789;
 -- Удалить пользователя
 DELETE FROM user_ratings WHERE telegram_id = 123456789;
 
+-- 🚀 Индексы
+
+-- Регистронезависимый поиск по @username (создаётся автоматически при старте бота)
+CREATE INDEX IF NOT EXISTS ix_user_ratings_telegram_username_lower
+ON user_ratings (lower(telegram_username));
+
+-- Проверить, что поиск по @username использует индекс, а не сканирует таблицу
+EXPLAIN QUERY PLAN
+SELECT telegram_id FROM user_ratings WHERE lower(telegram_username) = 'john_doe';
+
+-- 📈 История рейтинга
+
+-- Последние изменения рейтинга пользователя (читается по первичному ключу)
+SELECT datetime(ts, 'unixepoch') as changed_at, rating_centi / 100.0 as rating
+FROM rating_history
+WHERE telegram_id = 123456789
+ORDER BY ts DESC
+LIMIT 10;
+
+-- 👥 Участники чатов
+
+-- Топ игроков конкретного чата (chat_members заполняется ботом автоматически)
+SELECT u.telegram_id, u.telegram_username, u.first_name, u.rating
+FROM chat_members m
+JOIN user_ratings u ON u.telegram_id = m.telegram_id
+WHERE m.chat_id = -1001234567890 AND u.rating > 0
+ORDER BY u.rating DESC
+LIMIT 10;
+
+-- Количество известных участников по чатам
+SELECT chat_id, COUNT(*) as members
+FROM chat_members
+GROUP BY chat_id
+ORDER BY members DESC;
+
 -- 🧹 Очистка данных
 
 -- Удалить всех пользователей без рейтинга
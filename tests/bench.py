@@ -0,0 +1,129 @@
+"""
+Микробенчмарки: замеры, JSON-базовые значения и сравнение с ними
+
+Используется в tests/test_benchmarks.py. Бенчмарки включаются переменными
+окружения и в обычном прогоне тестов пропускаются:
+
+    RUN_BENCHMARKS=1                  - запускать бенчмарки
+    BENCH_SIZES=1000,100000,1000000   - размеры таблицы user_ratings (по умолчанию 1000,100000)
+    BENCH_SAVE=baseline.json          - сохранить результаты прогона
+    BENCH_BASELINE=baseline.json      - сравнить с сохранёнными результатами
+    BENCH_TOLERANCE=0.25              - допустимое замедление медианы (доля)
+    BENCH_ROUND_TIME=0.05             - минимальная длительность одного раунда, секунды
+
+Функция вызывается пачками (число вызовов в пачке подбирается так, чтобы
+раунд длился не меньше BENCH_ROUND_TIME), время вызова - медиана по раундам.
+"""
+import json
+import os
+import statistics
+import time
+
+ENABLED = os.getenv("RUN_BENCHMARKS", "").lower() in ("1", "true", "yes")
+SIZES = tuple(int(size) for size in os.getenv("BENCH_SIZES", "1000,100000").split(",") if size.strip())
+SAVE_PATH = os.getenv("BENCH_SAVE", "")
+BASELINE_PATH = os.getenv("BENCH_BASELINE", "")
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))
+ROUND_TIME = float(os.getenv("BENCH_ROUND_TIME", "0.05"))
+ROUNDS = 7
+
+
+def _summary(per_call: list, calls: int) -> dict:
+    median = statistics.median(per_call)
+    return {
+        "median_us": round(median * 1e6, 3),
+        "min_us": round(min(per_call) * 1e6, 3),
+        "ops_per_s": round(1 / median, 1) if median else None,
+        "calls": calls * len(per_call),
+    }
+
+
+def measure(func, rounds: int = ROUNDS) -> dict:
+    """Время одного вызова func() без аргументов"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= ROUND_TIME:
+            break
+        number *= 2
+    per_call = [elapsed / number]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        per_call.append((time.perf_counter() - started) / number)
+    return _summary(per_call, number)
+
+
+async def measure_async(func, rounds: int = ROUNDS) -> dict:
+    """Время одного await func() - для асинхронных функций storage"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            await func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= ROUND_TIME:
+            break
+        number *= 2
+    per_call = [elapsed / number]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            await func()
+        per_call.append((time.perf_counter() - started) / number)
+    return _summary(per_call, number)
+
+
+class BenchmarkResults:
+    """Результаты прогона: запись, сравнение с базовыми значениями, сохранение"""
+
+    def __init__(self, baseline_path: str = BASELINE_PATH, tolerance: float = TOLERANCE):
+        self.tolerance = tolerance
+        self.results = {}
+        self.baseline = {}
+        if baseline_path and os.path.exists(baseline_path):
+            with open(baseline_path, encoding="utf-8") as f:
+                self.baseline = json.load(f).get("results", {})
+
+    def record(self, name: str, stats: dict) -> dict:
+        """Записать замер; к результату добавляется отношение к базовому значению"""
+        before = self.baseline.get(name)
+        if before:
+            stats["baseline_median_us"] = before["median_us"]
+            stats["ratio"] = round(stats["median_us"] / before["median_us"], 3)
+        self.results[name] = stats
+        return stats
+
+    def regression(self, name: str):
+        """Текст о регрессии, если медиана хуже базовой больше чем на tolerance"""
+        stats = self.results[name]
+        if stats.get("ratio") is not None and stats["ratio"] > 1 + self.tolerance:
+            return (
+                f"{name}: {stats['median_us']}us vs baseline {stats['baseline_median_us']}us "
+                f"(x{stats['ratio']}, допустимо x{1 + self.tolerance:.2f})"
+            )
+        return None
+
+    def report(self) -> str:
+        lines = []
+        for name, stats in sorted(self.results.items()):
+            ratio = f"  x{stats['ratio']:.2f}" if "ratio" in stats else ""
+            lines.append(f"{name:55s} {stats['median_us']:12.3f}us  {stats['ops_per_s'] or 0:12.1f} ops/s{ratio}")
+        return "\n".join(lines)
+
+    def save(self, path: str):
+        """Сохранить результаты (дописываются к уже сохранённым в файле)"""
+        saved = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f).get("results", {})
+        saved.update({
+            name: {key: value for key, value in stats.items() if key not in ("baseline_median_us", "ratio")}
+            for name, stats in self.results.items()
+        })
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": saved}, f, indent=2, sort_keys=True)
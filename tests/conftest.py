@@ -0,0 +1,70 @@
+"""
+Общие фикстуры тестов: временная база для app.services.storage
+"""
+import pytest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.models.database import Base
+from app.models.sqlite_pool import SQLiteConnectionPool
+from app.services import storage
+
+
+def reset_storage_state():
+    """Забыть кэши и отложенные записи storage, чтобы они не переходили между тестами"""
+    storage.known_profiles.clear()
+    storage.profile_writes.clear()
+    storage.known_chat_members.clear()
+    storage.chat_member_writes.clear()
+
+
+@pytest.fixture
+def use_storage_database():
+    """Переключить storage на файл базы: use(path) -> engine.
+
+    storage получает свой пул подключений sqlite3, а движок SQLAlchemy
+    возвращается для создания схемы и проверок в тестах. После теста
+    возвращается исходный пул, пулы и движки закрываются, кэши и буферы
+    storage сбрасываются.
+    """
+    original_pool = storage.pool
+    pools = []
+    engines = []
+
+    def use(path: str):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        engines.append(engine)
+        storage.pool = SQLiteConnectionPool(path)
+        pools.append(storage.pool)
+        reset_storage_state()
+        return engine
+
+    reset_storage_state()
+    yield use
+    storage.pool = original_pool
+    reset_storage_state()
+    for pool in pools:
+        pool.close()
+    for engine in engines:
+        asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def storage_db(use_storage_database, tmp_path):
+    """Пустая временная база со всеми таблицами: .engine и .path"""
+    path = str(tmp_path / "test.db")
+    engine = use_storage_database(path)
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_tables())
+    return SimpleNamespace(engine=engine, path=path)
@@ -31,6 +31,30 @@ class TestAPIEndpoints:
         assert response.status_code == 200
         assert response.json() == {"status": "healthy"}
     
+    def test_metrics_endpoint(self):
+        """Тест /metrics: текст Prometheus с очередями и кэшами"""
+        response = client.get("/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'bot_queue_depth{queue="webhook"} 0.0' in response.text
+        assert '# TYPE bot_cache_requests_total counter' in response.text
+        assert 'bot_cache_hit_ratio{cache="profiles"}' in response.text
+    
+    def test_traces_endpoint(self):
+        """Тест /admin/traces: выключен без токена, требует X-Admin-Token"""
+        from unittest.mock import patch
+        from app.core.config import settings
+        
+        assert client.get("/admin/traces").status_code == 404
+        with patch.object(settings, "TRACE_ADMIN_TOKEN", "secret"):
+            assert client.get("/admin/traces", headers={"X-Admin-Token": "wrong"}).status_code == 403
+            response = client.get("/admin/traces?limit=5", headers={"X-Admin-Token": "secret"})
+        
+        assert response.status_code == 200
+        assert isinstance(response.json()["traces"], list)
+        assert "sample_rate" in response.json()["tracing"]
+    
     def test_webhook_endpoint_get(self):
         """Тест webhook эндпоинта с GET запросом (должен возвращать 405)"""
         # Получаем путь webhook из настроек
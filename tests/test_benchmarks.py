@@ -0,0 +1,231 @@
+"""
+Микробенчмарки разбора рейтинга и функций хранения (см. tests/bench.py)
+
+Пропускаются без RUN_BENCHMARKS=1. Сохранить базовые значения и сравнить с ними:
+
+    RUN_BENCHMARKS=1 BENCH_SAVE=tests/benchmark_baseline.json pytest tests/test_benchmarks.py -s
+    RUN_BENCHMARKS=1 BENCH_BASELINE=tests/benchmark_baseline.json pytest tests/test_benchmarks.py -s
+"""
+import pytest
+import sys
+import os
+import asyncio
+import random
+import sqlite3
+import tempfile
+import time
+from itertools import cycle
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+
+from app.models.database import Base
+from app.models.sqlite_pool import close_pool
+from app.services import rating_bot, storage
+from tests import bench
+
+benchmark = pytest.mark.skipif(not bench.ENABLED, reason="бенчмарки включаются RUN_BENCHMARKS=1")
+
+BASE_ID = 1_000_000
+RATING_INPUTS = ("3.5", "2,75", "6", "0.4", "abc", "4.125", "", "5,5")
+# Сколько разных игроков перебирают замеры (чтобы не мерить один и тот же кэшированный ключ)
+SAMPLE = 1000
+
+results = bench.BenchmarkResults()
+_databases = {}
+
+
+def database(size: int) -> str:
+    """Файл базы с size игроками (создаётся один раз на прогон)"""
+    path = _databases.get(size)
+    if path is not None:
+        return path
+    handle = tempfile.NamedTemporaryFile(delete=False, suffix=f"-{size}.db")
+    handle.close()
+    path = handle.name
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        rng = random.Random(size)
+        for start in range(0, size, 50000):
+            conn.executemany(
+                "INSERT INTO user_ratings (telegram_id, telegram_username, first_name, rating, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (BASE_ID + index, f"player{index}", f"Player{index}", round(rng.uniform(0.5, 6.0), 2), now, now)
+                    for index in range(start, min(start + 50000, size))
+                ],
+            )
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    print(f"\n[bench] user_ratings: {size} rows in {time.perf_counter() - started:.1f}s")
+    _databases[size] = path
+    return path
+
+
+def record(name: str, stats: dict):
+    results.record(name, stats)
+    regression = results.regression(name)
+    if regression:
+        pytest.fail(regression)
+
+
+def teardown_module(module):
+    if results.results:
+        print("\n" + results.report())
+    if bench.SAVE_PATH and results.results:
+        results.save(bench.SAVE_PATH)
+    close_pool()
+    for path in _databases.values():
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(path + suffix)
+            except FileNotFoundError:
+                pass
+    _databases.clear()
+
+
+@benchmark
+class TestParsingBenchmarks:
+    """Разбор и проверка рейтинга (без базы)"""
+
+    def test_parse_rating(self):
+        """parse_rating: набор корректных и некорректных строк"""
+        record("parse_rating[x8]", bench.measure(
+            lambda: [rating_bot.parse_rating(value) for value in RATING_INPUTS]
+        ))
+
+    def test_is_valid_rating(self):
+        """is_valid_rating: набор корректных и некорректных строк"""
+        record("is_valid_rating[x8]", bench.measure(
+            lambda: [rating_bot.is_valid_rating(value) for value in RATING_INPUTS]
+        ))
+
+    def test_rating_message(self):
+        """get_playtomic_rating_message по всей шкале"""
+        ratings = [index / 10 for index in range(0, 70)]
+        record("get_playtomic_rating_message[x70]", bench.measure(
+            lambda: [rating_bot.get_playtomic_rating_message(rating) for rating in ratings]
+        ))
+
+
+@benchmark
+@pytest.mark.parametrize("size", bench.SIZES)
+class TestSyncStorageBenchmarks:
+    """Синхронные хелперы rating_bot.py (sqlite3 через пул подключений)"""
+
+    def setup_method(self):
+        self.original_url = os.environ.get("DATABASE_URL")
+        self.rng = random.Random(1)
+
+    def teardown_method(self):
+        close_pool()
+        if self.original_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self.original_url
+
+    def use(self, size: int) -> list:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{database(size)}"
+        return [self.rng.randrange(size) for _ in range(SAMPLE)]
+
+    def test_get_user_id_by_username(self, size):
+        """Поиск по @username (индекс по lower(telegram_username))"""
+        indexes = cycle(self.use(size))
+        record(f"sync.get_user_id_by_username[{size}]", bench.measure(
+            lambda: rating_bot.get_user_id_by_username(f"@Player{next(indexes)}")
+        ))
+
+    def test_get_user_id_by_username_miss(self, size):
+        """Поиск по @username, которого нет в базе"""
+        self.use(size)
+        record(f"sync.get_user_id_by_username_miss[{size}]", bench.measure(
+            lambda: rating_bot.get_user_id_by_username("@nobody_here")
+        ))
+
+    def test_set_rating(self, size):
+        """set_rating: запись через единственного писателя"""
+        indexes = cycle(self.use(size))
+        record(f"sync.set_rating[{size}]", bench.measure(
+            lambda: rating_bot.set_rating(BASE_ID + next(indexes), 3.5)
+        ))
+
+    def test_connection_per_call(self, size):
+        """Для сравнения: то же чтение с новым подключением на каждый вызов"""
+        indexes = cycle(self.use(size))
+
+        def lookup():
+            conn = rating_bot.get_db_connection()
+            try:
+                conn.execute(
+                    "SELECT telegram_id FROM user_ratings WHERE LOWER(telegram_username) = ?",
+                    (f"player{next(indexes)}",),
+                ).fetchone()
+            finally:
+                conn.close()
+
+        record(f"sync.connection_per_call_lookup[{size}]", bench.measure(lookup))
+
+
+@benchmark
+@pytest.mark.parametrize("size", bench.SIZES)
+class TestAsyncStorageBenchmarks:
+    """Асинхронные функции app.services.storage (sqlite3 в потоках DB)"""
+
+    @pytest.fixture(autouse=True)
+    def storage_database(self, use_storage_database):
+        self.use_database = use_storage_database
+        self.rng = random.Random(2)
+
+    def use(self, size: int) -> list:
+        self.use_database(database(size))
+        return [self.rng.randrange(size) for _ in range(SAMPLE)]
+
+    def test_get_user_id_by_username(self, size):
+        """Поиск по @username"""
+        indexes = cycle(self.use(size))
+        record(f"async.get_user_id_by_username[{size}]", asyncio.run(bench.measure_async(
+            lambda: storage.get_user_id_by_username(f"@Player{next(indexes)}")
+        )))
+
+    def test_get_rating(self, size):
+        """Чтение рейтинга по telegram_id"""
+        indexes = cycle(self.use(size))
+        record(f"async.get_rating[{size}]", asyncio.run(bench.measure_async(
+            lambda: storage.get_rating(BASE_ID + next(indexes))
+        )))
+
+    def test_set_rating(self, size):
+        """set_rating с записью в историю"""
+        indexes = cycle(self.use(size))
+        record(f"async.set_rating[{size}]", asyncio.run(bench.measure_async(
+            lambda: storage.set_rating(BASE_ID + next(indexes), 4.0)
+        )))
+
+
+class TestBenchmarkResults:
+    """Сравнение с базовыми значениями"""
+
+    def test_compare_with_baseline(self, tmp_path):
+        """Тест: сохранённые значения становятся базой, регрессия видна по медиане"""
+        path = str(tmp_path / "baseline.json")
+        first = bench.BenchmarkResults()
+        first.record("helper[1000]", {"median_us": 10.0, "min_us": 9.0, "ops_per_s": 100000.0, "calls": 10})
+        first.save(path)
+
+        second = bench.BenchmarkResults(baseline_path=path, tolerance=0.25)
+        second.record("helper[1000]", {"median_us": 14.0, "min_us": 13.0, "ops_per_s": 71428.6, "calls": 10})
+        second.record("new[1000]", {"median_us": 1.0, "min_us": 1.0, "ops_per_s": 1e6, "calls": 10})
+        assert second.results["helper[1000]"]["ratio"] == 1.4
+        assert "x1.4" in second.regression("helper[1000]")
+        assert second.regression("new[1000]") is None
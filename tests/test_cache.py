@@ -0,0 +1,167 @@
+"""
+Тесты для TTL-кэша и кэширования проверки администратора
+"""
+import pytest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.constants import ChatMemberStatus
+
+from app.services.cache import TTLCache
+from app.services.rating_bot import RatingBot, is_admin, admin_cache
+
+
+class FakeClock:
+    """Управляемые часы для проверки TTL"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Тесты для TTLCache"""
+
+    def test_hit_and_miss_counters(self):
+        """Тест счётчиков попаданий и промахов"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        assert cache.get("a") is None
+        cache.set("a", False)
+        assert cache.get("a") is False
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hit_ratio"] == 0.5
+
+    def test_entries_expire(self):
+        """Тест: запись пропадает после TTL"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+        cache.set("a", 1)
+        clock.now = 4.9
+        assert cache.get("a") == 1
+        clock.now = 5.0
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_per_entry_ttl(self):
+        """Тест: TTL можно задать для отдельной записи"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=100, clock=clock)
+        cache.set("short", 1, ttl=1)
+        cache.set("long", 2)
+        clock.now = 2
+        assert cache.get("short") is None
+        assert cache.get("long") == 2
+
+    def test_lru_eviction(self):
+        """Тест: при переполнении вытесняется давно не использованная запись"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_invalidate_matching(self):
+        """Тест выборочного сброса записей"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set((1, 10), True)
+        cache.set((1, 11), False)
+        cache.set((2, 10), True)
+        cache.invalidate_matching(lambda key: key[0] == 1)
+        assert len(cache) == 1
+        assert cache.get((2, 10)) is True
+
+
+def make_update(chat_id=-100, user_id=42):
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id, type="supergroup"),
+        effective_user=SimpleNamespace(id=user_id),
+        chat_member=None,
+        my_chat_member=None,
+    )
+
+
+def make_context(status=ChatMemberStatus.ADMINISTRATOR):
+    bot = SimpleNamespace(get_chat_member=AsyncMock(return_value=SimpleNamespace(status=status)))
+    return SimpleNamespace(bot=bot)
+
+
+class TestIsAdminCache:
+    """Тесты кэширования is_admin"""
+
+    def setup_method(self):
+        admin_cache.clear()
+
+    def teardown_method(self):
+        admin_cache.clear()
+
+    def test_second_check_uses_cache(self):
+        """Тест: повторная проверка не обращается к Telegram"""
+        update, context = make_update(), make_context()
+        assert asyncio.run(is_admin(update, context)) is True
+        assert asyncio.run(is_admin(update, context)) is True
+        assert context.bot.get_chat_member.await_count == 1
+
+    def test_non_admin_is_cached_too(self):
+        """Тест: отрицательный результат тоже кэшируется"""
+        update, context = make_update(), make_context(ChatMemberStatus.MEMBER)
+        assert asyncio.run(is_admin(update, context)) is False
+        assert asyncio.run(is_admin(update, context)) is False
+        assert context.bot.get_chat_member.await_count == 1
+
+    def test_chat_member_update_invalidates(self):
+        """Тест: обновление chat_member сбрасывает запись"""
+        update, context = make_update(), make_context()
+        asyncio.run(is_admin(update, context))
+
+        member_update = SimpleNamespace(
+            chat_member=SimpleNamespace(
+                chat=SimpleNamespace(id=-100),
+                new_chat_member=SimpleNamespace(
+                    status=ChatMemberStatus.MEMBER,
+                    user=SimpleNamespace(id=42, is_bot=False, username="member", first_name="Member"),
+                ),
+            ),
+            my_chat_member=None,
+        )
+        asyncio.run(RatingBot.chat_member_update(member_update, context))
+
+        asyncio.run(is_admin(update, context))
+        assert context.bot.get_chat_member.await_count == 2
+
+    def test_my_chat_member_update_invalidates_chat(self):
+        """Тест: изменение статуса бота сбрасывает весь чат"""
+        context = make_context()
+        asyncio.run(is_admin(make_update(user_id=1), context))
+        asyncio.run(is_admin(make_update(user_id=2), context))
+        asyncio.run(is_admin(make_update(chat_id=-200, user_id=1), context))
+
+        bot_update = SimpleNamespace(
+            chat_member=None,
+            my_chat_member=SimpleNamespace(chat=SimpleNamespace(id=-100)),
+        )
+        asyncio.run(RatingBot.chat_member_update(bot_update, context))
+        assert len(admin_cache) == 1
+
+    def test_private_chat_not_cached(self):
+        """Тест: в личке проверка не выполняется"""
+        update = make_update()
+        update.effective_chat.type = "private"
+        context = make_context()
+        assert asyncio.run(is_admin(update, context)) is False
+        assert context.bot.get_chat_member.await_count == 0
+        assert len(admin_cache) == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
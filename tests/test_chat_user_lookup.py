@@ -4,11 +4,21 @@
 import pytest
 import sys
 import os
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
 
 # Добавляем корневую директорию проекта в путь
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.services.rating_bot import get_user_id_by_username, ensure_user_exists
+from telegram.constants import ChatMemberStatus
+
+from app.services import storage
+
+from app.services.rating_bot import (
+    get_user_id_by_username, ensure_user_exists, get_user_from_chat, RatingBot,
+    user_lookup_cache, chat_admins_cache, admin_cache
+)
 
 
 class MockUser:
@@ -44,5 +54,157 @@ class TestChatUserLookup:
         pass
 
 
+def make_update(chat_id=-100):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id, type="supergroup", title="Padel"))
+
+
+def make_member(user_id, username, first_name, status="member", is_bot=False):
+    user = SimpleNamespace(id=user_id, username=username, first_name=first_name, is_bot=is_bot)
+    return SimpleNamespace(user=user, status=status)
+
+
+def make_context(get_chat=None, get_chat_member=None, admins=()):
+    bot = SimpleNamespace(
+        get_chat=AsyncMock(side_effect=get_chat or Exception("Chat not found")),
+        get_chat_member=AsyncMock(side_effect=get_chat_member or Exception("User not found")),
+        get_chat_administrators=AsyncMock(return_value=list(admins)),
+    )
+    return SimpleNamespace(bot=bot)
+
+
+@pytest.mark.usefixtures("storage_db")  # временная база для chat_members
+class TestGetUserFromChatResolver:
+    """Тесты для кэширующего поиска get_user_from_chat"""
+
+    def setup_method(self):
+        user_lookup_cache.clear()
+        chat_admins_cache.clear()
+        admin_cache.clear()
+
+    def teardown_method(self):
+        user_lookup_cache.clear()
+        chat_admins_cache.clear()
+        admin_cache.clear()
+
+    def test_known_member_found_without_telegram(self):
+        """Тест: известный участник чата находится запросом к chat_members, без Telegram API"""
+        async def scenario(context):
+            await storage.ensure_user_exists(42, "John_Doe", "John")
+            storage.record_chat_member(-100, 42)
+            await storage.flush_writes()
+            return await get_user_from_chat(make_update(), context, "@john_doe")
+
+        context = make_context()
+        assert asyncio.run(scenario(context)) == (42, "John_Doe", "John")
+        assert context.bot.get_chat.await_count == 0
+        assert context.bot.get_chat_administrators.await_count == 0
+
+    def test_member_seen_in_chat_found_without_telegram(self):
+        """Тест: автор сообщений в группе, не вызывавший команд, находится по @username без Bot API"""
+        message_update = SimpleNamespace(
+            chat_member=None,
+            my_chat_member=None,
+            effective_chat=SimpleNamespace(id=-100, type="supergroup"),
+            effective_user=SimpleNamespace(id=77, username="Quiet_Player", first_name="Quiet", is_bot=False),
+        )
+
+        async def scenario(context):
+            await RatingBot.track_chat_activity(message_update, context)
+            await storage.flush_writes()
+            return await get_user_from_chat(make_update(), context, "@quiet_player")
+
+        context = make_context()
+        assert asyncio.run(scenario(context)) == (77, "Quiet_Player", "Quiet")
+        assert context.bot.get_chat.await_count == 0
+        assert context.bot.get_chat_member.await_count == 0
+        assert context.bot.get_chat_administrators.await_count == 0
+
+    def test_found_via_get_chat_and_cached(self):
+        """Тест: пользователь найден через get_chat, повторный поиск идёт из кэша"""
+        member = make_member(42, "John_Doe", "John")
+        context = make_context(
+            get_chat=lambda username: SimpleNamespace(id=42),
+            get_chat_member=lambda chat_id, user_id: member,
+        )
+
+        first = asyncio.run(get_user_from_chat(make_update(), context, "@john_doe"))
+        second = asyncio.run(get_user_from_chat(make_update(), context, "@JOHN_DOE"))
+
+        assert first == second == (42, "John_Doe", "John")
+        assert context.bot.get_chat.await_count == 1
+        assert context.bot.get_chat_member.await_count == 1
+
+    def test_found_among_admins(self):
+        """Тест: запасной поиск среди администраторов"""
+        admin = make_member(7, "boss", "Boss", status="administrator")
+        context = make_context(admins=[admin])
+
+        result = asyncio.run(get_user_from_chat(make_update(), context, "@Boss"))
+
+        assert result == (7, "boss", "Boss")
+        # Список администраторов прогревает кэш is_admin
+        assert admin_cache.get((-100, 7)) is True
+
+    def test_probes_run_concurrently(self):
+        """Тест: оба способа поиска стартуют, не дожидаясь друг друга"""
+        started = []
+
+        async def slow_get_chat(username):
+            started.append("get_chat")
+            await asyncio.sleep(0.05)
+            raise Exception("Chat not found")
+
+        async def get_admins(chat_id):
+            started.append("admins")
+            return []
+
+        context = make_context()
+        context.bot.get_chat = AsyncMock(side_effect=slow_get_chat)
+        context.bot.get_chat_administrators = AsyncMock(side_effect=get_admins)
+
+        asyncio.run(get_user_from_chat(make_update(), context, "@nobody"))
+        assert sorted(started) == ["admins", "get_chat"]
+
+    def test_negative_result_cached(self):
+        """Тест: ненайденный пользователь тоже кэшируется"""
+        context = make_context()
+
+        assert asyncio.run(get_user_from_chat(make_update(), context, "@ghost")) == (None, None, None)
+        assert asyncio.run(get_user_from_chat(make_update(), context, "@ghost")) == (None, None, None)
+        assert context.bot.get_chat.await_count == 1
+        # Список администраторов запрашивается один раз на чат
+        assert context.bot.get_chat_administrators.await_count == 1
+
+    def test_chat_member_update_resets_lookup(self):
+        """Тест: изменение состава чата сбрасывает кэш поиска"""
+        context = make_context()
+        asyncio.run(get_user_from_chat(make_update(), context, "@ghost"))
+
+        member_update = SimpleNamespace(
+            chat_member=SimpleNamespace(
+                chat=SimpleNamespace(id=-100),
+                new_chat_member=SimpleNamespace(
+                    status=ChatMemberStatus.MEMBER,
+                    user=SimpleNamespace(id=99, is_bot=False, username="new_member", first_name="New"),
+                ),
+            ),
+            my_chat_member=None,
+        )
+        asyncio.run(RatingBot.chat_member_update(member_update, context))
+        asyncio.run(get_user_from_chat(make_update(), context, "@ghost"))
+
+        assert context.bot.get_chat.await_count == 2
+        assert context.bot.get_chat_administrators.await_count == 2
+
+    def test_private_chat(self):
+        """Тест: в личном чате поиск не выполняется"""
+        update = make_update()
+        update.effective_chat.type = "private"
+        context = make_context()
+
+        assert asyncio.run(get_user_from_chat(update, context, "@john")) == (None, None, None)
+        assert context.bot.get_chat.await_count == 0
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
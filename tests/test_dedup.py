@@ -0,0 +1,101 @@
+"""
+Тесты для отбрасывания повторных доставок webhook
+"""
+import pytest
+import sys
+import os
+import asyncio
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import storage
+from app.services.dedup import UpdateDeduplicator, WATERMARK_KEY
+
+
+class TestUpdateDeduplicator:
+    """Тесты окна update_id"""
+
+    def test_duplicate_detected(self):
+        """Тест: повтор принятого update_id отбрасывается"""
+        dedup = UpdateDeduplicator(window=10)
+        assert dedup.is_duplicate(100) is False
+        dedup.add(100)
+        assert dedup.is_duplicate(100) is True
+        assert dedup.is_duplicate(101) is False
+
+    def test_window_is_bounded(self):
+        """Тест: окно не растёт больше заданного размера"""
+        dedup = UpdateDeduplicator(window=3)
+        for update_id in range(1, 6):
+            dedup.add(update_id)
+        assert dedup.stats()["size"] == 3
+        assert dedup.is_duplicate(1) is False
+        assert dedup.is_duplicate(5) is True
+        assert dedup.max_update_id == 5
+
+    def test_watermark(self):
+        """Тест: граница из базы действует только в пределах окна"""
+        dedup = UpdateDeduplicator(window=100)
+        dedup.watermark = 1000
+        assert dedup.is_duplicate(1000) is True
+        assert dedup.is_duplicate(950) is True
+        assert dedup.is_duplicate(1001) is False
+        # update_id начался заново после долгого простоя
+        assert dedup.is_duplicate(5) is False
+
+    def test_seen_counts_duplicates(self):
+        """Тест: seen() отбрасывает повтор и учитывает его в статистике"""
+        dedup = UpdateDeduplicator(window=10)
+        assert dedup.seen(100) is False
+        dedup.add(100)
+        assert dedup.seen(100) is True
+        assert dedup.seen(100) is True
+        assert dedup.seen(101) is False
+        assert dedup.stats()["duplicates"] == 2
+
+
+@pytest.mark.usefixtures("storage_db")
+class TestWatermarkPersistence:
+    """Тесты сохранения границы в базе"""
+
+    def test_persist_and_load(self):
+        """Тест: после перезапуска повторы до границы отбрасываются"""
+        async def scenario():
+            before = UpdateDeduplicator(window=100)
+            await before.load()
+            before.add(500)
+            before.add(501)
+            await before.persist()
+            before.add(502)
+            await before.persist()
+
+            after = UpdateDeduplicator(window=100)
+            await after.load()
+            return before, after
+
+        before, after = asyncio.run(scenario())
+        assert before.persisted == 502
+        # В работающем процессе граница не мешает принять пропущенные обновления
+        assert before.watermark is None and before.is_duplicate(499) is False
+        assert after.watermark == 502
+        assert after.is_duplicate(501) is True
+        assert after.is_duplicate(503) is False
+
+    def test_periodic_persist(self):
+        """Тест: граница сохраняется по таймеру, без остановки приложения"""
+        async def scenario():
+            dedup = UpdateDeduplicator(window=100)
+            dedup.start(0.01)
+            dedup.add(700)
+            await asyncio.sleep(0.05)
+            saved = await storage.get_state(WATERMARK_KEY)
+            dedup.add(701)
+            await dedup.close()
+            return saved, await storage.get_state(WATERMARK_KEY)
+
+        assert asyncio.run(scenario()) == ("700", "701")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,183 @@
+"""
+Тесты для локального Bot API (benchmarks/fake_bot_api.py) и путей бота, зависящих от API
+"""
+import pytest
+import sys
+import os
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot, Update
+from telegram.error import BadRequest, RetryAfter
+
+from benchmarks.fake_bot_api import FakeBotApi, FakeBotApiServer, parse_method_latency
+from app.services import rating_bot, storage
+from app.services.outbound import OutboundSender
+
+CHAT_ID = -100500
+OWNER, ADMIN, MEMBER, OUTSIDER = 11, 12, 13, 14
+
+
+class TestFakeBotApi:
+    """Тесты для FakeBotApi через настоящий клиент PTB"""
+
+    def setup_method(self):
+        self.api = FakeBotApi(seed=1)
+        for user_id, name in ((OWNER, "owner"), (ADMIN, "admin"), (MEMBER, "member"), (OUTSIDER, "outsider")):
+            self.api.add_user(user_id, name, name.title())
+        self.api.add_chat(CHAT_ID, "Padel", members=[MEMBER], admins=[OWNER, ADMIN])
+        self.server = FakeBotApiServer(self.api)
+        self.server.start()
+        rating_bot.admin_cache.clear()
+        rating_bot.user_lookup_cache.clear()
+        rating_bot.chat_admins_cache.clear()
+
+    def teardown_method(self):
+        self.server.stop()
+        rating_bot.admin_cache.clear()
+        rating_bot.user_lookup_cache.clear()
+        rating_bot.chat_admins_cache.clear()
+
+    def run_with_bot(self, scenario):
+        async def wrapper():
+            bot = Bot("1:fake", base_url=f"{self.server.url}/bot")
+            async with bot:
+                return await scenario(bot)
+        return asyncio.run(wrapper())
+
+    def group_update(self, user_id):
+        return SimpleNamespace(
+            effective_chat=SimpleNamespace(id=CHAT_ID, type="supergroup", title="Padel"),
+            effective_user=SimpleNamespace(id=user_id),
+        )
+
+    def test_is_admin(self):
+        """Тест: is_admin по статусам владельца, админа и участника"""
+        async def scenario(bot):
+            context = SimpleNamespace(bot=bot)
+            return [await rating_bot.is_admin(self.group_update(user_id), context) for user_id in (OWNER, ADMIN, MEMBER)]
+
+        assert self.run_with_bot(scenario) == [True, True, False]
+        assert self.api.calls["getChatMember"] == 3
+
+    def test_membership_changes(self):
+        """Тест: изменения состава видны в getChatMember"""
+        async def scenario(bot):
+            self.api.remove_member(CHAT_ID, MEMBER)
+            self.api.set_admin(CHAT_ID, OUTSIDER)
+            return (
+                (await bot.get_chat_member(CHAT_ID, MEMBER)).status,
+                (await bot.get_chat_member(CHAT_ID, OUTSIDER)).status,
+                len(await bot.get_chat_administrators(CHAT_ID)),
+            )
+
+        assert self.run_with_bot(scenario) == ("left", "administrator", 3)
+
+    def test_get_user_from_chat(self):
+        """Тест: поиск по @username через getChat + getChatMember"""
+        async def scenario(bot):
+            context = SimpleNamespace(bot=bot)
+            update = self.group_update(OWNER)
+            with patch.object(storage, "find_chat_member_by_username", AsyncMock(return_value=None)), \
+                    patch.object(rating_bot, "remember_chat_member"):
+                found = await rating_bot.get_user_from_chat(update, context, "@Member")
+                missing = await rating_bot.get_user_from_chat(update, context, "@nobody")
+            return found, missing
+
+        found, missing = self.run_with_bot(scenario)
+        assert found == (MEMBER, "member", "Member")
+        assert missing == (None, None, None)
+        assert self.api.calls["getChat"] == 2
+
+    def test_safe_reply_quotes_message(self):
+        """Тест: ответ в группе уходит с reply_to исходного сообщения"""
+        async def scenario(bot):
+            update = Update.de_json({
+                "update_id": 1,
+                "message": {
+                    "message_id": 77, "date": int(time.time()), "text": "/getrating",
+                    "chat": {"id": CHAT_ID, "type": "supergroup", "title": "Padel"},
+                    "from": {"id": MEMBER, "is_bot": False, "first_name": "Member"},
+                },
+            }, bot)
+            await rating_bot.safe_reply(update, "🏆 Ваш рейтинг: 3.5")
+
+        self.run_with_bot(scenario)
+        [(_, chat_id, reply_to, text)] = self.api.sent
+        assert (chat_id, reply_to, text) == (CHAT_ID, 77, "🏆 Ваш рейтинг: 3.5")
+
+    def test_method_latency(self):
+        """Тест: задержка настраивается по методам"""
+        self.api.method_latency = parse_method_latency(["getChat=0.2"])
+
+        async def scenario(bot):
+            started = time.perf_counter()
+            await bot.get_chat_member(CHAT_ID, MEMBER)
+            fast = time.perf_counter() - started
+            started = time.perf_counter()
+            await bot.get_chat(CHAT_ID)
+            return fast, time.perf_counter() - started
+
+        fast, slow = self.run_with_bot(scenario)
+        assert slow >= 0.2
+        assert fast < 0.2
+
+    def test_injected_flood(self):
+        """Тест: 429 из inject_flood - RetryAfter в PTB, очередь исходящих повторяет отправку"""
+        async def scenario(bot):
+            self.api.inject_flood("sendMessage", times=1, retry_after=3)
+            with pytest.raises(RetryAfter) as error:
+                await bot.send_message(CHAT_ID, "first")
+            self.api.inject_flood("sendMessage", times=1, retry_after=1)
+            sender = OutboundSender()
+            sender.start()
+            await sender.send(CHAT_ID, "second", lambda text: bot.send_message(CHAT_ID, text), wait=True)
+            return error.value, sender.stats()
+
+        error, stats = self.run_with_bot(scenario)
+        assert error.retry_after in (3, 3.0) or error.retry_after.total_seconds() == 3
+        assert stats["retries"] == 1 and stats["sent"] == 1
+        assert self.api.floods["sendMessage"] == 2
+        assert [text for _, _, _, text in self.api.sent] == ["second"]
+
+    def test_group_message_limit(self):
+        """Тест: лимит сообщений в группу за окно, личные чаты не ограничены"""
+        self.api.group_message_limit = (2, 60.0)
+
+        async def scenario(bot):
+            await bot.send_message(CHAT_ID, "1")
+            await bot.send_message(CHAT_ID, "2")
+            with pytest.raises(RetryAfter):
+                await bot.send_message(CHAT_ID, "3")
+            for index in range(3):
+                await bot.send_message(MEMBER, str(index))
+
+        self.run_with_bot(scenario)
+        assert self.api.floods["sendMessage"] == 1
+
+    def test_errors_and_updates(self):
+        """Тест: ошибки Bot API и getUpdates с подтверждением offset"""
+        async def scenario(bot):
+            with pytest.raises(BadRequest):
+                await bot.get_chat(-1)
+            self.api.push_update({"message": {
+                "message_id": 1, "date": int(time.time()), "text": "/start",
+                "chat": {"id": MEMBER, "type": "private", "first_name": "Member"},
+                "from": {"id": MEMBER, "is_bot": False, "first_name": "Member"},
+            }})
+            first = await bot.get_updates(timeout=1)
+            second = await bot.get_updates(offset=first[-1].update_id + 1, timeout=0)
+            return first, second
+
+        first, second = self.run_with_bot(scenario)
+        assert [update.message.text for update in first] == ["/start"]
+        assert second == ()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -42,6 +42,14 @@ class TestFloatRatings:
                     updated_at DATETIME
                 )
             """)
+            conn.execute("""
+                CREATE TABLE rating_history (
+                    telegram_id INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    rating_centi INTEGER NOT NULL,
+                    PRIMARY KEY (telegram_id, ts)
+                ) WITHOUT ROWID
+            """)
             conn.commit()
         finally:
             conn.close()
@@ -0,0 +1,310 @@
+"""
+Тесты для топа игроков (/leaderboard)
+"""
+import pytest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import storage
+from app.services.leaderboard import RankingIndex, Leaderboard
+from app.services.rating_bot import RatingBot
+import app.services.rating_bot as rating_bot
+
+
+class TestRankingIndex:
+    """Тесты для RankingIndex"""
+
+    def test_order_and_rank(self):
+        """Тест: игроки упорядочены по убыванию рейтинга"""
+        index = RankingIndex()
+        index.set(1, 2.5)
+        index.set(2, 4.0)
+        index.set(3, 3.0)
+        assert index.page(0, 10) == [(2, 4.0), (3, 3.0), (1, 2.5)]
+        assert index.rank(2) == 1
+        assert index.rank(1) == 3
+        assert index.rank(99) is None
+
+    def test_update_moves_player(self):
+        """Тест: новый рейтинг перемещает игрока"""
+        index = RankingIndex()
+        index.set(1, 2.5)
+        index.set(2, 4.0)
+        index.set(1, 5.0)
+        assert index.page(0, 10) == [(1, 5.0), (2, 4.0)]
+        assert len(index) == 2
+
+    def test_ties_share_rank(self):
+        """Тест: равный рейтинг - одинаковое место"""
+        index = RankingIndex()
+        index.set(1, 3.0)
+        index.set(2, 3.0)
+        index.set(3, 2.0)
+        assert index.rank(1) == index.rank(2) == 1
+        assert index.rank(3) == 3
+
+    def test_zero_rating_removes(self):
+        """Тест: нулевой рейтинг убирает игрока из индекса"""
+        index = RankingIndex()
+        index.set(1, 3.0)
+        index.set(1, 0)
+        assert len(index) == 0
+        assert 1 not in index
+
+    def test_page_offset(self):
+        """Тест постраничного вывода"""
+        index = RankingIndex()
+        for telegram_id in range(1, 21):
+            index.set(telegram_id, telegram_id / 4)
+        assert [telegram_id for telegram_id, _ in index.page(5, 3)] == [15, 14, 13]
+
+
+class TestLeaderboard:
+    """Тесты для Leaderboard с загрузкой из базы"""
+
+    @pytest.fixture(autouse=True)
+    def players(self, storage_db):
+        """Игроки во временной базе"""
+        async def fill():
+            await storage.set_rating(1, 2.5, "alice", "Alice")
+            await storage.set_rating(2, 4.0, "bob", "Bob")
+            await storage.set_rating(3, 3.0, "carol", "Carol")
+            await storage.ensure_user_exists(4, "dave", "Dave")  # без рейтинга
+
+        asyncio.run(fill())
+        self.leaderboard = Leaderboard()
+
+    def test_global_top_loads_lazily(self):
+        """Тест: общий топ загружается из базы при первом запросе"""
+        assert self.leaderboard.loaded is False
+        entries = asyncio.run(self.leaderboard.top(None, 10))
+        assert [(e.rank, e.telegram_id, e.rating, e.username) for e in entries] == [
+            (1, 2, 4.0, "bob"), (2, 3, 3.0, "carol"), (3, 1, 2.5, "alice"),
+        ]
+        assert self.leaderboard.loaded is True
+
+    def test_chat_top_contains_only_members(self):
+        """Тест: топ чата - только его участники"""
+        self.leaderboard.add_member(-100, 1)
+        self.leaderboard.add_member(-100, 3)
+        self.leaderboard.add_member(-100, 4)
+        entries = asyncio.run(self.leaderboard.top(-100, 10))
+        assert [e.telegram_id for e in entries] == [3, 1]
+        assert asyncio.run(self.leaderboard.rank(-100, 1)) == (2, 2)
+        assert asyncio.run(self.leaderboard.rank(-100, 4)) == (None, 2)
+
+    def test_chat_members_loaded_from_database(self):
+        """Тест: после перезапуска состав чата читается из chat_members"""
+        async def scenario():
+            storage.record_chat_member(-100, 2)
+            storage.record_chat_member(-100, 3)
+            await storage.flush_writes()
+            storage.known_chat_members.clear()
+            return await Leaderboard().top(-100, 10)
+
+        entries = asyncio.run(scenario())
+        assert [e.telegram_id for e in entries] == [2, 3]
+
+    def test_updates_without_database(self):
+        """Тест: после загрузки изменения применяются в памяти, без запросов к базе"""
+        self.leaderboard.add_member(-100, 1)
+        self.leaderboard.add_member(-100, 2)
+        asyncio.run(self.leaderboard.top(-100, 10))
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("leaderboard should not query the database")
+
+        original = storage.get_ratings
+        storage.get_ratings = fail
+        try:
+            self.leaderboard.record_rating(1, 5.5, "alice", "Alice")
+            self.leaderboard.add_member(-100, 3)
+            self.leaderboard.remove_member(-100, 2)
+            entries = asyncio.run(self.leaderboard.top(-100, 10))
+        finally:
+            storage.get_ratings = original
+        assert [(e.telegram_id, e.rating) for e in entries] == [(1, 5.5), (3, 3.0)]
+
+
+    def test_members_leaving_are_pruned(self):
+        """Тест: вышедшие участники и опустевший чат удаляются из индексов"""
+        self.leaderboard.add_member(-100, 1, "alice", "Alice")
+        self.leaderboard.add_member(-100, 4, "dave", "Dave")
+        asyncio.run(self.leaderboard.top(-100, 10))
+        self.leaderboard.remove_member(-100, 1)
+        self.leaderboard.remove_member(-100, 4)
+        stats = self.leaderboard.stats()
+        assert (stats["chats"], stats["chat_indexes"], stats["users_in_chats"]) == (0, 0, 0)
+        assert asyncio.run(self.leaderboard.top(-100, 10)) == []
+
+    def test_names_kept_only_for_rated_players(self):
+        """Тест: имена участников без рейтинга не накапливаются"""
+        asyncio.run(self.leaderboard.top(None, 10))
+        for telegram_id in range(100, 150):
+            self.leaderboard.add_member(-100, telegram_id, f"user{telegram_id}", "Unrated")
+        assert self.leaderboard.stats()["names"] == 3
+        self.leaderboard.record_rating(100, 5.0, "user100", "Rated")
+        self.leaderboard.record_rating(1, 0)
+        entries = asyncio.run(self.leaderboard.top(None, 10))
+        assert entries[0].username == "user100"
+        assert self.leaderboard.stats()["names"] == 3
+
+    def test_clear_during_load_reloads(self):
+        """Тест: clear() во время загрузки не даёт установить устаревший индекс"""
+        original = storage.get_ratings
+        calls = []
+
+        async def scenario():
+            started = asyncio.Event()
+            release = asyncio.Event()
+
+            async def get_ratings():
+                calls.append(1)
+                rows = await original()
+                if len(calls) == 1:
+                    started.set()
+                    await release.wait()
+                return rows
+
+            storage.get_ratings = get_ratings
+            loading = asyncio.create_task(self.leaderboard.top(None, 10))
+            await started.wait()
+            # Пересчёт рейтингов пачкой, пока первая загрузка ещё не закончилась
+            await storage.set_rating(1, 5.5, "alice", "Alice")
+            self.leaderboard.clear()
+            release.set()
+            return await loading
+
+        try:
+            entries = asyncio.run(scenario())
+        finally:
+            storage.get_ratings = original
+        assert len(calls) == 2
+        assert [(e.telegram_id, e.rating) for e in entries][0] == (1, 5.5)
+
+    def test_clear_during_members_load(self):
+        """Тест: clear() во время чтения состава чата не ломает топ чата"""
+        original = storage.get_chat_member_ids
+
+        async def scenario():
+            storage.record_chat_member(-100, 1)
+            storage.record_chat_member(-100, 2)
+            await storage.flush_writes()
+            await self.leaderboard.top(None, 10)
+
+            async def get_chat_member_ids(chat_id):
+                rows = await original(chat_id)
+                # /importratings сбрасывает индексы, пока состав ещё читается
+                self.leaderboard.clear()
+                return rows
+
+            storage.get_chat_member_ids = get_chat_member_ids
+            return await self.leaderboard.top(-100, 10)
+
+        try:
+            entries = asyncio.run(scenario())
+        finally:
+            storage.get_chat_member_ids = original
+        assert [(e.telegram_id, e.rating) for e in entries] == [(2, 4.0), (1, 2.5)]
+
+    def test_add_member_after_clear(self):
+        """Тест: add_member без общего индекса не обращается к нему"""
+        self.leaderboard.add_member(-100, 1)
+        asyncio.run(self.leaderboard.top(-100, 10))
+        self.leaderboard._global = None  # индекс чата остался, общий сброшен
+        self.leaderboard.add_member(-100, 2)
+        self.leaderboard.clear()
+        entries = asyncio.run(self.leaderboard.top(-100, 10))
+        assert [e.telegram_id for e in entries] == [2, 1]
+
+class TestLeaderboardCommand:
+    """Тесты команды /leaderboard"""
+
+    def setup_method(self):
+        self.original = rating_bot.leaderboard
+        rating_bot.leaderboard = Leaderboard()
+        rating_bot.leaderboard._global = RankingIndex()
+        rating_bot.leaderboard._members_loaded.add(-100)
+        for telegram_id, rating, name in ((1, 2.5, "Alice"), (2, 4.0, "Bob"), (3, 3.0, "Carol")):
+            rating_bot.leaderboard.record_rating(telegram_id, rating, name.lower(), name)
+            rating_bot.leaderboard.add_member(-100, telegram_id)
+
+    def teardown_method(self):
+        rating_bot.leaderboard = self.original
+
+    def make_update(self, user_id=1, chat_type="supergroup"):
+        message = SimpleNamespace(reply_text=AsyncMock())
+        return SimpleNamespace(
+            message=message,
+            effective_chat=SimpleNamespace(id=-100, type=chat_type),
+            effective_user=SimpleNamespace(id=user_id),
+        )
+
+    def test_top_with_own_place(self):
+        """Тест: топ и место пользователя вне топа"""
+        update = self.make_update(user_id=1)
+        asyncio.run(RatingBot.leaderboard_command(update, SimpleNamespace(args=["2"])))
+        text = update.message.reply_text.await_args.args[0]
+        assert "1. 🥇 Bob (@bob) — 4.0" in text
+        assert "2. 🥈 Carol (@carol) — 3.0" in text
+        assert "Alice" not in text
+        assert "Ваше место: 3 из 3" in text
+
+    def test_invalid_argument(self):
+        """Тест: некорректный N - подсказка по использованию"""
+        update = self.make_update()
+        asyncio.run(RatingBot.leaderboard_command(update, SimpleNamespace(args=["abc"])))
+        assert "Использование" in update.message.reply_text.await_args.args[0]
+
+
+@pytest.mark.usefixtures("storage_db")
+class TestCreateUserCommand:
+    """Тесты команды /createuser"""
+
+    def setup_method(self):
+        self.original = rating_bot.leaderboard
+        rating_bot.leaderboard = Leaderboard()
+        rating_bot.leaderboard._global = RankingIndex()
+
+    def teardown_method(self):
+        rating_bot.leaderboard = self.original
+
+    def run_command(self, *args):
+        update = SimpleNamespace(message=SimpleNamespace(reply_text=AsyncMock()))
+        with patch("app.services.rating_bot.is_admin", AsyncMock(return_value=True)):
+            asyncio.run(RatingBot.create_user_command(update, SimpleNamespace(args=list(args))))
+        return update.message.reply_text.await_args.args[0]
+
+    def test_rating_with_comma(self):
+        """Тест: рейтинг с запятой записывается в базу и в топ"""
+        text = self.run_command("42", "3,5", "pt42")
+        assert "3.5" in text
+        assert asyncio.run(storage.get_rating(42)) == 3.5
+        assert rating_bot.leaderboard._global.page(0, 10) == [(42, 3.5)]
+
+    def test_rating_out_of_scale_rejected(self):
+        """Тест: рейтинг вне шкалы 0.5-6.0 не создаёт пользователя и не попадает в топ"""
+        for value in ("25", "0.1", "abc"):
+            text = self.run_command("42", value)
+            assert text.startswith("❌")
+        assert asyncio.run(storage.user_exists_in_db(42)) is False
+        assert rating_bot.leaderboard._global.page(0, 10) == []
+
+    def test_create_user_timed_once(self):
+        """Тест: создание пользователя попадает в метрику БД один раз"""
+        from app.core import metrics
+        create_users = metrics.db_duration.labels("create_users")
+        create_user = metrics.db_duration.labels("create_user")
+        before = (create_users.count, create_user.count)
+        self.run_command("42")
+        assert (create_users.count, create_user.count) == (before[0] + 1, before[1])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
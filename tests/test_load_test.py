@@ -0,0 +1,60 @@
+"""
+Тесты для генератора обновлений нагрузочного теста (benchmarks/load_test.py)
+"""
+import pytest
+import sys
+import os
+import random
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+
+from benchmarks.load_test import Population, UpdateFactory, compare
+
+
+def make_updates(seed, count=200):
+    population = Population(random.Random(seed), users=100, chats=5, members_per_chat=20)
+    factory = UpdateFactory(population, random.Random(seed))
+    return [factory.make() for _ in range(count)]
+
+
+class TestLoadTest:
+    """Тесты для синтетических обновлений"""
+
+    def test_reproducible(self):
+        """Тест: одинаковый seed - одинаковый поток (кроме времени отправки)"""
+        def strip_dates(update):
+            message = dict(update["message"], date=0)
+            if "reply_to_message" in message:
+                message["reply_to_message"] = dict(message["reply_to_message"], date=0)
+            return message
+
+        first, second = make_updates(1), make_updates(1)
+        assert [strip_dates(update) for update in first] == [strip_dates(update) for update in second]
+        assert [strip_dates(update) for update in make_updates(2)] != [strip_dates(update) for update in first]
+
+    def test_updates_parse_as_commands(self):
+        """Тест: обновления разбираются PTB, команды и упоминания размечены"""
+        updates = [Update.de_json(data, None) for data in make_updates(3)]
+        commands = [update for update in updates if update.message.text.startswith("/")]
+        assert commands
+        for update in commands:
+            command = update.message.parse_entities(["bot_command"])
+            assert list(command.values())[0] == update.message.text.split()[0]
+        mentions = [update for update in updates if update.message.parse_entities(["mention"])]
+        assert mentions
+        assert all(update.effective_chat.type == "supergroup" for update in updates)
+        replies = [update for update in updates if update.message.reply_to_message]
+        assert all(update.message.text.startswith("/setrating") for update in replies)
+
+    def test_compare(self):
+        """Тест: регрессия - падение пропускной способности или рост задержки сверх допуска"""
+        baseline = {"updates_per_s": 100.0, "reply": {"p50_ms": 10.0, "p95_ms": 50.0}, "webhook_ack": {}}
+        result = {"updates_per_s": 95.0, "reply": {"p50_ms": 11.0, "p95_ms": 70.0}, "webhook_ack": {}}
+        assert compare(result, baseline, tolerance=0.2) == [("reply.p95_ms", 50.0, 70.0)]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
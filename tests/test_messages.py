@@ -0,0 +1,89 @@
+"""
+Тесты для текстов ответов бота (app.services.messages)
+"""
+import pytest
+import sys
+import os
+import subprocess
+from unittest.mock import patch
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import messages
+from app.services.rating_bot import get_playtomic_rating_message
+
+
+def tier_by_branches(rating):
+    """Прежняя цепочка условий - эталон для таблицы уровней"""
+    if rating > 6.0:
+        return messages.RATING_TOO_HIGH
+    elif rating < 0.5:
+        return messages.RATING_TOO_LOW
+    elif rating >= 5.5:
+        return "🏆 ПРО уровень! Очень сильный игрок!"
+    elif rating >= 4.5:
+        return "💪 Отличный игрок!"
+    elif rating >= 3.5:
+        return "👍 Хороший игрок!"
+    elif rating >= 2.5:
+        return "📈 Развивающийся игрок!"
+    elif rating >= 1.5:
+        return "🌱 Начинающий игрок!"
+    else:
+        return "🎯 Начинающий путь в паделе!"
+
+
+class TestMessages:
+    """Тесты для app.services.messages"""
+
+    def test_tier_table_matches_branches(self):
+        """Тест: bisect по таблице даёт те же описания, что и цепочка условий"""
+        for centi in range(0, 701):
+            rating = centi / 100
+            assert messages.rating_tier_message(rating) == tier_by_branches(rating), rating
+            assert get_playtomic_rating_message(rating) == tier_by_branches(rating)
+
+    def test_static_texts_are_shared(self):
+        """Тест: статические тексты - один объект на процесс"""
+        assert messages.HELP_ADMIN is sys.intern("".join(messages.HELP_ADMIN))
+        assert "/importratings" in messages.HELP_ADMIN
+        assert "/importratings" not in messages.HELP_USER
+
+    def test_debug_suffix_gated(self):
+        """Тест: отладочная строка только при REPLY_DEBUG_INFO"""
+        with patch.object(messages.settings, "REPLY_DEBUG_INFO", False):
+            assert messages.debug_suffix(target_user_id=1) == ""
+        with patch.object(messages.settings, "REPLY_DEBUG_INFO", True):
+            assert messages.debug_suffix(target_user_id=1, args=[]) == "\n🔍 Отладка: target_user_id=1, args=[]"
+
+    def test_render_rating(self):
+        """Тест ответа /getrating"""
+        assert messages.render_rating("@john", 4.6, "john_pt") == (
+            "🏆 @john рейтинг: 4.6 (PlayTomic: john_pt)\n\n💪 Отличный игрок!"
+        )
+        assert messages.render_rating("Ваш", 0.0, own=True).startswith("🏆 Ваш рейтинг: 0.0\n\n💡 Ваш рейтинг не установлен!")
+        assert messages.render_rating("@john", 0.0).endswith("У пользователя @john рейтинг не установлен.")
+
+    def test_render_welcome(self):
+        """Тест приветствия /start"""
+        new = messages.render_welcome("Иван", 0.0, new_user=True)
+        back = messages.render_welcome("Иван", 3.5, new_user=False)
+        assert new.startswith("🎾 Добро пожаловать в Rating Bot, Иван!")
+        assert "📊 Ваш текущий рейтинг: 3.5" in back
+        assert new.endswith("/help - Помощь") and back.endswith("/help - Помощь")
+
+    def test_import_does_not_load_numpy(self):
+        """Тест: тексты ответов не тянут NumPy через rating_engine"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = "import sys, app.services.messages; print('numpy' in sys.modules)"
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=root, capture_output=True, text=True,
+            env={**os.environ, "BOT_TOKEN": os.environ.get("BOT_TOKEN", "1:test")},
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "False"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,98 @@
+"""
+Тесты для метрик Prometheus (app.core.metrics)
+"""
+import pytest
+import sys
+import os
+import asyncio
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import metrics
+from app.core.metrics import Registry, instrument_handler, timed_db, telegram_method
+
+
+class TestMetrics:
+    """Тесты для реестра и инструментирования"""
+
+    def setup_method(self):
+        self.registry = Registry()
+
+    def test_histogram_render(self):
+        """Тест: корзины гистограммы накопительные, +Inf равен count"""
+        histogram = self.registry.histogram("latency_seconds", "Latency", ("handler",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "start")
+        histogram.observe(0.5, "start")
+        histogram.observe(5.0, "start")
+        text = self.registry.render()
+        assert '# TYPE latency_seconds histogram' in text
+        assert 'latency_seconds_bucket{handler="start",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{handler="start",le="1.0"} 2' in text
+        assert 'latency_seconds_bucket{handler="start",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{handler="start"} 3' in text
+        assert 'latency_seconds_sum{handler="start"} 5.55' in text
+
+    def test_counter_and_label_escaping(self):
+        """Тест счётчика и экранирования значений меток"""
+        counter = self.registry.counter("calls_total", "Calls", ("method",))
+        counter.inc('say "hi"')
+        counter.inc('say "hi"', amount=2)
+        assert 'calls_total{method="say \\"hi\\""} 3.0' in self.registry.render()
+
+    def test_gauge_function(self):
+        """Тест: gauge вычисляется при чтении, ошибка не ломает остальные метрики"""
+        depth = {"webhook": 1}
+        self.registry.gauge_function("depth", "Depth", ("queue",), lambda: depth)
+        self.registry.gauge_function("broken", "Broken", (), lambda: 1 / 0)
+        self.registry.counter_function("total", "Total", (), lambda: {(): 7})
+        depth["webhook"] = 4
+        text = self.registry.render()
+        assert 'depth{queue="webhook"} 4.0' in text
+        assert '# TYPE broken gauge' in text
+        assert '# TYPE total counter' in text and 'total 7.0' in text
+
+    def test_instrument_handler(self):
+        """Тест: обёртка обработчика считает время и исключения"""
+        async def test_metrics_ok(update, context):
+            return "ok"
+
+        async def test_metrics_fail(update, context):
+            raise ValueError("boom")
+
+        ok = instrument_handler(test_metrics_ok)
+        fail = instrument_handler(test_metrics_fail)
+        assert ok.__name__ == "test_metrics_ok"
+        assert asyncio.run(ok(None, None)) == "ok"
+        with pytest.raises(ValueError):
+            asyncio.run(fail(None, None))
+        assert metrics.handler_duration.labels("test_metrics_ok").count == 1
+        assert metrics.handler_duration.labels("test_metrics_fail").count == 1
+        assert metrics.handler_errors.value("test_metrics_fail") == 1
+        assert metrics.handler_errors.value("test_metrics_ok") == 0
+
+    def test_timed_db(self):
+        """Тест: декоратор storage пишет время вызова в гистограмму helper"""
+        @timed_db
+        async def test_metrics_query(value):
+            return value * 2
+
+        child = metrics.db_duration.labels("test_metrics_query")
+        before = child.count
+        assert asyncio.run(test_metrics_query(21)) == 42
+        assert child.count == before + 1
+
+    def test_storage_helpers_are_timed(self):
+        """Тест: функции storage зарегистрированы в метрике БД"""
+        from app.services import storage
+        assert storage.get_rating.__wrapped__ is not None
+        assert 'helper="get_rating"' in metrics.registry.render()
+
+    def test_telegram_method(self):
+        """Тест: имя метода Bot API без токена"""
+        assert telegram_method("https://api.telegram.org/bot123:abc/sendMessage") == "sendMessage"
+        assert telegram_method("https://api.telegram.org/file/bot123:abc/documents/file_1.csv") == "getFileContent"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,253 @@
+"""
+Тесты для очереди исходящих сообщений (лимиты, объединение, повтор после 429)
+"""
+import pytest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import BadRequest, RetryAfter
+
+from app.services.outbound import OutboundSender, TokenBucket, MAX_MESSAGE_LENGTH
+from app.services import rating_bot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    """Тесты для TokenBucket"""
+
+    def test_burst_then_rate(self):
+        """Тест: запас capacity уходит сразу, дальше - по rate"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == pytest.approx(0.5)
+        # Следующий токен занят "в долг" - ждать дольше
+        assert bucket.reserve() == pytest.approx(1.0)
+        clock.now = 10
+        assert bucket.reserve() == 0
+
+
+class TestOutboundSender:
+    """Тесты для OutboundSender"""
+
+    def test_direct_send_when_not_started(self):
+        """Тест: до start() сообщения отправляются сразу"""
+        sender = OutboundSender()
+        send = AsyncMock(return_value="message")
+        assert asyncio.run(sender.send(1, "hi", send)) == "message"
+        send.assert_awaited_once_with("hi")
+        assert sender.stats()["queued"] == 0
+
+    def test_consecutive_replies_are_merged(self):
+        """Тест: ответы подряд в один чат уходят одним сообщением"""
+        async def scenario():
+            sender = OutboundSender(chat_rate=1000, chat_burst=1)
+            sender.start()
+            sent = []
+
+            async def send(text):
+                sent.append(text)
+
+            await sender.send(1, "первый", send)
+            await sender.send(1, "второй", send)
+            await sender.send(2, "другой чат", send)
+            await sender.close(timeout=1)
+            return sent, sender.stats()
+
+        sent, stats = asyncio.run(scenario())
+        assert sorted(sent) == ["другой чат", "первый\n\nвторой"]
+        assert stats["merged"] == 1
+        assert stats["sent"] == 2
+        assert stats["pending"] == 0
+
+    def test_merge_respects_message_limit(self):
+        """Тест: объединение не превышает лимит длины сообщения Telegram"""
+        async def scenario():
+            sender = OutboundSender()
+            sender.start()
+            sent = []
+
+            async def send(text):
+                sent.append(text)
+
+            long_text = "x" * (MAX_MESSAGE_LENGTH - 10)
+            await sender.send(1, long_text, send)
+            await sender.send(1, "y" * 20, send)
+            await sender.close(timeout=1)
+            return sent
+
+        sent = asyncio.run(scenario())
+        assert len(sent) == 2
+        assert all(len(text) <= MAX_MESSAGE_LENGTH for text in sent)
+
+    def test_chat_rate_limit(self):
+        """Тест: сообщения одного чата идут не быстрее лимита чата"""
+        async def scenario():
+            sender = OutboundSender(chat_rate=20, chat_burst=1)
+            sender.start()
+            times = []
+            loop = asyncio.get_running_loop()
+
+            async def send(text):
+                times.append(loop.time())
+
+            for index in range(3):
+                # wait=True - следующий ответ не дописывается к уже отправленному
+                await sender.send(1, str(index), send, wait=True)
+            return times
+
+        times = asyncio.run(scenario())
+        assert len(times) == 3
+        assert times[2] - times[0] >= 0.09
+
+    def test_retry_after(self):
+        """Тест: после 429 сообщение отправляется повторно"""
+        async def scenario():
+            sender = OutboundSender()
+            sender.start()
+            send = AsyncMock(side_effect=[RetryAfter(0), "ok"])
+            result = await sender.send(1, "hi", send, wait=True)
+            return result, send.await_count, sender.stats()
+
+        result, attempts, stats = asyncio.run(scenario())
+        assert result == "ok"
+        assert attempts == 2
+        assert stats["retries"] == 1
+
+    def test_wait_raises_delivery_error(self):
+        """Тест: с wait=True ошибка доставки пробрасывается обработчику"""
+        async def scenario():
+            sender = OutboundSender()
+            sender.start()
+            send = AsyncMock(side_effect=BadRequest("Chat not found"))
+            with pytest.raises(BadRequest):
+                await sender.send(1, "hi", send, wait=True)
+            # Без wait ошибка только логируется
+            await sender.send(1, "hi", send)
+            await sender.close(timeout=1)
+            return sender.stats()
+
+        assert asyncio.run(scenario())["errors"] == 2
+
+    def test_replies_to_different_messages_are_not_merged(self):
+        """Тест: ответ другому сообщению не дописывается к чужому, ответы тому же - дописываются"""
+        async def scenario():
+            sender = OutboundSender(chat_rate=1000, chat_burst=1)
+            sender.start()
+            sent = []
+
+            def reply(message_id):
+                async def send(text):
+                    sent.append((message_id, text))
+                    return f"reply-{message_id}"
+                return send
+
+            results = await asyncio.gather(
+                sender.send(1, "A", reply(10), wait=True, reply_to=10),
+                sender.send(1, "A2", reply(10), wait=True, reply_to=10),
+                sender.send(1, "B", reply(11), wait=True, reply_to=11),
+            )
+            return results, sent
+
+        results, sent = asyncio.run(scenario())
+        assert sent == [(10, "A\n\nA2"), (11, "B")]
+        assert results == ["reply-10", "reply-10", "reply-11"]
+
+    def test_delivery_error_reaches_every_waiter(self):
+        """Тест: ошибка доставки объединённого сообщения приходит всем ожидающим"""
+        async def scenario():
+            sender = OutboundSender(chat_rate=1000, chat_burst=1)
+            sender.start()
+            send = AsyncMock(side_effect=BadRequest("Message to be replied not found"))
+            return await asyncio.gather(
+                sender.send(1, "A", send, wait=True, reply_to=10),
+                sender.send(1, "B", send, wait=True, reply_to=10),
+                return_exceptions=True,
+            ), send.await_count
+
+        results, attempts = asyncio.run(scenario())
+        assert attempts == 1
+        assert all(isinstance(result, BadRequest) for result in results)
+
+    def test_safe_reply_does_not_quote_wrong_message(self):
+        """Тест: ответы разным пользователям в группе не цитируют чужое сообщение"""
+        async def scenario():
+            sender = OutboundSender(chat_rate=1000, chat_burst=1)
+            sender.start()
+            original = rating_bot.outbound
+            rating_bot.outbound = sender
+            try:
+                bot = SimpleNamespace(send_message=AsyncMock(return_value="plain"))
+                chat = SimpleNamespace(id=-100)
+
+                def update_for(message_id):
+                    return SimpleNamespace(
+                        message=SimpleNamespace(message_id=message_id, reply_text=AsyncMock(return_value=message_id)),
+                        callback_query=None,
+                        effective_chat=chat,
+                        get_bot=lambda: bot,
+                    )
+
+                first, second = update_for(1), update_for(2)
+                results = await asyncio.gather(
+                    rating_bot.safe_reply(first, "для A", wait=True),
+                    rating_bot.safe_reply(second, "для B", wait=True),
+                )
+                return results, first.message.reply_text, second.message.reply_text, bot.send_message
+            finally:
+                rating_bot.outbound = original
+
+        results, first_reply, second_reply, send_message = asyncio.run(scenario())
+        assert results == [1, 2]
+        first_reply.assert_awaited_once_with("для A")
+        second_reply.assert_awaited_once_with("для B")
+        send_message.assert_not_awaited()
+
+    def test_safe_reply_does_not_wait(self):
+        """Тест: safe_reply возвращается до доставки, close() доотправляет"""
+        async def scenario():
+            sender = OutboundSender()
+            sender.start()
+            original = rating_bot.outbound
+            rating_bot.outbound = sender
+            try:
+                delivered = asyncio.Event()
+
+                async def reply_text(text):
+                    await delivered.wait()
+
+                update = SimpleNamespace(
+                    message=SimpleNamespace(reply_text=AsyncMock(side_effect=reply_text)),
+                    effective_chat=SimpleNamespace(id=-100),
+                )
+                # Доставка заблокирована, но обработчик её не ждёт
+                await asyncio.wait_for(asyncio.gather(
+                    rating_bot.safe_reply(update, "привет"),
+                    rating_bot.safe_reply(update, "ещё"),
+                ), timeout=1)
+                delivered.set()
+                await sender.close(timeout=1)
+                return update.message.reply_text
+            finally:
+                rating_bot.outbound = original
+
+        reply_text = asyncio.run(scenario())
+        reply_text.assert_awaited_once_with("привет\n\nещё")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,161 @@
+"""
+Тесты для пересчёта рейтинга по матчам (rating_engine и /match)
+"""
+import pytest
+import sys
+import os
+import asyncio
+import random
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import storage
+from app.services import rating_engine
+from app.services.rating_engine import parse_score, rate_match, replay, schedule_rounds
+from app.services.rating_bot import parse_match_args
+
+
+class TestParseScore:
+    """Тесты разбора счёта"""
+
+    def test_two_sets(self):
+        score = parse_score(["6-4", "6-3"])
+        assert score.sets == ((6, 4), (6, 3))
+        assert score.team_a_won is True
+        assert (score.games_a, score.games_b) == (12, 7)
+        assert str(score) == "6-4 6-3"
+
+    def test_three_sets_loss(self):
+        score = parse_score(["6-4", "3-6", "5-7"])
+        assert score.team_a_won is False
+        assert (score.sets_a, score.sets_b) == (1, 2)
+
+    def test_invalid(self):
+        assert parse_score([]) is None
+        assert parse_score(["6-6"]) is None
+        assert parse_score(["6:4", "x-1"]) is None
+        assert parse_score(["6-4", "4-6"]) is None  # ничья по сетам и геймам
+
+    def test_match_args(self):
+        team_a, team_b, score = parse_match_args(["@a", "@b", "VS", "@c", "@d", "6-4", "6-3"])
+        assert team_a == ["@a", "@b"] and team_b == ["@c", "@d"]
+        assert score.team_a_won
+        assert parse_match_args(["@a", "vs", "@c", "@d", "6-4"]) is None
+        assert parse_match_args(["@a", "@b", "@c", "@d", "6-4"]) is None
+
+
+class TestRateMatch:
+    """Тесты обновления рейтинга за один матч"""
+
+    def test_winners_gain_losers_lose(self):
+        result = rate_match((2.0, 2.0, 2.0, 2.0), parse_score(["6-4", "6-4"]))
+        assert result.expected_a == pytest.approx(0.5)
+        a1, a2, b1, b2 = result.after
+        assert a1 == a2 > 2.0
+        assert b1 == b2 < 2.0
+        assert a1 - 2.0 == pytest.approx(2.0 - b1)
+
+    def test_upset_moves_more(self):
+        favourite_win = rate_match((3.0, 3.0, 2.0, 2.0), parse_score(["6-4", "6-4"]))
+        upset = rate_match((3.0, 3.0, 2.0, 2.0), parse_score(["4-6", "4-6"]))
+        assert favourite_win.expected_a > 0.8
+        assert abs(upset.after[0] - 3.0) > abs(favourite_win.after[0] - 3.0)
+
+    def test_scale_limits(self):
+        result = rate_match((6.0, 6.0, 0.5, 0.5), parse_score(["0-6", "0-6"]))
+        assert all(rating_engine.MIN_RATING <= r <= rating_engine.MAX_RATING for r in result.after)
+        result = rate_match((6.0, 6.0, 6.0, 6.0), parse_score(["6-0", "6-0"]))
+        assert result.after[0] == 6.0
+
+
+class TestReplay:
+    """Тесты векторного пересчёта истории"""
+
+    def make_history(self, matches=2000, players=60, seed=7):
+        rnd = random.Random(seed)
+        history = []
+        for _ in range(matches):
+            row = rnd.sample(range(1, players + 1), 4)
+            history.append((row, rnd.random() < 0.5, rnd.randint(-12, 12) or 1))
+        initial = {player: round(rnd.uniform(1.0, 5.0), 2) for player in range(1, players + 1)}
+        return history, initial
+
+    def test_rounds_do_not_share_players(self):
+        history, _ = self.make_history(matches=300)
+        players = [row for row, _, _ in history]
+        import numpy as np
+        rounds = schedule_rounds(np.array(players))
+        for current in set(rounds.tolist()):
+            seen = [p for row, r in zip(players, rounds.tolist()) if r == current for p in row]
+            assert len(seen) == len(set(seen))
+
+    def test_replay_matches_sequential(self):
+        """Тест: векторный пересчёт совпадает с последовательным"""
+        history, initial = self.make_history()
+        ratings = dict(initial)
+        for row, team_a_won, game_diff in history:
+            score = rating_engine.MatchScore(
+                (), int(team_a_won), int(not team_a_won), max(game_diff, 0), max(-game_diff, 0)
+            )
+            result = rate_match(tuple(ratings[p] for p in row), score)
+            ratings.update(zip(row, result.after))
+
+        replayed = replay(
+            [row for row, _, _ in history],
+            [team_a_won for _, team_a_won, _ in history],
+            [game_diff for _, _, game_diff in history],
+            initial,
+        )
+        assert replayed.keys() == ratings.keys()
+        for player, rating in ratings.items():
+            assert replayed[player] == pytest.approx(rating)
+
+    def test_empty_history(self):
+        assert replay([], [], [], {}) == {}
+
+
+class TestMatchStorage:
+    """Тесты записи матчей в базу"""
+
+    @pytest.fixture(autouse=True)
+    def players(self, storage_db):
+        """Четыре игрока с рейтингами во временной базе"""
+        async def fill():
+            for telegram_id, rating in ((1, 3.0), (2, 2.5), (3, 2.0), (4, 3.5)):
+                await storage.set_rating(telegram_id, rating)
+
+        asyncio.run(fill())
+
+    def test_record_match_updates_ratings(self):
+        """Тест: матч меняет рейтинги и пишет историю"""
+        async def scenario():
+            result = await storage.record_match([1, 2, 3, 4], parse_score(["6-3", "6-2"]), chat_id=-100)
+            ratings = {p: await storage.get_rating(p) for p in (1, 2, 3, 4)}
+            history = await storage.get_rating_history(1)
+            return result, ratings, history
+
+        result, ratings, history = asyncio.run(scenario())
+        assert result.before == (3.0, 2.5, 2.0, 3.5)
+        assert [ratings[p] for p in (1, 2, 3, 4)] == list(result.after)
+        assert ratings[1] > 3.0 and ratings[3] < 2.0
+        assert history[-1][1] == ratings[1]
+
+    def test_replay_reproduces_recorded_matches(self):
+        """Тест: пересчёт по истории даёт те же рейтинги, что и запись матчей"""
+        async def scenario():
+            await storage.record_match([1, 2, 3, 4], parse_score(["6-3", "6-2"]))
+            await storage.record_match([1, 3, 2, 4], parse_score(["4-6", "6-7"]))
+            await storage.record_match([4, 2, 1, 3], parse_score(["6-1", "6-1"]))
+            recorded = {p: await storage.get_rating(p) for p in (1, 2, 3, 4)}
+            await storage.set_rating(1, 5.0)  # ручная правка, которую пересчёт перезапишет
+            replayed = await storage.replay_matches()
+            return recorded, replayed, await storage.get_rating(1)
+
+        recorded, replayed, rating = asyncio.run(scenario())
+        assert replayed == pytest.approx(recorded)
+        assert rating == pytest.approx(recorded[1])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
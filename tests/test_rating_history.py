@@ -0,0 +1,140 @@
+"""
+Тесты для истории рейтинга (rating_history и /history)
+"""
+import pytest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.database import MIGRATIONS, run_migrations
+from app.models.sqlite_pool import close_pool
+from app.services import storage
+from app.services import rating_bot
+from app.services.rating_bot import RatingBot, sparkline, format_rating_history
+
+
+@pytest.mark.usefixtures("storage_db")
+class TestRatingHistory:
+    """Тесты хранения истории рейтинга"""
+
+    def append(self, telegram_id, rating, ts):
+        with storage.pool.writer() as conn:
+            storage.append_history(conn, [(telegram_id, rating)], ts=ts)
+
+    def test_set_rating_appends_history(self):
+        """Тест: set_rating добавляет точку истории"""
+        async def scenario():
+            await storage.set_rating(123456, 2.5)
+            return await storage.get_rating_history(123456)
+
+        history = asyncio.run(scenario())
+        assert len(history) == 1
+        assert history[0][1] == 2.5
+
+    def test_sync_set_rating_appends_history(self, storage_db, monkeypatch):
+        """Тест: синхронный rating_bot.set_rating (скрипты) тоже пишет точку истории"""
+        monkeypatch.setenv("DATABASE_URL", f"sqlite+aiosqlite:///{storage_db.path}")
+        try:
+            rating_bot.set_rating(123456, 4.25)
+        finally:
+            close_pool()
+        assert [rating for _, rating in asyncio.run(storage.get_rating_history(123456))] == [4.25]
+
+    def test_history_order_and_limit(self):
+        """Тест: последние N точек от старых к новым"""
+        for ts, rating in ((100, 1.5), (200, 2.0), (300, 2.25), (400, 3.0)):
+            self.append(1, rating, ts)
+        self.append(2, 5.0, 250)
+
+        history = asyncio.run(storage.get_rating_history(1, limit=3))
+        assert history == [(200, 2.0), (300, 2.25), (400, 3.0)]
+
+    def test_same_second_keeps_last(self):
+        """Тест: два изменения за одну секунду - остаётся последнее"""
+        self.append(1, 2.0, 100)
+        self.append(1, 2.5, 100)
+        assert asyncio.run(storage.get_rating_history(1)) == [(100, 2.5)]
+
+    def test_history_read_by_primary_key(self, storage_db):
+        """Тест: история читается по первичному ключу без сортировки"""
+        async def scenario():
+            async with storage_db.engine.connect() as conn:
+                plan = await conn.exec_driver_sql(
+                    "EXPLAIN QUERY PLAN SELECT ts, rating_centi FROM rating_history "
+                    "WHERE telegram_id = ? ORDER BY ts DESC LIMIT 10", (1,)
+                )
+                return " ".join(row[-1] for row in plan.all())
+
+        plan = asyncio.run(scenario())
+        assert "USING PRIMARY KEY" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_migration_seeds_existing_ratings(self, storage_db):
+        """Тест: миграция добавляет начальную точку для уже выставленных рейтингов"""
+        async def scenario():
+            async with storage_db.engine.begin() as conn:
+                await conn.exec_driver_sql(
+                    "INSERT INTO user_ratings (telegram_id, rating, updated_at) VALUES "
+                    "(1, 3.5, '2025-01-02 03:04:05.000000'), (2, 0, NULL)"
+                )
+                await run_migrations(conn)
+                await run_migrations(conn)  # повторный запуск ничего не дублирует
+            return await storage.get_rating_history(1), await storage.get_rating_history(2)
+
+        first, second = asyncio.run(scenario())
+        assert first == [(1735787045, 3.5)]
+        assert second == []
+
+    def test_migrations_run_once(self, storage_db):
+        """Тест: применённые миграции отмечаются в user_version и не выполняются при следующем запуске"""
+        async def scenario():
+            async with storage_db.engine.begin() as conn:
+                await run_migrations(conn)
+                # Рейтинг без истории после миграции не должен заполняться повторно
+                await conn.exec_driver_sql("INSERT INTO user_ratings (telegram_id, rating) VALUES (1, 3.5)")
+                await run_migrations(conn)
+                version = (await conn.exec_driver_sql("PRAGMA user_version")).scalar()
+            return version, await storage.get_rating_history(1)
+
+        version, history = asyncio.run(scenario())
+        assert version == len(MIGRATIONS)
+        assert history == []
+
+
+class TestHistoryCommand:
+    """Тесты команды /history"""
+
+    def test_sparkline(self):
+        """Тест мини-графика"""
+        assert sparkline([1.0, 2.0, 3.0]) == "▁▅█"
+        assert sparkline([2.0, 2.0]) == "▄▄"
+
+    def test_format_history(self):
+        """Тест текста истории"""
+        text = format_rating_history("John", [(0, 2.0), (86400, 2.5)])
+        assert "📈 История рейтинга John:" in text
+        assert "2.5 (+0.50)" in text
+        assert "Изменение: +0.50" in text
+
+    def test_empty_history(self):
+        """Тест: пустая история"""
+        original = storage.get_rating_history
+        storage.get_rating_history = AsyncMock(return_value=[])
+        try:
+            update = SimpleNamespace(
+                message=SimpleNamespace(reply_text=AsyncMock(), reply_to_message=None),
+                effective_user=SimpleNamespace(id=1),
+            )
+            asyncio.run(RatingBot.history_command(update, SimpleNamespace(args=[])))
+        finally:
+            storage.get_rating_history = original
+        assert "пуста" in update.message.reply_text.await_args.args[0]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
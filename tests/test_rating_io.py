@@ -0,0 +1,265 @@
+"""
+Тесты для массового импорта и экспорта рейтингов (rating_io, /importratings, /exportratings)
+"""
+import pytest
+import sys
+import os
+import io
+import json
+import asyncio
+import subprocess
+import threading
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import storage, rating_io
+from app.services.rating_io import ImportRow, detect_format, parse_rows, format_summary
+from app.services.rating_bot import RatingBot
+
+
+class TestParseRows:
+    """Тесты разбора файлов"""
+
+    def test_detect_format(self):
+        """Тест определения формата"""
+        assert detect_format("roster.CSV") == "csv"
+        assert detect_format("roster.ndjson") == "jsonl"
+        assert detect_format(None, '\ufeff[{"rating": 3}]') == "json"
+        assert detect_format("upload.txt", '{"rating": 3}') == "jsonl"
+        assert detect_format(None, "telegram_id,rating") == "csv"
+
+    def test_csv_semicolon_and_comma_decimal(self):
+        """Тест: CSV из Excel - разделитель ";" и запятая в рейтинге"""
+        lines = io.StringIO("Telegram_ID;Username;Rating\n1;@john;3,25\n;mary;4.5\n", newline="")
+        rows = list(parse_rows(lines, "csv"))
+        assert rows == [
+            ImportRow(2, 1, "john", None, 3.25),
+            ImportRow(3, None, "mary", None, 4.5),
+        ]
+
+    def test_invalid_rows_reported_with_line(self):
+        """Тест: ошибочные строки попадают в сводку с номером строки"""
+        lines = io.StringIO("telegram_id,rating\nabc,3\n2,\n3,7\n,4\n4,2.5\n", newline="")
+        rows = list(parse_rows(lines, "csv"))
+        assert rows[-1] == ImportRow(6, 4, None, None, 2.5)
+        errors = rows[:-1]
+        assert [line for line, _ in errors] == [2, 3, 4, 5]
+        assert "telegram_id" in errors[0][1]
+        assert "шкалы" in errors[2][1]
+
+    def test_json_and_jsonl(self):
+        """Тест разбора JSON-массива и JSONL"""
+        rows = list(parse_rows(['[{"telegram_id": 1, "rating": 3.5}, 5]'], "json"))
+        assert rows[0] == ImportRow(1, 1, None, None, 3.5)
+        assert rows[1][0] == 2
+
+        rows = list(parse_rows(['{"username": "a", "rating": "2,5"}\n', "\n", "{oops\n"], "jsonl"))
+        assert rows[0] == ImportRow(1, None, "a", None, 2.5)
+        assert rows[1][0] == 3
+
+    def test_import_does_not_load_rating_bot(self):
+        """Тест: rating_io не зависит от модуля команд бота (нет циклического импорта)"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = "import sys, app.services.rating_io; print('app.services.rating_bot' in sys.modules)"
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=root, capture_output=True, text=True,
+            env={**os.environ, "BOT_TOKEN": os.environ.get("BOT_TOKEN", "1:test")},
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "False"
+
+
+class TempDatabase:
+    """Временная база для storage (общая для тестов импорта и экспорта)"""
+
+    @pytest.fixture(autouse=True)
+    def database(self, storage_db):
+        self.db_path = storage_db.path
+
+
+class TestImportRatings(TempDatabase):
+    """Тесты записи импорта в базу"""
+
+    def test_import_creates_updates_and_skips(self):
+        """Тест: новые игроки создаются, изменённые обновляются, остальные пропускаются"""
+        async def scenario():
+            await storage.set_rating(1, 3.0, "john", "John")
+            await storage.set_rating(2, 4.0)
+            summary = await rating_io.import_ratings(io.StringIO(
+                "telegram_id,username,first_name,rating\n"
+                "1,,,3.5\n"
+                "2,,,4.0\n"
+                "3,new_player,New,2.0\n"
+                ",john,,3.75\n"
+                ",ghost,,3.0\n",
+                newline="",
+            ), "csv")
+            profile = await storage.get_user_profile(1)
+            created = await storage.get_user_profile(3)
+            history = await storage.get_rating_history(3)
+            return summary, profile, created, history
+
+        summary, profile, created, history = asyncio.run(scenario())
+        assert (summary.created, summary.updated, summary.unchanged) == (1, 1, 1)
+        assert summary.errors == [(6, "пользователь @ghost не найден в базе")]
+        # Последняя строка для игрока побеждает, пустые поля не затирают профиль
+        assert profile.rating == 3.75
+        assert (profile.username, profile.first_name) == ("john", "John")
+        assert (created.rating, created.username, created.first_name) == (2.0, "new_player", "New")
+        assert [rating for _, rating in history] == [2.0]
+
+    def test_broken_json_array(self):
+        """Тест: нераспознаваемый файл ничего не пишет"""
+        summary = asyncio.run(rating_io.import_ratings_bytes(b'[{"telegram_id": 1', "roster.json"))
+        assert summary.imported == 0
+        assert len(summary.errors) == 1
+        assert "Ошибок: 1" in format_summary(summary)
+
+    def test_import_command(self):
+        """Тест: /importratings с файлом в подписи"""
+        telegram_file = SimpleNamespace(
+            download_as_bytearray=AsyncMock(return_value=bytearray(b"telegram_id,rating\n10,4.5\n"))
+        )
+        document = SimpleNamespace(
+            file_name="roster.csv", file_size=30, get_file=AsyncMock(return_value=telegram_file)
+        )
+        message = SimpleNamespace(reply_text=AsyncMock(), document=document, reply_to_message=None)
+        update = SimpleNamespace(message=message)
+
+        with patch("app.services.rating_bot.is_admin", AsyncMock(return_value=True)), \
+                patch("app.services.rating_bot.leaderboard") as leaderboard:
+            asyncio.run(RatingBot.import_ratings_command(update, SimpleNamespace(args=[])))
+            leaderboard.clear.assert_called_once()
+
+        reply = message.reply_text.call_args[0][0]
+        assert "Новых игроков: 1" in reply
+        assert asyncio.run(storage.get_rating(10)) == 4.5
+
+    def test_import_command_requires_admin(self):
+        """Тест: импорт доступен только администраторам"""
+        message = SimpleNamespace(reply_text=AsyncMock(), document=None, reply_to_message=None)
+        with patch("app.services.rating_bot.is_admin", AsyncMock(return_value=False)):
+            asyncio.run(RatingBot.import_ratings_command(SimpleNamespace(message=message), SimpleNamespace(args=[])))
+        assert "администраторам" in message.reply_text.call_args[0][0]
+
+
+class TestExportRatings(TempDatabase):
+    """Тесты потоковой выгрузки"""
+
+    def seed(self, count):
+        lines = ["telegram_id,username,first_name,rating"]
+        lines += [f"{i},user{i},Имя {i},{1 + i % 50 / 10}" for i in range(1, count + 1)]
+        return asyncio.run(rating_io.import_ratings(io.StringIO("\n".join(lines) + "\n", newline=""), "csv"))
+
+    def test_iter_users_in_chunks(self):
+        """Тест: пользователи читаются пачками по возрастанию telegram_id"""
+        self.seed(25)
+
+        async def scenario():
+            return [rows async for rows in storage.iter_users(chunk_size=10)]
+
+        chunks = asyncio.run(scenario())
+        assert [len(rows) for rows in chunks] == [10, 10, 5]
+        assert [row[0] for rows in chunks for row in rows] == list(range(1, 26))
+
+    def test_csv_round_trip(self):
+        """Тест: выгруженный CSV импортируется обратно без изменений"""
+        self.seed(30)
+        path = self.db_path + ".csv"
+        try:
+            assert asyncio.run(rating_io.export_ratings(path, "csv", chunk_size=7)) == 30
+            with open(path, encoding="utf-8", newline="") as source:
+                summary = asyncio.run(rating_io.import_ratings(source, "csv"))
+        finally:
+            os.unlink(path)
+        assert (summary.created, summary.updated, summary.unchanged, summary.errors) == (0, 0, 30, [])
+
+    def test_file_writes_off_event_loop(self):
+        """Тест: пачки пишутся в файл не в потоке event loop"""
+        self.seed(12)
+        path = self.db_path + ".csv"
+        threads = []
+        original = rating_io._write_text_chunk
+
+        def write_chunk(*args):
+            threads.append(threading.get_ident())
+            return original(*args)
+
+        try:
+            with patch.object(rating_io, "_write_text_chunk", write_chunk):
+                assert asyncio.run(rating_io.export_ratings(path, "csv", chunk_size=5)) == 12
+        finally:
+            os.unlink(path)
+        assert len(threads) == 3
+        assert threading.get_ident() not in threads
+
+    def test_jsonl_export(self):
+        """Тест выгрузки JSONL"""
+        self.seed(3)
+        path = self.db_path + ".jsonl"
+        try:
+            asyncio.run(rating_io.export_ratings(path, "jsonl"))
+            with open(path, encoding="utf-8") as source:
+                records = [json.loads(line) for line in source]
+        finally:
+            os.unlink(path)
+        assert [record["telegram_id"] for record in records] == [1, 2, 3]
+        assert records[0]["first_name"] == "Имя 1"
+        assert set(records[0]) == set(rating_io.EXPORT_FIELDS)
+
+    def test_parquet_requires_pyarrow(self):
+        """Тест: без pyarrow Parquet недоступен, остальные форматы работают"""
+        with patch.object(rating_io, "pyarrow", None):
+            with pytest.raises(RuntimeError):
+                asyncio.run(rating_io.export_ratings(self.db_path + ".parquet", "parquet"))
+        with pytest.raises(ValueError):
+            asyncio.run(rating_io.export_ratings(self.db_path + ".xml", "xml"))
+
+    def test_parquet_export(self):
+        """Тест выгрузки Parquet (если установлен pyarrow)"""
+        parquet = pytest.importorskip("pyarrow.parquet")
+        self.seed(12)
+        path = self.db_path + ".parquet"
+        try:
+            asyncio.run(rating_io.export_ratings(path, "parquet", chunk_size=5))
+            table = parquet.read_table(path)
+        finally:
+            os.unlink(path)
+        assert table.num_rows == 12
+        assert table.column("telegram_id").to_pylist() == list(range(1, 13))
+
+    def test_export_command(self):
+        """Тест: /exportratings отправляет файл"""
+        self.seed(4)
+        sent = {}
+
+        async def reply_document(document, filename, caption):
+            sent["data"] = document.read()
+            sent["filename"] = filename
+            sent["caption"] = caption
+
+        message = SimpleNamespace(reply_text=AsyncMock(), reply_document=reply_document)
+        with patch("app.services.rating_bot.is_admin", AsyncMock(return_value=True)):
+            asyncio.run(RatingBot.export_ratings_command(SimpleNamespace(message=message), SimpleNamespace(args=["jsonl"])))
+
+        assert sent["filename"].endswith(".jsonl")
+        assert len(sent["data"].splitlines()) == 4
+        assert "4" in sent["caption"]
+
+    def test_export_command_refuses_oversized_file(self):
+        """Тест: /exportratings не отправляет файл больше EXPORT_MAX_FILE_SIZE"""
+        self.seed(4)
+        message = SimpleNamespace(reply_text=AsyncMock(), reply_document=AsyncMock())
+        with patch("app.services.rating_bot.is_admin", AsyncMock(return_value=True)), \
+                patch("app.services.rating_bot.settings.EXPORT_MAX_FILE_SIZE", 10):
+            asyncio.run(RatingBot.export_ratings_command(SimpleNamespace(message=message), SimpleNamespace(args=["csv"])))
+
+        message.reply_document.assert_not_called()
+        text = message.reply_text.call_args[0][0]
+        assert "ratings_tool.py export" in text
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,111 @@
+"""
+Тесты для пула подключений SQLite
+"""
+import pytest
+import sys
+import os
+import tempfile
+import threading
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.sqlite_pool import SQLiteConnectionPool, get_pool, close_pool
+
+
+class TestSQLiteConnectionPool:
+    """Тесты для SQLiteConnectionPool"""
+
+    def setup_method(self):
+        """Создание временной базы данных для тестов"""
+        self.test_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.test_db.close()
+        self.pool = SQLiteConnectionPool(self.test_db.name, read_pool_size=2)
+        with self.pool.writer() as conn:
+            conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)")
+
+    def teardown_method(self):
+        """Очистка тестовой базы данных"""
+        self.pool.close()
+        close_pool()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(self.test_db.name + suffix)
+            except:
+                pass
+
+    def test_pragmas_applied(self):
+        """Тест: WAL и остальные PRAGMA применены к подключениям"""
+        with self.pool.reader() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] > 0
+
+    def test_writer_commits_and_readers_see_changes(self):
+        """Тест: запись писателя видна читателям"""
+        with self.pool.writer() as conn:
+            conn.execute("INSERT INTO items (value) VALUES ('a')")
+        with self.pool.reader() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+
+    def test_writer_rolls_back_on_error(self):
+        """Тест: при исключении транзакция писателя откатывается"""
+        with pytest.raises(RuntimeError):
+            with self.pool.writer() as conn:
+                conn.execute("INSERT INTO items (value) VALUES ('a')")
+                raise RuntimeError("boom")
+        with self.pool.reader() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+
+    def test_connections_are_reused(self):
+        """Тест: подключения не открываются заново на каждый запрос"""
+        with self.pool.reader() as first:
+            pass
+        with self.pool.reader() as second:
+            assert second is first
+        with self.pool.writer() as w1:
+            pass
+        with self.pool.writer() as w2:
+            assert w2 is w1
+
+    def test_reader_pool_is_bounded(self):
+        """Тест: читателей не больше read_pool_size даже из нескольких потоков"""
+        seen = set()
+        barrier = threading.Barrier(4)
+
+        def worker():
+            barrier.wait()
+            for _ in range(20):
+                with self.pool.reader() as conn:
+                    seen.add(id(conn))
+                    conn.execute("SELECT 1").fetchone()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(seen) <= 2
+
+    def test_pool_reusable_after_close(self):
+        """Тест: после close() пул открывает подключения заново и не ждёт вечно"""
+        with self.pool.writer() as conn:
+            conn.execute("INSERT INTO items (value) VALUES ('a')")
+        with self.pool.reader() as first, self.pool.reader() as second:
+            pass
+        self.pool.close()
+        with self.pool.reader() as first, self.pool.reader() as second:
+            assert first.execute("SELECT count(*) FROM items").fetchone()[0] == 1
+        assert self.pool.reader_checkouts == 4
+        assert self.pool.writer_checkouts == 2
+
+    def test_get_pool_follows_db_path(self):
+        """Тест: пул процесса пересоздаётся при смене пути к базе"""
+        pool = get_pool(self.test_db.name)
+        assert get_pool(self.test_db.name) is pool
+        other = get_pool(self.test_db.name + ".other")
+        assert other is not pool
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
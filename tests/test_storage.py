@@ -0,0 +1,360 @@
+"""
+Тесты для асинхронного слоя хранения
+"""
+import pytest
+import sys
+import os
+import asyncio
+import threading
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.database import run_migrations
+from app.services import storage
+
+
+@pytest.mark.usefixtures("storage_db")
+class TestStorage:
+    """Тесты для app.services.storage"""
+
+    def test_get_rating_nonexistent_user(self):
+        """Тест получения рейтинга несуществующего пользователя"""
+        assert asyncio.run(storage.get_rating(999999)) == 0.0
+        assert asyncio.run(storage.user_exists_in_db(999999)) is False
+
+    def test_set_and_get_rating(self):
+        """Тест установки и получения рейтинга"""
+        async def scenario():
+            await storage.set_rating(123456, 3.75, "john_doe", "John")
+            return await storage.get_rating(123456), await storage.user_exists_in_db(123456)
+
+        rating, exists = asyncio.run(scenario())
+        assert rating == 3.75
+        assert exists is True
+
+    def test_pt_userid(self):
+        """Тест установки и получения PlayTomic ID"""
+        async def scenario():
+            empty = await storage.get_pt_userid(123456)
+            await storage.set_pt_userid(123456, "john_player")
+            return empty, await storage.get_pt_userid(123456)
+
+        empty, pt_userid = asyncio.run(scenario())
+        assert empty == ""
+        assert pt_userid == "john_player"
+
+    def test_get_user_id_by_username_case_insensitive(self):
+        """Тест поиска по username без учета регистра"""
+        async def scenario():
+            await storage.ensure_user_exists(123456, "John_Doe", "John")
+            return (
+                await storage.get_user_id_by_username("@john_doe"),
+                await storage.get_user_id_by_username("JOHN_DOE"),
+                await storage.get_user_id_by_username("@nobody"),
+            )
+
+        lower, upper, missing = asyncio.run(scenario())
+        assert lower == 123456
+        assert upper == 123456
+        assert missing is None
+
+    def test_ensure_user_exists_keeps_rating(self):
+        """Тест: повторный ensure_user_exists не сбрасывает рейтинг"""
+        async def scenario():
+            await storage.set_rating(123456, 4.5, "old_name", "John")
+            await storage.ensure_user_exists(123456, "new_name", "John")
+            await storage.flush_profiles()
+            return await storage.get_rating(123456), await storage.get_all_users()
+
+        rating, users = asyncio.run(scenario())
+        assert rating == 4.5
+        assert [(u[0], u[1]) for u in users] == [(123456, "new_name")]
+
+    def test_ensure_user_exists_skips_unchanged_profile(self):
+        """Тест: неизменившийся профиль не пишется в базу повторно"""
+        async def scenario():
+            await storage.ensure_user_exists(123456, "john_doe", "John")
+            first = await storage.get_user_profile(123456)
+            await storage.ensure_user_exists(123456, "john_doe", "John")
+            await storage.ensure_user_exists(123456, None, None)
+            return first, storage.profile_writes.stats()
+
+        first, stats = asyncio.run(scenario())
+        assert first.exists and first.username == "john_doe"
+        assert stats["buffered"] == 0 and stats["pending"] == 0
+
+    def test_profile_changes_are_batched(self):
+        """Тест: изменения профилей копятся и пишутся одной пачкой"""
+        async def scenario():
+            for telegram_id in (1, 2, 3):
+                await storage.ensure_user_exists(telegram_id, f"user{telegram_id}", "Old")
+            for telegram_id in (1, 2, 3):
+                await storage.ensure_user_exists(telegram_id, f"user{telegram_id}", "Middle")
+                await storage.ensure_user_exists(telegram_id, f"user{telegram_id}", "New")
+            before = await storage.get_user_profile(1)
+            pending = storage.profile_writes.stats()["pending"]
+            await storage.flush_profiles()
+            return before, pending, await storage.get_all_users(), storage.profile_writes.stats()
+
+        before, pending, users, stats = asyncio.run(scenario())
+        assert before.first_name == "Old"
+        assert pending == 3
+        assert sorted(u[2] for u in users) == ["New", "New", "New"]
+        assert stats["flushes"] == 1 and stats["flushed"] == 3 and stats["coalesced"] == 3
+
+    def test_set_rating_supersedes_pending_profile(self):
+        """Тест: set_rating записывает профиль сразу и снимает его из очереди"""
+        async def scenario():
+            await storage.ensure_user_exists(123456, "john_doe", "John")
+            await storage.ensure_user_exists(123456, "john_new", "John")
+            await storage.set_rating(123456, 3.0, "john_new", "John")
+            return storage.profile_writes.stats()["pending"], await storage.get_user_profile(123456)
+
+        pending, profile = asyncio.run(scenario())
+        assert pending == 0
+        assert profile.username == "john_new" and profile.rating == 3.0
+
+    def test_flush_in_progress_does_not_overwrite_set_rating(self):
+        """Тест: сброс буфера, уже забравший старый профиль, не перезаписывает профиль из set_rating"""
+        async def scenario():
+            await storage.ensure_user_exists(123456, "john_doe", "John")
+            storage.record_profile(123456, "john_old", "John")
+            await asyncio.gather(storage.profile_writes.flush(), storage.set_rating(123456, 3.0, "john_new", "John"))
+            await storage.flush_writes()
+            return await storage.get_user_profile(123456)
+
+        profile = asyncio.run(scenario())
+        assert profile.username == "john_new" and profile.rating == 3.0
+
+    def test_profile_change_during_set_rating_kept(self):
+        """Тест: профиль, изменившийся во время записи set_rating, не теряется"""
+        async def scenario():
+            await storage.ensure_user_exists(123456, "john_doe", "John")
+            task = asyncio.create_task(storage.set_rating(123456, 3.0, "john_doe", "John"))
+            await asyncio.sleep(0)
+            storage.record_profile(123456, "john_new", "John")
+            await task
+            await storage.flush_writes()
+            return await storage.get_user_profile(123456)
+
+        assert asyncio.run(scenario()).username == "john_new"
+
+    def slow_flush(self, buffer, delay: float = 0.03):
+        """Замедлить запись буфера и уменьшить пачку (восстанавливается в тесте)"""
+        original = buffer._flush
+
+        async def slow(items):
+            await asyncio.sleep(delay)
+            await original(items)
+
+        buffer._flush = slow
+        buffer.batch_size = 5
+        return original
+
+    def test_profile_writes_reach_db_while_flush_runs(self):
+        """Тест: изменения профилей, пришедшие во время медленного сброса, доходят до базы"""
+        batch_size = storage.profile_writes.batch_size
+        original = self.slow_flush(storage.profile_writes)
+
+        async def scenario():
+            for telegram_id in range(40):
+                await storage.ensure_user_exists(telegram_id, f"user{telegram_id}", "Old")
+            for step in range(8):
+                for telegram_id in range(step * 5, step * 5 + 5):
+                    await storage.ensure_user_exists(telegram_id, f"user{telegram_id}", "New")
+                await asyncio.sleep(0.01)
+            under_load = sum(1 for user in await storage.get_all_users() if user[2] == "New")
+            await storage.flush_writes()
+            return under_load, await storage.get_all_users(), storage.profile_writes.stats()
+
+        try:
+            under_load, users, stats = asyncio.run(scenario())
+        finally:
+            storage.profile_writes._flush = original
+            storage.profile_writes.batch_size = batch_size
+        assert under_load >= 15
+        assert sorted(user[2] for user in users) == ["New"] * 40
+        assert stats["pending"] == 0 and stats["errors"] == 0
+
+    def test_create_user_if_absent(self):
+        """Тест: create_user создаёт пользователя с рейтингом и PT ID, существующего не трогает"""
+        async def scenario():
+            created = await storage.create_user(123456, 3.5, "john_player")
+            again = await storage.create_user(123456, 5.0, "other")
+            return created, again, await storage.get_user_profile(123456), await storage.get_rating_history(123456)
+
+        created, again, profile, history = asyncio.run(scenario())
+        assert created is True
+        assert again is False
+        assert (profile.rating, profile.pt_userid) == (3.5, "john_player")
+        assert [rating for _, rating in history] == [3.5]
+
+    def test_create_users_batch(self):
+        """Тест: пачка пользователей создаётся одним запросом, существующие возвращаются отдельно"""
+        async def scenario():
+            await storage.set_rating(2, 4.0)
+            result = await storage.create_users([(1, 0, None), (2, 1.0, None), (3, 2.5, "pt3"), (1, 0, None)])
+            return result, await storage.get_rating(2), await storage.get_user_profile(3)
+
+        (created, existing), rating, profile = asyncio.run(scenario())
+        assert created == [1, 3]
+        assert existing == [2]
+        assert rating == 4.0
+        assert (profile.rating, profile.pt_userid) == (2.5, "pt3")
+
+    def test_get_user_profile(self):
+        """Тест получения профиля одним запросом"""
+        async def scenario():
+            missing = await storage.get_user_profile(123456)
+            await storage.set_rating(123456, 2.5, "john_doe", "John")
+            await storage.set_pt_userid(123456, "john_player")
+            return missing, await storage.get_user_profile(123456)
+
+        missing, profile = asyncio.run(scenario())
+        assert missing == storage.UserProfile(123456, False, 0.0, "", None, None)
+        assert profile == storage.UserProfile(123456, True, 2.5, "john_player", "john_doe", "John")
+
+    def test_get_user_profile_by_username(self):
+        """Тест получения профиля по @username"""
+        async def scenario():
+            await storage.set_rating(123456, 4.0, "John_Doe", "John")
+            return (
+                await storage.get_user_profile_by_username("@john_doe"),
+                await storage.get_user_profile_by_username("@nobody"),
+            )
+
+        found, missing = asyncio.run(scenario())
+        assert found.exists and found.telegram_id == 123456 and found.rating == 4.0
+        assert not missing.exists and missing.telegram_id is None
+
+    def test_username_lookup_uses_index_after_migration(self, storage_db):
+        """Тест: миграция добавляет индекс по lower(telegram_username) к старой таблице"""
+        async def scenario():
+            async with storage_db.engine.begin() as conn:
+                await conn.exec_driver_sql("DROP INDEX ix_user_ratings_telegram_username_lower")
+                await conn.exec_driver_sql(
+                    "INSERT INTO user_ratings (telegram_id, telegram_username, rating) VALUES (1, 'John_Doe', 0)"
+                )
+                await run_migrations(conn)
+                await run_migrations(conn)  # повторный запуск безопасен
+                plan = await conn.exec_driver_sql(
+                    "EXPLAIN QUERY PLAN SELECT telegram_id FROM user_ratings WHERE lower(telegram_username) = ?",
+                    ("john_doe",),
+                )
+                return " ".join(row[-1] for row in plan.all())
+
+        plan = asyncio.run(scenario())
+        assert "ix_user_ratings_telegram_username_lower" in plan
+        assert asyncio.run(storage.get_user_id_by_username("@JOHN_DOE")) == 1
+
+    def test_chat_members(self):
+        """Тест: состав чата пишется пачкой и читается по индексу"""
+        async def scenario():
+            await storage.set_rating(1, 3.0, "John_Doe", "John")
+            await storage.set_rating(2, 2.0, "jane", "Jane")
+            storage.record_chat_member(-100, 1)
+            storage.record_chat_member(-100, 1)  # повтор не попадает в очередь
+            storage.record_chat_member(-100, 2)
+            storage.record_chat_member(-200, 2)
+            pending = storage.chat_member_writes.stats()["pending"]
+            await storage.flush_writes()
+            members = sorted(await storage.get_chat_member_ids(-100))
+            found = await storage.find_chat_member_by_username(-100, "@john_doe")
+            other_chat = await storage.find_chat_member_by_username(-200, "@john_doe")
+
+            storage.record_chat_member(-100, 2, present=False)
+            await storage.flush_writes()
+            after_leave = await storage.get_chat_member_ids(-100)
+            return pending, members, found, other_chat, after_leave
+
+        pending, members, found, other_chat, after_leave = asyncio.run(scenario())
+        assert pending == 3
+        assert members == [1, 2]
+        assert found == (1, "John_Doe", "John")
+        assert other_chat is None
+        assert after_leave == [1]
+
+    def test_chat_member_writes_reach_db_while_flush_runs(self):
+        """Тест: участники, пришедшие во время медленного сброса, записываются, сброс не прерывается"""
+        batch_size = storage.chat_member_writes.batch_size
+        original = self.slow_flush(storage.chat_member_writes)
+
+        async def scenario():
+            for step in range(10):
+                for telegram_id in range(step * 4, step * 4 + 4):
+                    storage.record_chat_member(-100, telegram_id)
+                await asyncio.sleep(0.01)
+            under_load = len(await storage.get_chat_member_ids(-100))
+            storage.record_chat_member(-100, 0, present=False)
+            await storage.flush_writes()
+            return under_load, sorted(await storage.get_chat_member_ids(-100)), storage.chat_member_writes.stats()
+
+        try:
+            under_load, members, stats = asyncio.run(scenario())
+        finally:
+            storage.chat_member_writes._flush = original
+            storage.chat_member_writes.batch_size = batch_size
+        assert under_load >= 20
+        assert members == list(range(1, 40))
+        assert stats["pending"] == 0 and stats["errors"] == 0
+
+    def test_chat_members_lookup_uses_index(self, storage_db):
+        """Тест: выборка участников чата идёт по первичному ключу chat_members"""
+        async def scenario():
+            async with storage_db.engine.connect() as conn:
+                plan = await conn.exec_driver_sql(
+                    "EXPLAIN QUERY PLAN SELECT telegram_id FROM chat_members WHERE chat_id = ?", (-100,)
+                )
+                return " ".join(row[-1] for row in plan.all())
+
+        plan = asyncio.run(scenario())
+        assert "SEARCH chat_members USING PRIMARY KEY" in plan
+
+    def test_concurrent_writes(self):
+        """Тест параллельных записей из нескольких корутин"""
+        async def scenario():
+            await asyncio.gather(*(
+                storage.set_rating(1000 + i, 1.0 + i / 10) for i in range(20)
+            ))
+            return await storage.get_all_users()
+
+        users = asyncio.run(scenario())
+        assert len(users) == 20
+
+    def test_queries_run_off_event_loop(self):
+        """Тест: запросы выполняются в потоках DB, event loop в это время свободен"""
+        threads = []
+        original = storage.pool.reader
+
+        def reader():
+            threads.append(threading.current_thread().name)
+            return original()
+
+        async def ticker(done):
+            ticks = 0
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0)
+            return ticks
+
+        async def scenario():
+            done = asyncio.Event()
+            ticks = asyncio.create_task(ticker(done))
+            await storage.set_rating(1, 3.0)
+            await asyncio.gather(*(storage.get_rating(1) for _ in range(20)))
+            done.set()
+            return await ticks
+
+        storage.pool.reader = reader
+        try:
+            ticks = asyncio.run(scenario())
+        finally:
+            del storage.pool.reader
+        assert len(threads) == 20
+        assert all(name.startswith("db") for name in threads)
+        assert ticks > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,125 @@
+"""
+Тесты для подбора пар (/teams)
+"""
+import pytest
+import sys
+import os
+import asyncio
+import random
+import time
+from itertools import permutations
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import storage
+from app.services import team_balancer
+from app.services.team_balancer import balance_teams, court_cost
+from app.services.rating_bot import RatingBot
+
+
+def brute_force_cost(ratings):
+    """Минимальная стоимость полным перебором перестановок (только для малых составов)"""
+    best = None
+    for order in permutations(range(len(ratings))):
+        cost = sum(
+            court_cost([ratings[i] for i in order[start:start + 4]])[0]
+            for start in range(0, len(order), 4)
+        )
+        if best is None or cost < best:
+            best = cost
+    return best
+
+
+class TestTeamBalancer:
+    """Тесты для balance_teams"""
+
+    def test_single_court_pairs_strong_with_weak(self):
+        """Тест: на одном корте сильный играет со слабым"""
+        lineup = balance_teams([(1, 4.0), (2, 3.0), (3, 2.0), (4, 1.0)])
+        court = lineup.courts[0]
+        assert {frozenset(court.team_a), frozenset(court.team_b)} == {frozenset({1, 4}), frozenset({2, 3})}
+        assert court.imbalance == 0
+        assert lineup.exact is True
+
+    def test_exact_matches_brute_force(self):
+        """Тест: точный поиск совпадает с полным перебором на 8 игроках"""
+        rnd = random.Random(3)
+        ratings = [round(rnd.uniform(1.0, 5.0), 2) for _ in range(8)]
+        lineup = balance_teams(list(enumerate(ratings)))
+        assert lineup.cost == pytest.approx(brute_force_cost(ratings))
+
+    def test_all_players_assigned_once(self):
+        """Тест: каждый игрок попадает ровно в одну пару"""
+        rnd = random.Random(5)
+        players = [(100 + i, round(rnd.uniform(1.0, 5.0), 2)) for i in range(20)]
+        lineup = balance_teams(players, time_budget=0.2, seed=1)
+        assigned = [p for court in lineup.courts for p in court.team_a + court.team_b]
+        assert sorted(assigned) == [p for p, _ in players]
+        assert len(lineup.courts) == 5
+        assert lineup.exact is False
+
+    def test_annealing_respects_time_budget(self):
+        """Тест: отжиг укладывается в ограничение по времени"""
+        rnd = random.Random(9)
+        players = [(i, round(rnd.uniform(1.0, 5.0), 2)) for i in range(32)]
+        started = time.perf_counter()
+        balance_teams(players, time_budget=0.2, seed=2)
+        assert time.perf_counter() - started < 0.5
+
+    def test_annealing_close_to_exact(self):
+        """Тест: отжиг на 12 игроках находит решение не хуже точного (с допуском)"""
+        rnd = random.Random(11)
+        players = [(i, round(rnd.uniform(1.0, 5.0), 2)) for i in range(12)]
+        exact = balance_teams(players)
+        groups = team_balancer._annealed_groups([r for _, r in players], 0.3, seed=4)
+        annealed = sum(court_cost([players[i][1] for i in group])[0] for group in groups)
+        assert annealed <= exact.cost + 0.05
+
+    def test_invalid_roster(self):
+        with pytest.raises(ValueError):
+            balance_teams([(1, 2.0), (2, 2.0), (3, 2.0)])
+
+
+class TestTeamsCommand:
+    """Тесты команды /teams"""
+
+    def setup_method(self):
+        self.original = storage.get_players
+
+    def teardown_method(self):
+        storage.get_players = self.original
+
+    def make_update(self):
+        return SimpleNamespace(message=SimpleNamespace(reply_text=AsyncMock()))
+
+    def test_one_batched_query(self):
+        """Тест: рейтинги всех игроков читаются одним запросом"""
+        storage.get_players = AsyncMock(return_value=[
+            (1, 4.0, "a", "A"), (2, 3.0, "b", "B"), (3, 2.0, "c", "C"), (4, 1.0, "D_user", "D"),
+        ])
+        update = self.make_update()
+        asyncio.run(RatingBot.teams_command(update, SimpleNamespace(args=["@a", "@B", "@c", "@d_user"])))
+        assert storage.get_players.await_count == 1
+        text = update.message.reply_text.await_args.args[0]
+        assert "Корт 1:" in text
+        assert "@a + @d_user (2.50)" in text or "@d_user + @a (2.50)" in text
+
+    def test_unrated_players_reported(self):
+        """Тест: игроки без рейтинга перечисляются в ответе"""
+        storage.get_players = AsyncMock(return_value=[(1, 4.0, "a", "A"), (2, 0.0, "b", "B"), (3, 2.0, "c", "C")])
+        update = self.make_update()
+        asyncio.run(RatingBot.teams_command(update, SimpleNamespace(args=["@a", "@b", "@c", "@d"])))
+        text = update.message.reply_text.await_args.args[0]
+        assert "@b, @d" in text
+
+    def test_usage(self):
+        update = self.make_update()
+        asyncio.run(RatingBot.teams_command(update, SimpleNamespace(args=["@a", "@b", "@c"])))
+        assert "Использование" in update.message.reply_text.await_args.args[0]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
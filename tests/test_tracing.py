@@ -0,0 +1,183 @@
+"""
+Тесты для трассировки (app.core.tracing)
+"""
+import pytest
+import sys
+import os
+import json
+import asyncio
+import tempfile
+import threading
+from types import SimpleNamespace
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import tracing
+from app.core.tracing import Tracer, span, traced
+from app.services.update_processor import ChatOrderedUpdateProcessor
+
+
+@traced()
+async def lookup(value):
+    with span("inner", value=value):
+        await asyncio.sleep(0)
+    return value
+
+
+@traced("failing")
+async def failing():
+    raise ValueError("boom")
+
+
+class TestTracing:
+    """Тесты для Tracer, span() и traced()"""
+
+    def test_nested_spans(self):
+        """Тест: дочерние span'ы находят родителя через contextvars"""
+        tracer = Tracer(sample_rate=1.0)
+
+        async def handle():
+            with tracer.trace("update", update_id=1) as root:
+                assert tracing.current_trace_id() is not None
+                await lookup(5)
+                await asyncio.gather(lookup(6), lookup(7))
+                with pytest.raises(ValueError):
+                    await failing()
+                return root
+
+        asyncio.run(handle())
+        [trace] = tracer.slowest()
+        root = trace["root"]
+        assert root["name"] == "update" and root["attrs"] == {"update_id": 1}
+        assert [child["name"] for child in root["children"]] == ["lookup", "lookup", "lookup", "failing"]
+        assert root["children"][0]["children"][0] == {
+            "name": "inner",
+            "offset_ms": root["children"][0]["children"][0]["offset_ms"],
+            "duration_ms": root["children"][0]["children"][0]["duration_ms"],
+            "attrs": {"value": 5},
+        }
+        assert "ValueError" in root["children"][3]["error"]
+        assert tracing.current_trace_id() is None
+
+    def test_not_sampled(self):
+        """Тест: без выборки span'ы ничего не записывают"""
+        tracer = Tracer(sample_rate=0.0)
+
+        async def handle():
+            with tracer.trace("update") as root:
+                assert root is None
+                assert await lookup(1) == 1
+
+        asyncio.run(handle())
+        assert tracer.slowest() == []
+        assert tracer.stats()["started"] == 1
+        assert tracer.stats()["sampled"] == 0
+
+    def test_nested_trace_becomes_span(self):
+        """Тест: trace() внутри идущей трассы - вложенный span"""
+        tracer = Tracer(sample_rate=1.0)
+
+        async def handle():
+            with tracer.trace("webhook", queue_wait_ms=1.5):
+                with tracer.trace("update", update_id=2):
+                    await lookup(1)
+
+        asyncio.run(handle())
+        [trace] = tracer.slowest()
+        assert trace["root"]["name"] == "webhook"
+        assert trace["root"]["children"][0]["name"] == "update"
+        assert tracer.stats()["sampled"] == 1
+
+    def test_slowest_and_ring_buffer(self):
+        """Тест: буфер хранит последние трассы, slowest сортирует по длительности"""
+        tracer = Tracer(sample_rate=1.0, buffer_size=3)
+
+        async def handle(delay):
+            with tracer.trace("update", delay=delay):
+                await asyncio.sleep(delay)
+
+        for delay in (0.03, 0.0, 0.02, 0.01):
+            asyncio.run(handle(delay))
+        delays = [trace["root"]["attrs"]["delay"] for trace in tracer.slowest(limit=2)]
+        assert delays == [0.02, 0.01]
+        assert tracer.stats()["buffered"] == 3
+
+    def test_json_file_export(self):
+        """Тест: трассы дописываются в файл строками JSON"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+            tracer = Tracer(sample_rate=1.0, path=path)
+            for update_id in range(2):
+                with tracer.trace("update", update_id=update_id):
+                    pass
+            tracer.close()
+            with open(path, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f]
+        assert [line["root"]["attrs"]["update_id"] for line in lines] == [0, 1]
+        assert all(len(line["trace_id"]) == 16 for line in lines)
+
+    def test_file_written_off_event_loop(self):
+        """Тест: файл трасс пишется в фоновом потоке, а не в event loop"""
+        with tempfile.TemporaryDirectory() as directory:
+            tracer = Tracer(sample_rate=1.0, path=os.path.join(directory, "traces.jsonl"))
+            writers = []
+            original = tracer._write
+
+            def write(traces):
+                writers.append(threading.current_thread().name)
+                original(traces)
+
+            tracer._write = write
+
+            async def handle(update_id):
+                with tracer.trace("update", update_id=update_id):
+                    await asyncio.sleep(0)
+
+            async def scenario():
+                await asyncio.gather(*(handle(update_id) for update_id in range(50)))
+
+            asyncio.run(scenario())
+            tracer.flush()
+            with open(tracer.path, encoding="utf-8") as f:
+                written = len(f.readlines())
+            tracer.close()
+        assert written == 50
+        assert writers and set(writers) == {"trace-writer"}
+
+    def test_full_write_queue_drops_traces(self):
+        """Тест: при переполненной очереди трасса не пишется в файл, но остаётся в буфере"""
+        with tempfile.TemporaryDirectory() as directory:
+            tracer = Tracer(sample_rate=1.0, path=os.path.join(directory, "traces.jsonl"), queue_size=1)
+            tracer._writer = threading.Thread()  # поток записи не запущен - очередь не разбирается
+            for update_id in range(3):
+                with tracer.trace("update", update_id=update_id):
+                    pass
+        stats = tracer.stats()
+        assert (stats["buffered"], stats["write_queue"], stats["dropped"]) == (3, 1, 2)
+
+    def test_update_processor_starts_trace(self):
+        """Тест: диспетчер обновлений начинает трассу и пишет ожидание чата"""
+        original = tracing.tracer.sample_rate
+        tracing.tracer.sample_rate = 1.0
+        tracing.tracer.clear()
+        try:
+            async def scenario():
+                processor = ChatOrderedUpdateProcessor()
+                update = SimpleNamespace(update_id=42, effective_chat=SimpleNamespace(id=-100))
+                await processor.do_process_update(update, lookup(1))
+
+            asyncio.run(scenario())
+            [trace] = tracing.tracer.slowest()
+        finally:
+            tracing.tracer.sample_rate = original
+            tracing.tracer.clear()
+        root = trace["root"]
+        assert root["name"] == "update"
+        assert root["attrs"]["update_id"] == 42
+        assert "wait_ms" in root["attrs"]
+        assert root["children"][0]["name"] == "lookup"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
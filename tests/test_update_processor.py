@@ -0,0 +1,160 @@
+"""
+Тесты для диспетчера обновлений (порядок внутри чата, параллельность между чатами)
+"""
+import pytest
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.update_processor import ChatOrderedUpdateProcessor
+from app.services.update_queue import UpdateQueue
+
+
+def make_update(chat_id=None, user_id=None):
+    chat = SimpleNamespace(id=chat_id) if chat_id is not None else None
+    user = SimpleNamespace(id=user_id) if user_id is not None else None
+    return SimpleNamespace(effective_chat=chat, effective_user=user)
+
+
+class TestChatOrderedUpdateProcessor:
+    """Тесты для ChatOrderedUpdateProcessor"""
+
+    def test_chat_key(self):
+        """Тест ключа упорядочивания"""
+        assert ChatOrderedUpdateProcessor.chat_key(make_update(chat_id=-100, user_id=1)) == -100
+        assert ChatOrderedUpdateProcessor.chat_key(make_update(user_id=1)) == ("user", 1)
+        assert ChatOrderedUpdateProcessor.chat_key(make_update()) is None
+
+    def test_order_preserved_within_chat(self):
+        """Тест: обновления одного чата выполняются по порядку"""
+        async def scenario():
+            processor = ChatOrderedUpdateProcessor(max_concurrent_chats=4)
+            done = []
+
+            async def handle(index):
+                # Ранние обновления "медленнее" - без упорядочивания порядок бы сломался
+                await asyncio.sleep(0.01 * (5 - index))
+                done.append(index)
+
+            await asyncio.gather(*(
+                processor.process_update(make_update(chat_id=1), handle(i)) for i in range(5)
+            ))
+            return done, processor.stats()
+
+        done, stats = asyncio.run(scenario())
+        assert done == [0, 1, 2, 3, 4]
+        assert stats["chats_in_flight"] == 0
+        assert stats["pending_updates"] == 0
+
+    def test_chats_processed_in_parallel(self):
+        """Тест: разные чаты обрабатываются одновременно"""
+        async def scenario():
+            processor = ChatOrderedUpdateProcessor(max_concurrent_chats=4)
+            active = 0
+            peak = 0
+
+            async def handle():
+                nonlocal active, peak
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.02)
+                active -= 1
+
+            await asyncio.gather(*(
+                processor.process_update(make_update(chat_id=chat_id), handle()) for chat_id in range(8)
+            ))
+            return peak
+
+        assert asyncio.run(scenario()) == 4
+
+    def test_busy_chat_does_not_block_others(self):
+        """Тест: очередь занятого чата не занимает слоты других чатов"""
+        async def scenario():
+            processor = ChatOrderedUpdateProcessor(max_concurrent_chats=2)
+            release = asyncio.Event()
+            finished = []
+
+            async def slow():
+                await release.wait()
+                finished.append("busy")
+
+            async def fast(chat_id):
+                finished.append(chat_id)
+
+            busy = [
+                asyncio.create_task(processor.process_update(make_update(chat_id=1), slow()))
+                for _ in range(3)
+            ]
+            await asyncio.sleep(0)
+            await asyncio.wait_for(asyncio.gather(*(
+                processor.process_update(make_update(chat_id=chat_id), fast(chat_id)) for chat_id in (2, 3)
+            )), timeout=1)
+            release.set()
+            await asyncio.gather(*busy)
+            return finished
+
+        finished = asyncio.run(scenario())
+        assert finished[:2] == [2, 3]
+        assert finished[2:] == ["busy"] * 3
+
+
+    def test_submit_preserves_order_within_chat(self):
+        """Тест: submit() возвращается сразу, порядок внутри чата сохраняется"""
+        async def scenario():
+            processor = ChatOrderedUpdateProcessor(max_concurrent_chats=4)
+            done = []
+
+            async def handle(index):
+                await asyncio.sleep(0.01 * (5 - index))
+                done.append(index)
+
+            for index in range(5):
+                await processor.submit(make_update(chat_id=1), handle(index))
+            submitted = list(done)
+            await processor.join(timeout=1)
+            return submitted, done, processor.stats()
+
+        submitted, done, stats = asyncio.run(scenario())
+        assert submitted == []
+        assert done == [0, 1, 2, 3, 4]
+        assert stats["pending_updates"] == 0 and stats["submitted_in_flight"] == 0
+
+    def test_chat_flood_does_not_hold_queue_workers(self):
+        """Тест: поток обновлений одного чата не занимает воркеров очереди webhook"""
+        async def scenario():
+            processor = ChatOrderedUpdateProcessor(max_concurrent_chats=4)
+            release = asyncio.Event()
+            finished = []
+
+            async def handle(update):
+                if update.effective_chat.id == 1:
+                    await release.wait()
+                finished.append(update.effective_chat.id)
+
+            queue = UpdateQueue(lambda update: processor.submit(update, handle(update)), workers=4)
+            await queue.start()
+            # Обновлений занятого чата больше, чем воркеров
+            for _ in range(20):
+                queue.put_nowait(make_update(chat_id=1))
+            queue.put_nowait(make_update(chat_id=2))
+            for _ in range(100):
+                if 2 in finished:
+                    break
+                await asyncio.sleep(0.01)
+            other_chat_done = 2 in finished
+            release.set()
+            await queue.stop(drain=True, timeout=1)
+            await processor.join(timeout=1)
+            return other_chat_done, finished
+
+        other_chat_done, finished = asyncio.run(scenario())
+        assert other_chat_done
+        assert finished[0] == 2
+        assert finished.count(1) == 20
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,136 @@
+"""
+Тесты для очереди обновлений webhook
+"""
+import pytest
+import sys
+import os
+import asyncio
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.update_queue import UpdateQueue
+
+
+class TestUpdateQueue:
+    """Тесты для UpdateQueue"""
+
+    def test_put_returns_before_processing(self):
+        """Тест: постановка в очередь не ждёт обработчик"""
+        async def scenario():
+            release = asyncio.Event()
+            processed = []
+
+            async def handler(update):
+                await release.wait()
+                processed.append(update)
+
+            queue = UpdateQueue(handler, maxsize=10, workers=2)
+            await queue.start()
+            assert queue.put_nowait(1) is True
+            assert processed == []
+            release.set()
+            await queue.stop(drain=True)
+            return processed, queue.stats()
+
+        processed, stats = asyncio.run(scenario())
+        assert processed == [1]
+        assert stats["processed"] == 1
+        assert stats["running"] is False
+
+    def test_rejects_when_full(self):
+        """Тест: переполненная очередь отказывает и считает отказы"""
+        async def scenario():
+            release = asyncio.Event()
+
+            async def handler(update):
+                await release.wait()
+
+            queue = UpdateQueue(handler, maxsize=2, workers=1)
+            await queue.start()
+            results = [queue.put_nowait(i) for i in range(2)]
+            await asyncio.sleep(0)  # воркер забирает первое обновление
+            results += [queue.put_nowait(i) for i in range(2, 5)]
+            release.set()
+            await queue.stop(drain=True)
+            return results, queue.stats()
+
+        results, stats = asyncio.run(scenario())
+        assert results == [True, True, True, False, False]
+        assert stats["rejected"] == 2
+        assert stats["processed"] == 3
+        assert stats["max_depth"] == 2
+
+    def test_workers_run_in_parallel(self):
+        """Тест: медленные обработчики выполняются параллельно"""
+        async def scenario():
+            active = 0
+            peak = 0
+
+            async def handler(update):
+                nonlocal active, peak
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+            queue = UpdateQueue(handler, maxsize=100, workers=4)
+            await queue.start()
+            for i in range(20):
+                queue.put_nowait(i)
+            await queue.stop(drain=True)
+            return peak
+
+        assert asyncio.run(scenario()) == 4
+
+    def test_handler_errors_are_counted(self):
+        """Тест: ошибка обработчика не останавливает воркер"""
+        async def scenario():
+            async def handler(update):
+                if update == "bad":
+                    raise ValueError("boom")
+
+            queue = UpdateQueue(handler, maxsize=10, workers=1)
+            await queue.start()
+            for update in ("bad", "good", "good"):
+                queue.put_nowait(update)
+            await queue.stop(drain=True)
+            return queue.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["failed"] == 1
+        assert stats["processed"] == 2
+
+    def test_stopped_queue_rejects(self):
+        """Тест: остановленная очередь не принимает обновления"""
+        async def scenario():
+            async def handler(update):
+                pass
+
+            queue = UpdateQueue(handler, maxsize=10, workers=1)
+            before_start = queue.put_nowait(1)
+            await queue.start()
+            await queue.stop()
+            return before_start, queue.put_nowait(2)
+
+        assert asyncio.run(scenario()) == (False, False)
+
+    def test_drain_timeout(self):
+        """Тест: при истечении таймаута остановка не зависает"""
+        async def scenario():
+            async def handler(update):
+                await asyncio.sleep(10)
+
+            queue = UpdateQueue(handler, maxsize=10, workers=1)
+            await queue.start()
+            queue.put_nowait(1)
+            queue.put_nowait(2)
+            await queue.stop(drain=True, timeout=0.05)
+            return queue.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["processed"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -43,6 +43,14 @@ class TestUsernameSupport:
                 )
             """)
             conn.execute("CREATE INDEX ix_user_ratings_telegram_username ON user_ratings (telegram_username)")
+            conn.execute("""
+                CREATE TABLE rating_history (
+                    telegram_id INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    rating_centi INTEGER NOT NULL,
+                    PRIMARY KEY (telegram_id, ts)
+                ) WITHOUT ROWID
+            """)
             conn.commit()
         finally:
             conn.close()
@@ -0,0 +1,137 @@
+"""
+Тесты для буфера отложенной записи
+"""
+import pytest
+import sys
+import os
+import asyncio
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.write_behind import WriteBehindBuffer
+
+
+class TestWriteBehindBuffer:
+    """Тесты для WriteBehindBuffer"""
+
+    def setup_method(self):
+        self.batches = []
+
+    async def record(self, items):
+        self.batches.append(dict(items))
+
+    def test_coalesces_by_key(self):
+        """Тест: по ключу записывается только последнее значение"""
+        async def scenario():
+            buffer = WriteBehindBuffer(self.record, interval=60, batch_size=100)
+            buffer.put("a", 1)
+            buffer.put("a", 2)
+            buffer.put("b", 3)
+            await buffer.close()
+            return buffer.stats()
+
+        stats = asyncio.run(scenario())
+        assert self.batches == [{"a": 2, "b": 3}]
+        assert stats["coalesced"] == 1 and stats["flushes"] == 1 and stats["pending"] == 0
+
+    def test_flush_by_interval(self):
+        """Тест: сброс по таймеру"""
+        async def scenario():
+            buffer = WriteBehindBuffer(self.record, interval=0.01, batch_size=100)
+            buffer.put("a", 1)
+            await asyncio.sleep(0.05)
+            return buffer.stats()
+
+        stats = asyncio.run(scenario())
+        assert self.batches == [{"a": 1}]
+        assert stats["pending"] == 0
+
+    def test_flush_by_batch_size(self):
+        """Тест: сброс при наборе пачки, не дожидаясь таймера"""
+        async def scenario():
+            buffer = WriteBehindBuffer(self.record, interval=60, batch_size=3)
+            for key in range(3):
+                buffer.put(key, key)
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            return buffer.stats()
+
+        stats = asyncio.run(scenario())
+        assert self.batches == [{0: 0, 1: 1, 2: 2}]
+        assert stats["flushes"] == 1
+
+    def test_failed_flush_keeps_items(self):
+        """Тест: при ошибке записи изменения остаются в очереди"""
+        calls = []
+
+        async def failing(items):
+            calls.append(dict(items))
+            if len(calls) == 1:
+                raise RuntimeError("database is locked")
+
+        async def scenario():
+            buffer = WriteBehindBuffer(failing, interval=60, batch_size=100)
+            buffer.put("a", 1)
+            await buffer.flush()
+            buffer.put("a", 2)
+            await buffer.flush()
+            return buffer.stats()
+
+        stats = asyncio.run(scenario())
+        assert calls == [{"a": 1}, {"a": 2}]
+        assert stats["errors"] == 1 and stats["pending"] == 0
+
+
+    def test_flush_is_not_interrupted_under_load(self):
+        """Тест: при постоянном потоке записей идущий сброс не прерывается, а пачки доходят до базы"""
+        cancelled = []
+
+        async def slow(items):
+            try:
+                await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                cancelled.append(len(items))
+                raise
+            self.batches.append(dict(items))
+
+        async def scenario():
+            buffer = WriteBehindBuffer(slow, interval=60, batch_size=10)
+            max_pending = 0
+            for step in range(50):
+                for index in range(10):
+                    buffer.put((step, index), step)
+                max_pending = max(max_pending, buffer.stats()["pending"])
+                await asyncio.sleep(0.01)
+            written_under_load = sum(len(batch) for batch in self.batches)
+            await buffer.close()
+            return written_under_load, max_pending, buffer.stats()
+
+        written_under_load, max_pending, stats = asyncio.run(scenario())
+        assert cancelled == []
+        assert written_under_load >= 300
+        assert max_pending <= 60
+        assert stats["flushed"] == 500 and stats["pending"] == 0
+        assert sum(len(batch) for batch in self.batches) == 500
+
+    def test_close_waits_for_running_flush(self):
+        """Тест: close() дожидается идущего сброса, а не отменяет его"""
+        async def slow(items):
+            await asyncio.sleep(0.02)
+            self.batches.append(dict(items))
+
+        async def scenario():
+            buffer = WriteBehindBuffer(slow, interval=60, batch_size=2)
+            buffer.put("a", 1)
+            buffer.put("b", 2)
+            await asyncio.sleep(0)
+            buffer.put("c", 3)
+            await buffer.close()
+            return buffer.stats()
+
+        stats = asyncio.run(scenario())
+        assert self.batches == [{"a": 1, "b": 2}, {"c": 3}]
+        assert stats["pending"] == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])